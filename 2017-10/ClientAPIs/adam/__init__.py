@@ -4,10 +4,17 @@
 
 from adam.auth import Auth
 from adam.batch import Batch
+from adam.batch import BatchSet
 from adam.batch import PropagationParams
 from adam.batch import OpmParams
 from adam.batch import Batches
+from adam.opm_template import OpmTemplate
 from adam.batch_run_manager import BatchRunManager
+from adam.polling_scheduler import PollingScheduler
+from adam.ephemeris import EphemerisInterpolator
+from adam.trajectory_archive import TrajectoryArchive
+from adam.trajectory_archive import TrajectoryArchiveWriter
+from adam.result_cache import ResultCache
 from adam.group import Groups
 from adam.permission import Permission
 from adam.permission import Permissions
@@ -16,4 +23,17 @@ from adam.service import Service
 from adam.rest_proxy import RestRequests
 from adam.rest_proxy import AuthorizingRestProxy
 from adam.rest_proxy import LoggingRestProxy
+from adam.reauthorizing_rest_proxy import ReauthorizingRestProxy
+from adam.governing_rest_proxy import ConcurrencyGovernor
+from adam.governing_rest_proxy import GoverningRestProxy
+from adam.metrics_rest_proxy import MetricsRestProxy
+from adam.coalescing_rest_proxy import CoalescingRestProxy
+from adam.caching_rest_proxy import CachingRestProxy
+from adam.hedging_rest_proxy import HedgingRestProxy
+from adam.recording_rest_proxy import RecordingRestProxy
+from adam.recording_rest_proxy import ReplayRestProxy
+from adam.async_rest_proxy import AsyncRestRequests
+from adam.async_rest_proxy import AsyncAuthorizingRestProxy
+from adam.async_rest_proxy import AsyncLoggingRestProxy
+from adam.async_batch import AsyncBatches
 from adam.stm_propagation_module import StmPropagationModule
@@ -0,0 +1,112 @@
+"""
+    async_batch.py
+
+    Coroutine version of the Batches module. Since one event loop can keep many
+    requests in flight at once, e.g. every part of every batch in a run can be fetched
+    concurrently without a thread per request.
+"""
+
+from adam.batch import PropagationResults
+from adam.batch import StateSummary
+from adam.batch import _build_batch_creation_data
+
+import asyncio
+
+class AsyncBatches(object):
+    def __init__(self, rest):
+        """Expects an AsyncRestProxy that it will use to communicate with the server.
+
+        """
+        self._rest = rest
+
+    def __repr__(self):
+        return "Async batches module"
+
+    async def new_batch(self, propagation_params, opm_params):
+        data = _build_batch_creation_data(propagation_params, opm_params)
+
+        code, response = await self._rest.post('/batch', data)
+
+        if code != 200:
+            raise RuntimeError("Server status code: %s; Response: %s" % (code, response))
+
+        return StateSummary(response)
+
+    async def new_batches(self, param_pairs):
+        """ Expects a list of pairs of [propagation_params, opm_params].
+            Returns a list of batch summaries for the submitted batches in the same order.
+        """
+        batch_dicts = [_build_batch_creation_data(pair[0], pair[1]) for pair in param_pairs]
+
+        code, response = await self._rest.post('/batches', {'requests': batch_dicts})
+
+        if code != 200:
+            raise RuntimeError("Server status code: %s; Response: %s" % (code, response))
+
+        if len(param_pairs) != len(response['requests']):
+            raise RuntimeError("Expected %s results, only got %s" % (len(param_pairs), len(response['requests'])))
+
+        return [StateSummary(r) for r in response['requests']]
+
+    async def delete_batch(self, uuid):
+        code = await self._rest.delete('/batch/' + uuid)
+
+        if code != 204:
+            raise RuntimeError("Server status code: %s" % (code))
+
+    async def get_summary(self, uuid):
+        code, response = await self._rest.get('/batch/' + uuid)
+
+        if code == 404:
+            return None
+        elif code != 200:
+            raise RuntimeError("Server status code: %s; Response: %s" % (code, response))
+
+        return StateSummary(response)
+
+    async def get_summaries(self, project):
+        code, response = await self._rest.get('/batch?project_uuid=' + project)
+
+        if code != 200:
+            raise RuntimeError("Server status code: %s; Response: %s" % (code, response))
+
+        summaries = {}
+        for s in response['items']:
+            summaries[s['uuid']] = StateSummary(s)
+        return summaries
+
+    async def _get_part(self, state_summary, index):
+        # Parts IDs are 1-indexed, not 0-indexed.
+        url = '/batch/' + state_summary.get_uuid() + '/' + str(index + 1)
+        code, part_json = await self._rest.get(url)
+
+        if code == 404:    # Not found
+            return None
+        if code != 200:
+            raise RuntimeError("Server status code: %s" % (code))
+
+        return part_json
+
+    async def get_propagation_results(self, state_summary):
+        """ Returns a PropagationResults object with as many PropagationPart objects as
+            the state summary claims to have parts, or raises an error. All parts are
+            requested concurrently. Note that if state of given summary is not
+            'COMPLETED' or 'FAILED', not all parts are guaranteed to exist or to have
+            an ephemeris.
+        """
+        if state_summary.get_parts_count() < 1:
+            print("Unable to retrieve results for batch with no parts")
+            return None
+
+        parts = await asyncio.gather(*[self._get_part(state_summary, i)
+            for i in range(state_summary.get_parts_count())])
+        return PropagationResults(list(parts))
+
+    async def get_all_propagation_results(self, state_summaries):
+        """ Retrieves the results of many batches at once, with every part of every
+            batch in flight concurrently (up to the connection limit of the underlying
+            rest proxy). Returns a list of PropagationResults in the same order as the
+            given state summaries.
+        """
+        return list(await asyncio.gather(
+            *[self.get_propagation_results(s) for s in state_summaries]))
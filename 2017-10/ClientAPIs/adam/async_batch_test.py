@@ -0,0 +1,64 @@
+from adam.async_batch import AsyncBatches
+from adam.async_rest_proxy import _AsyncRestProxyForTest
+from adam.batch import OpmParams
+from adam.batch import PropagationParams
+from adam.batch import StateSummary
+import asyncio
+import unittest
+
+class AsyncBatchesTest(unittest.TestCase):
+    """Unit tests for async batches module
+
+    """
+
+    def test_new_batches(self):
+        rest = _AsyncRestProxyForTest()
+        batches = AsyncBatches(rest)
+
+        propagation_params = PropagationParams({
+            'start_time': 'start', 'end_time': 'end', 'project_uuid': 'p1'})
+        opm_params = OpmParams({'epoch': 'epoch', 'state_vector': [1, 2, 3, 4, 5, 6]})
+
+        def check_input(data_dict):
+            self.assertEqual(2, len(data_dict['requests']))
+            self.assertEqual('p1', data_dict['requests'][0]['project'])
+            return True
+
+        rest.expect_post('/batches', check_input, 200, {'requests': [
+            {'uuid': 'b1', 'calc_state': 'PENDING'},
+            {'uuid': 'b2', 'calc_state': 'PENDING'}]})
+        summaries = asyncio.run(batches.new_batches(
+            [[propagation_params, opm_params], [propagation_params, opm_params]]))
+        self.assertEqual(['b1', 'b2'], [s.get_uuid() for s in summaries])
+
+        rest.expect_post('/batches', check_input, 503, {})
+        with self.assertRaises(RuntimeError):
+            asyncio.run(batches.new_batches(
+                [[propagation_params, opm_params], [propagation_params, opm_params]]))
+
+    def test_get_summaries(self):
+        rest = _AsyncRestProxyForTest()
+        batches = AsyncBatches(rest)
+
+        rest.expect_get('/batch?project_uuid=p1', 200, {'items': [
+            {'uuid': 'b1', 'calc_state': 'RUNNING'},
+            {'uuid': 'b2', 'calc_state': 'COMPLETED'}]})
+        summaries = asyncio.run(batches.get_summaries('p1'))
+        self.assertEqual('RUNNING', summaries['b1'].get_calc_state())
+        self.assertEqual('COMPLETED', summaries['b2'].get_calc_state())
+
+    def test_get_propagation_results(self):
+        rest = _AsyncRestProxyForTest()
+        batches = AsyncBatches(rest)
+
+        summary = StateSummary({'uuid': 'b1', 'calc_state': 'COMPLETED', 'parts_count': 2})
+        rest.expect_get('/batch/b1/1', 200, {'part_index': 1, 'calc_state': 'COMPLETED'})
+        rest.expect_get('/batch/b1/2', 404, {})
+        results = asyncio.run(batches.get_propagation_results(summary))
+        parts = results.get_parts()
+        self.assertEqual(2, len(parts))
+        self.assertEqual(1, parts[0].get_part_index())
+        self.assertIsNone(parts[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,282 @@
+"""
+    async_rest_proxy.py
+
+    Exposes an asyncio interface for making calls to the REST API. Mirrors the
+    hierarchy in rest_proxy.py, except that every method is a coroutine.
+
+    Implementations:
+        - AsyncRestRequests: makes calls to REST API using aiohttp.
+        - AsyncAuthorizingRestProxy: wraps an AsyncRestProxy and adds the auth token to
+          all calls.
+        - AsyncLoggingRestProxy: wraps an AsyncRestProxy and logs timing and size of
+          all calls.
+        - _AsyncRestProxyForTest: coroutine version of _RestProxyForTest.
+"""
+
+from adam.rest_proxy import RestRequests
+from adam.rest_proxy import _RestProxyForTest
+from adam.rest_proxy import _add_token_to_path
+from adam.rest_proxy import _sizeof_fmt
+
+import contextvars
+import datetime
+import json
+
+# Sizes of the last request and response sent by AsyncRestRequests in each task.
+_transfer_sizes = contextvars.ContextVar('transfer_sizes', default=None)
+
+def get_last_transfer_sizes():
+    """Returns the sizes of the request and response bodies, in bytes as sent over the
+    wire, of the last call that AsyncRestRequests made in the calling task, as
+    rest_proxy.get_last_transfer_sizes() does for threads.
+
+    Returns:
+        Pair of request and response sizes, or None if no AsyncRestRequests call has
+        been made in this task since clear_last_transfer_sizes() was last called.
+    """
+    return _transfer_sizes.get()
+
+def clear_last_transfer_sizes():
+    _transfer_sizes.set(None)
+
+async def _record_transfer_sizes(request_bytes, resp):
+    # The Content-Length header reflects the compressed size if the response was
+    # compressed. Fall back to the decoded size for chunked responses.
+    response_bytes = resp.headers.get('Content-Length')
+    if response_bytes is None:
+        response_bytes = len(await resp.read())
+    _transfer_sizes.set((request_bytes, int(response_bytes)))
+
+class AsyncRestProxy(object):
+    """Interface for accessing the server from an asyncio event loop
+
+    """
+    async def post(self, path, data_dict):
+        """Send POST request to the server
+
+        Args:
+            path (str): the path to send the POST to
+            data_dict (dict): dictionary to be sent in the body of the POST
+
+        Returns:
+            Pair of code and json data (when overriden)
+
+        Raises:
+            NotImplementedError: if this does not get overriden by the derived classes
+        """
+        raise NotImplementedError("Got interface, need implementation")
+
+    async def get(self, path):
+        """Send GET request to the server
+
+        Args:
+            path (str): the path to send the GET request to
+
+        Returns:
+            Pair of code and json data (when overriden)
+
+        Raises:
+            NotImplementedError: if this does not get overriden by the derived classes
+        """
+        raise NotImplementedError("Got interface, need implementation")
+
+    async def delete(self, path):
+        """Send DELETE request to the server
+
+        Args:
+            path (str): the path to send the DELETE request to
+
+        Returns:
+            Http code
+
+        Raises:
+            NotImplementedError: if this does not get overriden by the derived classes
+        """
+        raise NotImplementedError("Got interface, need implementation")
+
+
+class AsyncAuthorizingRestProxy(AsyncRestProxy):
+    """ Async rest proxy implementation that wraps another async rest proxy and adds the
+    authorization token to every method call.
+
+    """
+
+    def __init__(self, rest_proxy, token):
+        self._rest_proxy = rest_proxy
+        self._token = token
+
+    async def post(self, path, data_dict):
+        data_dict['token'] = self._token
+        return await self._rest_proxy.post(path, data_dict)
+
+    async def get(self, path):
+        return await self._rest_proxy.get(_add_token_to_path(path, self._token))
+
+    async def delete(self, path):
+        return await self._rest_proxy.delete(_add_token_to_path(path, self._token))
+
+class AsyncLoggingRestProxy(AsyncRestProxy):
+    """ Async rest proxy implementation that wraps another async rest proxy and adds
+    logging of interesting information such as timing and request size to each call.
+
+    """
+
+    def __init__(self, rest_proxy):
+        self._rest_proxy = rest_proxy
+
+    def _transfer_size_fmt(self, index):
+        # Sizes are only known when an AsyncRestRequests sits underneath this proxy.
+        sizes = get_last_transfer_sizes()
+        if sizes is None:
+            return "unknown"
+        return _sizeof_fmt(sizes[index])
+
+    async def post(self, path, data_dict):
+        clear_last_transfer_sizes()
+        start = datetime.datetime.now()
+        code, response = await self._rest_proxy.post(path, data_dict)
+        end = datetime.datetime.now()
+        # Calls interleave on the event loop, so everything about one call is printed
+        # at once once it finishes.
+        print("--------------------------------------------------------\n"
+              "| Post to " + path + "\n"
+              "|    Request size: " + self._transfer_size_fmt(0) + "\n"
+              "|    Response size: " + self._transfer_size_fmt(1) + "\n"
+              "|    Call duration: " + str(end - start) + "\n"
+              "--------------------------------------------------------")
+        return code, response
+
+    async def get(self, path):
+        clear_last_transfer_sizes()
+        start = datetime.datetime.now()
+        code, response = await self._rest_proxy.get(path)
+        end = datetime.datetime.now()
+        print("--------------------------------------------------------\n"
+              "| Get to " + path + "\n"
+              "|    Response size: " + self._transfer_size_fmt(1) + "\n"
+              "|    Call duration: " + str(end - start) + "\n"
+              "--------------------------------------------------------")
+        return code, response
+
+    async def delete(self, path):
+        start = datetime.datetime.now()
+        code = await self._rest_proxy.delete(path)
+        end = datetime.datetime.now()
+        print("--------------------------------------------------------\n"
+              "| Delete to " + path + "\n"
+              "|    Call duration: " + str(end - start) + "\n"
+              "--------------------------------------------------------")
+        return code
+
+class AsyncRestRequests(AsyncRestProxy):
+    """Implementation using the aiohttp package
+
+    This class is used to send actual requests to the server. aiohttp is only imported
+    once the first request is made, so the rest of the adam package can be used
+    without it installed.
+
+    """
+
+    # Default number of connections to keep open to the server. Far higher than the
+    # thread counts used by BatchRunManager, since connections are cheap for a single
+    # event loop.
+    DEFAULT_POOL_SIZE = 100
+
+    def __init__(self, base_url=RestRequests.DEFAULT_BASE_URL,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        """Initialize with the given base URL. All paths for requests will be appended
+        to this URL.
+
+        Args:
+            base_url (str): URL that all request paths are appended to.
+            pool_size (int): maximum number of simultaneous connections to the server.
+                Requests beyond this wait for a free connection.
+            timeout (float): total number of seconds allowed per request. None means
+                wait forever.
+        """
+        self._base_url = base_url
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        # The session has to be created from inside a running event loop.
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size),
+                timeout=aiohttp.ClientTimeout(total=self._timeout))
+        return self._session
+
+    async def close(self):
+        """Closes all pooled connections. Must be awaited before the event loop
+        that made the requests is closed.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _read_json(self, resp):
+        try:
+            return await resp.json(content_type=None)
+        except ValueError:
+            # TODO(laura): make the rest server return json responses, always
+            print("Received non-JSON response from API: " + str(resp.status) + ", " +
+                  str(await resp.read()))
+            return {}
+
+    async def post(self, path, data_dict):
+        """Send POST request to the server
+
+        Args:
+            path (str): the path to send the POST to
+            data_dict (dict): dictionary to be sent in the body of the POST
+
+        Returns:
+            Pair of code and json data (actual from server)
+        """
+        body = json.dumps(data_dict).encode('utf-8')
+        async with self._get_session().post(self._base_url + path, data=body) as resp:
+            response = await self._read_json(resp)
+            await _record_transfer_sizes(len(body), resp)
+            return resp.status, response
+
+    async def get(self, path):
+        """Send GET request to the server
+
+        Args:
+            path (str): the path to send the GET request to
+
+        Returns:
+            Pair of code and json data
+        """
+        async with self._get_session().get(self._base_url + path) as resp:
+            response = await self._read_json(resp)
+            await _record_transfer_sizes(0, resp)
+            return resp.status, response
+
+    async def delete(self, path):
+        """Send DELETE request to the server
+
+        Args:
+            path (str): the path to send the DELETE request to
+
+        Returns:
+            Http code
+        """
+        async with self._get_session().delete(self._base_url + path) as resp:
+            return resp.status
+
+class _AsyncRestProxyForTest(_RestProxyForTest):
+    """Coroutine version of _RestProxyForTest. Expectations are set up exactly the
+    same way, through expect_post, expect_get and expect_delete.
+
+    """
+    async def post(self, path, data_dict):
+        return _RestProxyForTest.post(self, path, data_dict)
+
+    async def get(self, path):
+        return _RestProxyForTest.get(self, path)
+
+    async def delete(self, path):
+        return _RestProxyForTest.delete(self, path)
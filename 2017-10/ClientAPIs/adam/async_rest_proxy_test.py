@@ -0,0 +1,88 @@
+from adam.async_rest_proxy import AsyncAuthorizingRestProxy
+from adam.async_rest_proxy import AsyncLoggingRestProxy
+from adam.async_rest_proxy import AsyncRestRequests
+from adam.async_rest_proxy import _AsyncRestProxyForTest
+from adam.async_rest_proxy import get_last_transfer_sizes
+from adam.stand_in_server import StandInServer
+import asyncio
+import unittest
+
+class AsyncAuthorizingRestProxyTest(unittest.TestCase):
+    """Unit tests for async authorizing rest proxy.
+
+    """
+
+    def test_post(self):
+        rest = _AsyncRestProxyForTest()
+        auth_rest = AsyncAuthorizingRestProxy(rest, 'my_token')
+
+        def check_input(data_dict):
+            self.assertEqual({'a': 1, 'token': 'my_token'}, data_dict)
+            return True
+
+        rest.expect_post("/test", check_input, 200, {'b': 2})
+        code, response = asyncio.run(auth_rest.post("/test", {'a': 1}))
+        self.assertEqual(code, 200)
+        self.assertEqual(response, {'b': 2})
+
+    def test_get(self):
+        rest = _AsyncRestProxyForTest()
+        auth_rest = AsyncAuthorizingRestProxy(rest, 'my_token')
+
+        rest.expect_get("/test?a=1&b=2&token=my_token", 4123, {'c': 3})
+        code, response = asyncio.run(auth_rest.get("/test?a=1&b=2"))
+        self.assertEqual(code, 4123)
+        self.assertEqual(response, {'c': 3})
+
+    def test_delete(self):
+        rest = _AsyncRestProxyForTest()
+        auth_rest = AsyncAuthorizingRestProxy(rest, 'my_token')
+
+        rest.expect_delete("/test?token=my_token", 204)
+        self.assertEqual(204, asyncio.run(auth_rest.delete("/test")))
+
+class AsyncRestRequestsTest(unittest.TestCase):
+    """Unit tests for async rest requests against a local stand-in server.
+
+    """
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.batch = self.server.add_batch()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_concurrent_gets(self):
+        rest = AsyncRestRequests(self.server.get_url(), pool_size=8)
+
+        async def get_all():
+            responses = await asyncio.gather(
+                *[rest.get('/batch/%s/1' % (self.batch)) for i in range(50)])
+            await rest.close()
+            return responses
+
+        responses = asyncio.run(get_all())
+        self.assertEqual([200] * 50, [r[0] for r in responses])
+        self.assertEqual(self.server.get_request_count(), 50)
+        self.assertLessEqual(self.server.get_connection_count(), 8)
+
+    def test_transfer_sizes(self):
+        rest = AsyncRestRequests(self.server.get_url())
+        logging_rest = AsyncLoggingRestProxy(rest)
+
+        async def get_and_post():
+            await logging_rest.get('/batch/%s/1' % (self.batch))
+            get_sizes = get_last_transfer_sizes()
+            await logging_rest.post('/batch', {'project': 'p1'})
+            post_sizes = get_last_transfer_sizes()
+            await rest.close()
+            return get_sizes, post_sizes
+
+        get_sizes, post_sizes = asyncio.run(get_and_post())
+        self.assertEqual(0, get_sizes[0])
+        self.assertEqual(self.server.get_bytes_received(), post_sizes[0])
+        self.assertEqual(self.server.get_bytes_sent(), get_sizes[1] + post_sizes[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,21 @@
 
 import adam
 
+def is_auth_error(code, response):
+    """Checks whether the given server response is an authentication error.
+    
+    The server communicates authentication errors (e.g. bad or expired tokens) as
+    503s whose error message names the shiro exception that was thrown.
+    
+    Returns:
+        Whether the response reflects an authentication failure.
+    """
+    if code == 200 or not isinstance(response, dict) or \
+            not isinstance(response.get('error'), dict):
+        return False
+    message = str(response['error'].get('message', ''))
+    return message.startswith('org.apache.shiro.authc.')
+
 class Auth(object):
     """Module for generating, validating, and using authentication tokens
 
@@ -78,10 +93,9 @@ class Auth(object):
         if code != 200:
             # Handle 503s, since this is how the server communicates authentication
             # errors.
-            if 'error' in response:
-                if response['error']['message'].startswith('org.apache.shiro.authc.'):
-                    self.__clear_attributes__()
-                    return False
+            if is_auth_error(code, response):
+                self.__clear_attributes__()
+                return False
                     
             raise RuntimeError("Server status code: %s; Response: %s" % (code, response))
         
@@ -1,5 +1,6 @@
 
 from adam import Auth
+from adam.auth import is_auth_error
 from adam.rest_proxy import _RestProxyForTest
 import json
 import unittest
@@ -107,6 +108,17 @@ class AuthTest(unittest.TestCase):
         self.assertEqual(auth.get_user(), 'a@b.com')
         self.assertEqual(auth.get_logged_in(), True)
 
+    def test_is_auth_error(self):
+        self.assertTrue(is_auth_error(503, {'error': {
+            'message': 'org.apache.shiro.authc.ExpiredCredentialsException'}}))
+        self.assertFalse(is_auth_error(503, {'error': {'message': 'Backend error'}}))
+        self.assertFalse(is_auth_error(200, {'error': {
+            'message': 'org.apache.shiro.authc.ExpiredCredentialsException'}}))
+        # Error bodies that don't have the usual shape are not auth errors.
+        self.assertFalse(is_auth_error(503, {'error': 'Service unavailable'}))
+        self.assertFalse(is_auth_error(503, {'error': {'message': None}}))
+        self.assertFalse(is_auth_error(503, 'Service unavailable'))
+
 if __name__ == '__main__':
     unittest.main()
         
\ No newline at end of file
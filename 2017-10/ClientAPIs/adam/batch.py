@@ -2,11 +2,27 @@
     batch.py
 """
 
+from adam.ephemeris import EphemerisInterpolator
+from adam.ephemeris import parse_stk_ephemeris
+from adam.ephemeris import parse_stk_scenario_epoch
+from adam.ephemeris import stitch_ephemerides
+from adam.ephemeris import parse_stk_end_state
+from adam.ephemeris import parse_stk_time_span
+from adam.ephemeris import _parse_time
+from adam.opm_template import OpmTemplate
+from adam.opm_template import _creation_date
+from adam.rest_proxy import JsonArrayStream
 from adam.rest_proxy import RestRequests
+import copy
 from datetime import datetime
+import math
+import numpy as np
+from multiprocessing.dummy import Pool as ThreadPool
 from tabulate import tabulate
     
 class Batch(object):
+    __slots__ = ('_propagation_params', '_opm_params', '_state_summary', '_results')
+    
     def __init__(self, propagation_params, opm_params):
         self._propagation_params = propagation_params
         self._opm_params = opm_params
@@ -165,6 +181,35 @@ class OpmParams(object):
     def set_state_vector(self, state_vector):
         self._state_vector = state_vector
     
+    def get_values(self):
+        """Returns the parameters as a dict, by the names the constructor takes, with
+        defaults filled in. Parameters that have no default and weren't given are None.
+        """
+        return {'epoch': self._epoch,
+                'state_vector': self._state_vector,
+                'originator': self._originator,
+                'object_name': self._object_name,
+                'object_id': self._object_id,
+                'mass': self._mass,
+                'solar_rad_area': self._solar_rad_area,
+                'solar_rad_coeff': self._solar_rad_coeff,
+                'drag_area': self._drag_area,
+                'drag_coeff': self._drag_coeff,
+                'covariance': self._covariance,
+                'perturbation': self._perturbation,
+                'hypercube': self._hypercube}
+    
+    def _copy_with(self, values):
+        """Returns a shallow copy of these parameters with the given ones replaced.
+        
+        Args:
+            values (dict): parameters to replace, by the names the constructor takes.
+        """
+        opm_params = copy.copy(self)
+        for name, value in values.items():
+            setattr(opm_params, '_' + name, value)
+        return opm_params
+    
     def generate_opm(self):
         """Generate an OPM string
 
@@ -226,7 +271,207 @@ class OpmParams(object):
                          ("USER_DEFINED_ADAM_HYPERCUBE = %s\n" % self._hypercube)
             return base_opm + covariance
         
+class BatchSet(object):
+    """A set of batches that share their propagation parameters and all OPM parameters
+    except the state vector and, optionally, a few others.
+    
+    Shared parameters are stored once, and the parameters that vary between batches
+    are stored as numpy arrays, so a run of 100k batches costs a few arrays instead of
+    several Python objects per batch. A BatchSet can be passed to BatchRunManager and
+    Batches.new_batches in place of a list of Batch objects or parameter pairs.
+    Indexing it gives Batch-like members that are created on access and store their
+    state and results back in the set.
+    """
+    
+    # OPM parameters other than the state vector that may vary between batches.
+    VARYING_OPM_PARAMS = {'epoch', 'object_name', 'object_id', 'mass', 'solar_rad_area',
+                          'solar_rad_coeff', 'drag_area', 'drag_coeff'}
+    
+    class Member(object):
+        __slots__ = ('_batch_set', '_index')
+        
+        def __init__(self, batch_set, index):
+            self._batch_set = batch_set
+            self._index = index
+        
+        def __repr__(self):
+            return "Batch %s, %s" % (self.get_uuid(), self.get_calc_state())
+        
+        def get_propagation_params(self):
+            return self._batch_set.get_propagation_params()
+        
+        def get_opm_params(self):
+            return self._batch_set.get_opm_params(self._index)
+        
+        def get_state_summary(self):
+            return self._batch_set._state_summaries[self._index]
+        
+        def set_state_summary(self, state_summary):
+            self._batch_set._state_summaries[self._index] = state_summary
+        
+        def get_results(self):
+            return self._batch_set._results[self._index]
+        
+        def set_results(self, results):
+            self._batch_set._results[self._index] = results
+        
+        def get_uuid(self):
+            state_summary = self.get_state_summary()
+            if state_summary is None: return None
+            return state_summary.get_uuid()
+        
+        def get_calc_state(self):
+            state_summary = self.get_state_summary()
+            if state_summary is None: return None
+            return state_summary.get_calc_state()
+    
+    def __init__(self, propagation_params, opm_params, state_vectors, **columns):
+        """
+        Args:
+            propagation_params (PropagationParams): propagation parameters shared by all
+                batches.
+            opm_params (OpmParams): OPM parameters shared by all batches. Its state
+                vector and any parameters given in columns are ignored.
+            state_vectors (array): N x 6 array of state vectors [rx, ry, rz, vx, vy, vz]
+                [km, km/s], one per batch.
+            columns: arrays of length N of OPM parameters that vary between batches,
+                by the names OpmParams takes. See VARYING_OPM_PARAMS.
+        
+        Raises:
+            KeyError if unsupported parameters are provided in columns
+            ValueError if the arrays are not all of the right shape
+        """
+        extra_params = columns.keys() - self.VARYING_OPM_PARAMS
+        if len(extra_params) > 0:
+            raise KeyError("Unexpected parameters provided: %s" % (extra_params))
+        
+        self._propagation_params = propagation_params
+        self._opm_params = opm_params
+        self._state_vectors = np.asarray(state_vectors, dtype=float)
+        if self._state_vectors.ndim != 2 or self._state_vectors.shape[1] != 6:
+            raise ValueError("Expected N x 6 state vectors, got shape %s" %
+                (self._state_vectors.shape,))
+        
+        self._columns = {}
+        for name, values in columns.items():
+            values = np.asarray(values)
+            if values.shape != (len(self._state_vectors),):
+                raise ValueError("Expected %s values of %s, got shape %s" %
+                    (len(self._state_vectors), name, values.shape))
+            self._columns[name] = values
+        
+        self._opm_template = OpmTemplate(opm_params, ['state_vector'] + list(self._columns))
+        
+        self._state_summaries = [None] * len(self._state_vectors)
+        self._results = [None] * len(self._state_vectors)
+    
+    def __repr__(self):
+        return "Batch set with %s batches" % (len(self))
+    
+    def __len__(self):
+        return len(self._state_vectors)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.Member(self, i) for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Batch set index out of range")
+        return self.Member(self, index)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.Member(self, i)
+    
+    def get_propagation_params(self):
+        return self._propagation_params
+    
+    def _get_opm_values(self, index):
+        values = {'state_vector': self._state_vectors[index].tolist()}
+        for name, column in self._columns.items():
+            values[name] = column[index].item()
+        return values
+    
+    def get_opm_params(self, index):
+        """Builds the OPM parameters of the batch at the given index."""
+        return self._opm_params._copy_with(self._get_opm_values(index))
+    
+    def generate_opm(self, index, creation_date=None):
+        """Generates the OPM of the batch at the given index. Faster than
+        get_opm_params(index).generate_opm(), and gives the same result."""
+        return self._opm_template.generate_opm(self._get_opm_values(index), creation_date)
+    
+    def generate_opms(self, creation_date=None):
+        """Generates the OPMs of all batches in the set in one go."""
+        columns = dict(self._columns)
+        columns['state_vector'] = self._state_vectors
+        return self._opm_template.generate_opms(columns, creation_date)
+    
+    def get_state_vectors(self):
+        return self._state_vectors
+    
+    def subset(self, start, stop):
+        """Returns a BatchSet of the batches from start up to stop. It shares this set's
+        parameter arrays, but not its state or results."""
+        return BatchSet(self._propagation_params, self._opm_params,
+            self._state_vectors[start:stop],
+            **{name: column[start:stop] for name, column in self._columns.items()})
+    
+    def select(self, indices):
+        """Returns a BatchSet of the batches at the given indices, in that order. Unlike
+        subset, it copies the parameters of those batches."""
+        indices = np.asarray(indices, dtype=int)
+        return BatchSet(self._propagation_params, self._opm_params,
+            self._state_vectors[indices],
+            **{name: column[indices] for name, column in self._columns.items()})
+    
+    def get_states_at(self, times, epoch=None, time_scale='UTC', method='hermite'):
+        """Returns an N x m x 6 array of the states of all batches at the given m
+        times [km, km/s], interpolated as by PropagationResults.get_states_at. States of
+        batches without a trajectory, and at times outside a batch's trajectory, are
+        NaN."""
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        states = np.full((len(self), len(times), 6), np.nan)
+        indices = []
+        trajectories = []
+        for i in range(len(self)):
+            results = self._results[i]
+            trajectory = results.get_trajectory(epoch, time_scale) if results else None
+            if trajectory is not None and len(trajectory) > 1:
+                indices.append(i)
+                trajectories.append(trajectory)
+        if len(trajectories) == 0:
+            return states
+        
+        # Batches run with a fixed step all have the same times, and can be
+        # interpolated together.
+        first_times = trajectories[0][:, 0]
+        if all(np.array_equal(first_times, t[:, 0]) for t in trajectories):
+            interpolator = EphemerisInterpolator(np.stack(trajectories), method)
+            states[indices] = interpolator.get_states(times)
+        else:
+            for i, trajectory in zip(indices, trajectories):
+                states[i] = EphemerisInterpolator(trajectory, method).get_states(times)
+        return states
+    
+    def get_end_state_vectors(self):
+        """Returns an N x 6 array of the end state vectors of all batches [km, km/s].
+        Rows of batches without a final state are NaN."""
+        end_state_vectors = np.full((len(self), 6), np.nan)
+        for i in range(len(self)):
+            results = self._results[i]
+            end_state_vector = results.get_end_state_vector() if results else None
+            if end_state_vector is not None:
+                end_state_vectors[i] = end_state_vector
+        return end_state_vectors
+
 class StateSummary(object):
+    # Summaries are created for every batch on every poll of a run's state, so keep
+    # them compact.
+    __slots__ = ('_uuid', '_calc_state', '_step_size', '_create_time', '_execute_time',
+                 '_complete_time', '_project_uuid', '_parts_count')
+    
     def __init__(self, json):
         """ Requires a json response as returned from the server representing a batch
             state summary (e.g. from /batch/uuid or in bulk from batch/project_id)
@@ -273,6 +518,9 @@ class StateSummary(object):
 class PropagationResults(object):
 
     class Part(object):
+        __slots__ = ('_part_index', '_calc_state', '_ephemeris', '_error',
+                     '_ephemeris_array')
+        
         def __init__(self, part):
             """ Requires a json response as returned from the server representing a batch
                 part state (e.g. from /batch/batch_uuid/part_index)
@@ -285,6 +533,7 @@ class PropagationResults(object):
             self._calc_state = part['calc_state']
             self._ephemeris = part.get('stk_ephemeris')
             self._error = part.get('error')
+            self._ephemeris_array = None
     
         def __repr__(self):
             return "PropagationPart [%s]" % (self._calc_state)
@@ -298,9 +547,24 @@ class PropagationResults(object):
         def get_ephemeris(self):
             return self._ephemeris
     
+        def get_ephemeris_array(self):
+            """Returns the states of the ephemeris as an n x 7 array of
+            [t, rx, ry, rz, vx, vy, vz] [s, km, km/s], or None if there is no ephemeris.
+            The ephemeris is parsed on the first call only."""
+            if self._ephemeris_array is None and self._ephemeris is not None:
+                self._ephemeris_array = parse_stk_ephemeris(self._ephemeris)
+            return self._ephemeris_array
+    
+        def get_parsed_ephemeris_array(self):
+            """Returns the states of the ephemeris as get_ephemeris_array() does if they
+            have already been parsed, or None without parsing them otherwise."""
+            return self._ephemeris_array
+    
         def get_error(self):
             return self._error
 
+    __slots__ = ('_parts',)
+    
     M2KM = 1E-3  # meters to kilometers
 
     def __init__(self, parts):
@@ -343,20 +607,98 @@ class PropagationResults(object):
             print("Cannot compute final state vector from part in state %s" % (state))
             return None
         
-        stk_ephemeris = part.get_ephemeris()  # Guaranteed to exist if state == COMPLETED
-    
-        split_ephem = stk_ephemeris.splitlines()
-        state_vectors = []
-        for line in split_ephem:
-            split_line  = line.split()
-            # It's a state if it has more than 7 elements
-            if len(split_line) >= 7:
-                state_vector = [(float(i) * self.M2KM) for i in split_line]
-                # Ignore time
-                state_vectors.append(state_vector[1:7])     
+        # Only the last state is needed, so unless the whole ephemeris has already been
+        # parsed, just read it back from the end.
+        states = part.get_parsed_ephemeris_array()
+        if states is not None:
+            end_state = states[-1] if len(states) > 0 else None
+        else:
+            # Guaranteed to exist if state == COMPLETED
+            end_state = parse_stk_end_state(part.get_ephemeris())
+        if end_state is None:
+            print("Cannot compute final state vector from ephemeris with no states")
+            return None
         
-        # We want the last element
-        return state_vectors[-1]
+        # Ignore time
+        return end_state[1:7].tolist()
+    
+    def get_trajectory(self, epoch=None, time_scale='UTC'):
+        """Get the states of all parts as one trajectory.
+
+        The ephemerides of all parts are parsed and joined in time order. The state at
+        the boundary between two parts is only included once.
+
+        Args:
+            epoch (datetime or str): time the returned times are relative to, in the
+                given time scale, e.g. '2017-10-04T00:00:00Z'. Defaults to the scenario
+                epoch of the first part.
+            time_scale (str): time scale of the returned times and of epoch, one of
+                'UTC', 'TAI', 'TT' or 'GPS'.
+
+        Returns:
+            trajectory (numpy.ndarray) - n x 7 array of [t, rx, ry, rz, vx, vy, vz]
+                                         [s, km, km/s], with t in seconds since epoch
+        """
+        for part in self._parts:
+            if part is None:
+                print("Cannot compute trajectory with missing parts")
+                return None
+            if part.get_calc_state() != 'COMPLETED':
+                print("Cannot compute trajectory from part in state %s" % (
+                    part.get_calc_state()))
+                return None
+        
+        return stitch_ephemerides(
+            [(part.get_ephemeris_array(), parse_stk_scenario_epoch(part.get_ephemeris()))
+             for part in self._parts], epoch, time_scale)
+    
+    def get_states_at(self, times, epoch=None, time_scale='UTC', method='hermite'):
+        """Get states at arbitrary times by interpolating the trajectory.
+
+        Args:
+            times (array): m times in seconds since epoch.
+            epoch, time_scale: as for get_trajectory.
+            method (str): 'hermite' (cubic, using positions and velocities) or
+                'lagrange' (over 6 states, as STK does).
+
+        Returns:
+            states (numpy.ndarray) - m x 6 array of [rx, ry, rz, vx, vy, vz] [km, km/s],
+                                     NaN at times outside the trajectory
+        """
+        trajectory = self.get_trajectory(epoch, time_scale)
+        if trajectory is None:
+            return None
+        return EphemerisInterpolator(trajectory, method).get_states(times)
+
+# Value of the parts argument of get_propagation_results that retrieves only the last
+# part, which is all that is needed for the end state.
+LAST_PART = 'last'
+
+def _select_parts(parts, parts_count):
+    """Returns the indices of the parts to retrieve, given the parts argument of
+    get_propagation_results."""
+    if parts is None:
+        return list(range(parts_count))
+    if parts == LAST_PART:
+        return [parts_count - 1]
+    indices = sorted(set(range(parts_count)[i] for i in parts))
+    return indices
+
+def _build_batch_creation_data(propagation_params, opm_params):
+    return _build_batch_creation_data_for_opm(propagation_params, opm_params.generate_opm())
+
+def _build_batch_creation_data_for_opm(propagation_params, opm_string):
+    data = {'start_time': propagation_params.get_start_time(),
+            'end_time': propagation_params.get_end_time(),
+            'step_duration_sec': propagation_params.get_step_size(),
+            'propagator_uuid': propagation_params.get_propagator_uuid(),
+            'project': propagation_params.get_project_uuid(),
+            'opm_string': opm_string}
+
+    if propagation_params.get_description() is not None:
+        data['description'] = propagation_params.get_description()
+    
+    return data
 
 class Batches(object):
     def __init__(self, rest):
@@ -366,17 +708,7 @@ class Batches(object):
         return "Batches module"
     
     def _build_batch_creation_data(self, propagation_params, opm_params):
-        data = {'start_time': propagation_params.get_start_time(),
-                'end_time': propagation_params.get_end_time(),
-                'step_duration_sec': propagation_params.get_step_size(),
-                'propagator_uuid': propagation_params.get_propagator_uuid(),
-                'project': propagation_params.get_project_uuid(),
-                'opm_string': opm_params.generate_opm()}
-
-        if propagation_params.get_description() is not None:
-            data['description'] = propagation_params.get_description()
-        
-        return data
+        return _build_batch_creation_data(propagation_params, opm_params)
     
     def new_batch(self, propagation_params, opm_params):
         data = self._build_batch_creation_data(propagation_params, opm_params)
@@ -389,12 +721,24 @@ class Batches(object):
         return StateSummary(response)
     
     def new_batches(self, param_pairs):
-        """ Expects a list of pairs of [propagation_params, opm_params].
+        """ Expects a list of pairs of [propagation_params, opm_params], or a BatchSet.
             Returns a list of batch summaries for the submitted batches in the same order.
+            
+            The creation data for each batch is only built as the request is sent, so
+            the full request is never held in memory at once.
         """
-        batch_dicts = []
-        for pair in param_pairs:
-            batch_dicts.append(self._build_batch_creation_data(pair[0], pair[1]))
+        if isinstance(param_pairs, BatchSet):
+            # OPMs come from the set's compiled template, and all share one creation
+            # date.
+            batch_set = param_pairs
+            creation_date = _creation_date()
+            batch_dicts = JsonArrayStream(range(len(batch_set)),
+                lambda i: _build_batch_creation_data_for_opm(
+                    batch_set.get_propagation_params(),
+                    batch_set.generate_opm(i, creation_date)))
+        else:
+            batch_dicts = JsonArrayStream(param_pairs,
+                lambda pair: self._build_batch_creation_data(pair[0], pair[1]))
         
         code, response = self._rest.post('/batches', {'requests': batch_dicts})
 
@@ -436,9 +780,22 @@ class Batches(object):
         
         return response['items']
     
-    def get_summaries(self, project):
+    def get_summaries(self, project, known_states=None):
+        """ Returns the state summaries of the batches of a project, by uuid.
+        
+            Args:
+                project (str): uuid of the project.
+                known_states (dict): if given, calc states of batches by uuid. Only the
+                    summaries of these batches, and only of those whose state is no
+                    longer the one given, are returned, so that no summaries are built
+                    for the project's other batches or for batches that didn't change.
+        """
         summaries = {} 
         for s in self._get_summaries(project):
+            if known_states is not None:
+                known_state = known_states.get(s['uuid'])
+                if known_state is None or known_state == s['calc_state']:
+                    continue
             summaries[s['uuid']] = StateSummary(s)
         return summaries
     
@@ -459,16 +816,99 @@ class Batches(object):
 
         return part_json
         
-    def get_propagation_results(self, state_summary):
+    # Maximum number of parts of one batch retrieved at once. Kept below
+    # RestRequests.DEFAULT_POOL_SIZE so that every thread can reuse a pooled connection.
+    PART_THREADS = 4
+    
+    def _get_parts(self, state_summary, indices, threads):
+        """Retrieves the given parts, several at a time. Returns them by index."""
+        threads = min(threads, len(indices))
+        if threads <= 1:
+            return {i: self._get_part(state_summary, i) for i in indices}
+        pool = ThreadPool(threads)
+        parts = pool.map(lambda i: self._get_part(state_summary, i), indices)
+        pool.close()
+        pool.join()
+        return dict(zip(indices, parts))
+    
+    def _get_parts_in_window(self, state_summary, start, end, threads):
+        """Retrieves the parts whose states cover any of the given time window. Parts
+        are in time order, so the first of them is found by binary search, and the rest
+        are retrieved a few at a time until one starts after the window."""
+        parts_count = state_summary.get_parts_count()
+        parts = {}
+        
+        def span(i):
+            if i not in parts:
+                parts[i] = self._get_part(state_summary, i)
+            ephemeris = parts[i].get('stk_ephemeris') if parts[i] is not None else None
+            return parse_stk_time_span(ephemeris) if ephemeris is not None else None
+        
+        low, high = 0, parts_count - 1
+        while low < high:
+            middle = (low + high) // 2
+            middle_span = span(middle)
+            if middle_span is None:
+                # Without the times of every part, there's no telling which are needed.
+                parts.update(self._get_parts(state_summary,
+                    [i for i in range(parts_count) if i not in parts], threads))
+                return parts
+            if middle_span[1] < start:
+                low = middle + 1
+            else:
+                high = middle
+        
+        selected = {}
+        for i in range(low, parts_count):
+            part_span = span(i)
+            if part_span is not None and part_span[0] > end:
+                break
+            selected[i] = parts[i]
+            if part_span is not None and part_span[1] > end:
+                break
+            if i + 1 < parts_count and i + 1 not in parts:
+                # Retrieve as many of the next parts at once as the window likely
+                # still needs, going by the length of this one.
+                count = threads
+                if part_span is not None and part_span[1] > part_span[0]:
+                    count = min(count, int(math.ceil(
+                        (end - part_span[1]).total_seconds() /
+                        (part_span[1] - part_span[0]).total_seconds())))
+                following = range(i + 1, min(i + 1 + max(count, 1), parts_count))
+                parts.update(self._get_parts(state_summary,
+                    [j for j in following if j not in parts], threads))
+        return selected
+        
+    def get_propagation_results(self, state_summary, parts=None, time_window=None,
+                                threads=PART_THREADS):
         """ Returns a PropagationResults object with as many PropagationPart objects as 
             the state summary  claims to have parts, or raises an error. Note that if 
             state of given summary is not 'COMPLETED' or 'FAILED', not all parts are 
             guaranteed to exist or to have an ephemeris.
+            
+            Only some of the parts can be retrieved, e.g. just the last part for the
+            end state. Parts that are not retrieved are None.
+            
+            Args:
+                state_summary (StateSummary): summary of the batch.
+                parts: parts to retrieve: None for all of them, LAST_PART for the last
+                    one, or a list of part indices (from 0).
+                time_window (list): if given, [start, end] UTC times (datetime or str,
+                    e.g. '2017-10-04T00:00:00Z'). Only parts with states in that window
+                    are retrieved. Can't be combined with parts.
+                threads (int): maximum number of parts retrieved at once.
         """
-        if state_summary.get_parts_count() < 1:
+        parts_count = state_summary.get_parts_count()
+        if parts_count < 1:
             print("Unable to retrieve results for batch with no parts")
             return None
-            
-        parts = [self._get_part(state_summary, i)
-            for i in range(state_summary.get_parts_count())]
-        return PropagationResults(parts)
\ No newline at end of file
+        
+        if time_window is not None:
+            if parts is not None:
+                raise KeyError("Only one of parts and time_window can be given")
+            retrieved = self._get_parts_in_window(state_summary,
+                _parse_time(time_window[0]), _parse_time(time_window[1]), threads)
+        else:
+            retrieved = self._get_parts(state_summary, _select_parts(parts, parts_count),
+                                        threads)
+        return PropagationResults([retrieved.get(i) for i in range(parts_count)])
\ No newline at end of file
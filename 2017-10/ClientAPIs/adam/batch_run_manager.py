@@ -5,11 +5,16 @@
 import adam
 from adam.timer import Timer
 from adam import Batches
+from adam.batch import BatchSet
+from adam.polling_scheduler import PollingScheduler
+from adam.rest_proxy import RestRequests
+from adam.result_cache import propagation_key
 
 import datetime
 from enum import Enum
-import copy
+import numpy as np
 import threading
+import time
 from multiprocessing.dummy import Pool as ThreadPool
 
     
@@ -17,6 +22,14 @@ class State(Enum):
     INITIALIZED = 1
     SUBMITTED = 2
     COMPLETED = 3
+
+# Batch states, as recorded in BatchRunManager.state_codes by their index here. Batches
+# that have not been submitted yet have NO_STATE.
+BATCH_STATES = ['PENDING', 'RUNNING', 'COMPLETED', 'FAILED']
+NO_STATE = -1
+_STATE_CODES = {s: i for i, s in enumerate(BATCH_STATES)}
+_COMPLETED = _STATE_CODES['COMPLETED']
+_FAILED = _STATE_CODES['FAILED']
         
 class BatchRunManager(object):
     """
@@ -28,24 +41,63 @@ class BatchRunManager(object):
     is calling get_latest_statuses() while a call to run() is ongoing.
     """
     
-    def __init__(self, batches_module, batch_runs, do_timing=True, multi_threaded=True):
+    # Maximum number of threads used to submit batches, and number of threads used to
+    # retrieve results. RestRequests.DEFAULT_POOL_SIZE is sized to cover these so that
+    # every thread can reuse a pooled connection.
+    MAX_SUBMISSION_THREADS = 10
+    RESULTS_THREADS = 5
+    
+    def __init__(self, batches_module, batch_runs, do_timing=True, multi_threaded=True,
+                 max_submission_threads=MAX_SUBMISSION_THREADS,
+                 results_threads=RESULTS_THREADS, result_cache=None,
+                 trajectory_archive=None, results_parts=None, pipelined=False,
+                 polling_scheduler=None, max_connections=RestRequests.DEFAULT_POOL_SIZE):
         """Sets up object that can manage the running and lifetime of the given batches.
         
         Args:
             batches_module (Batches): Object to use to communicate with server.
-            batch_runs (list<Batch2>): Batches to be run/managed.
+            batch_runs (list<Batch2> or BatchSet): Batches to be run/managed.
             do_timing (boolean): If true, timing information will be printed for various
                 parts of batch lifetime (submission, running, results retrieval).
             multi_threaded (boolean): If true, operations that would benefit from
                 multithreading such as submission or results retrieval will be
                 multithreaded. Should generally be left true, but can be set to false if
                 a guaranteed particular ordering is necessary (e.g. for tests).
+            max_submission_threads (int): maximum number of threads to submit with.
+            results_threads (int): number of threads to retrieve results with. When the
+                batches module talks to the server through a GoverningRestProxy, set
+                these thread counts high and let the governor decide how many requests
+                are actually in flight.
+            result_cache (ResultCache): if given, batches whose results are in this
+                cache are not submitted, and are given the cached results instead. The
+                results of the batches that are run are added to it.
+            trajectory_archive (TrajectoryArchiveWriter): if given, the results of
+                every batch are added to this archive as they are retrieved, under the
+                batch's index. Closing it is left to the caller.
+            results_parts: which parts of each batch's results to retrieve, as taken by
+                Batches.get_propagation_results, e.g. LAST_PART when only end states are
+                needed. Defaults to all of them.
+            pipelined (boolean): If true, run() overlaps submission, polling and results
+                retrieval: polling starts as soon as the first chunk of batches is
+                submitted, and the results of each batch are retrieved as soon as it
+                reaches a final state, rather than once every batch has.
+            polling_scheduler (PollingScheduler): decides how long to wait between
+                polls of the batches' states. Defaults to a PollingScheduler with its
+                default intervals.
+            max_connections (int): in pipelined mode, the most threads that talk to the
+                server at once, counting submission, results retrieval and polling.
+                Submission and results threads are cut down as needed to stay within
+                it. Should be at most the connection pool size of the RestRequests in
+                use, and at least 3 so that each of them gets a thread.
         """
         self.batches_module = batches_module
         
         # Store the batch runs and check that they all belong to the same project.
         self.batch_runs = batch_runs
-        projects = set([b.get_propagation_params().get_project_uuid() for b in batch_runs])
+        if isinstance(batch_runs, BatchSet):
+            projects = set([batch_runs.get_propagation_params().get_project_uuid()])
+        else:
+            projects = set([b.get_propagation_params().get_project_uuid() for b in batch_runs])
         if len(projects) != 1:
             print("All batches must belong to the same project to use the batch run manager")
             return
@@ -58,10 +110,32 @@ class BatchRunManager(object):
             self.timer = Timer()
         
         self.multi_threaded = multi_threaded
+        self.max_submission_threads = max_submission_threads
+        self.results_threads = results_threads
+        self.max_connections = max_connections
         
-        # Cache the overall status here. Lock access so that state can be retrieved while
-        # waiting for completion.
-        self.cached_status = self._get_empty_cached_status()
+        self.result_cache = result_cache
+        self.trajectory_archive = trajectory_archive
+        self.results_parts = results_parts
+        self.pipelined = pipelined
+        if polling_scheduler is None:
+            polling_scheduler = PollingScheduler()
+        self.polling_scheduler = polling_scheduler
+        # Indices of the batches that are sent to the server, and cache keys of all
+        # batches when there is a cache or an archive.
+        self.submitted = range(len(batch_runs))
+        self.cache_keys = None
+        
+        # The state of every batch, as a code by position, and the number of batches in
+        # each state, kept up to date as batches change state so that a poll only does
+        # work for the batches that changed. Positions and states of batches by uuid
+        # tell which batches in a poll of the whole project are this run's and have
+        # changed. Lock access so that state can be retrieved while waiting for
+        # completion.
+        self.state_codes = np.full(len(batch_runs), NO_STATE, dtype=np.int8)
+        self.status_counts = [0] * len(BATCH_STATES)
+        self.uuid_index = {}
+        self.known_states = {}
         self.status_lock = threading.Lock()
     
     def __repr__(self):
@@ -79,9 +153,23 @@ class BatchRunManager(object):
             or run() is ongoing.
         """
         self.status_lock.acquire()
-        status = copy.deepcopy(self.cached_status)
+        state_codes = self.state_codes.copy()
         self.status_lock.release()
+        
+        status = self._get_empty_cached_status()
+        for code, calc_state in enumerate(BATCH_STATES):
+            status[calc_state] = [self.batch_runs[i].get_uuid()
+                                  for i in np.flatnonzero(state_codes == code)]
         return status
+    
+    def get_status_counts(self):
+        """ Retrieves the number of batches managed by this object in each state.
+            Safe to call while a call to run() is ongoing.
+        """
+        self.status_lock.acquire()
+        counts = dict(zip(BATCH_STATES, self.status_counts))
+        self.status_lock.release()
+        return counts
 
     def _get_empty_cached_status(self):
         return {
@@ -90,61 +178,147 @@ class BatchRunManager(object):
             'COMPLETED': [],
             'FAILED': []}
             
-    def _update_cached_status(self):
-        status = self._get_empty_cached_status()
-        for b in self.batch_runs:
-            status[b.get_calc_state()].append(b.get_uuid())
-            
+    def _set_state_summaries(self, summaries):
+        """ Gives batches new state summaries, and records their states.
+        
+            Args:
+                summaries (list): (batch index, StateSummary) pairs.
+        """
         self.status_lock.acquire()
-        self.cached_status = status
+        for i, summary in summaries:
+            self.batch_runs[i].set_state_summary(summary)
+            uuid = summary.get_uuid()
+            calc_state = summary.get_calc_state()
+            self.uuid_index[uuid] = i
+            self.known_states[uuid] = calc_state
+            code = _STATE_CODES[calc_state]
+            previous = self.state_codes[i]
+            if code != previous:
+                if previous != NO_STATE:
+                    self.status_counts[previous] -= 1
+                self.status_counts[code] += 1
+                self.state_codes[i] = code
         self.status_lock.release()
     
-    def _submit(self):
-        if self.do_timing:
-            self.timer.start("Submitting %s runs." % (len(self.batch_runs)))
+    def _get_finished_count(self):
+        return self.status_counts[_COMPLETED] + self.status_counts[_FAILED]
+    
+    def _get_unfinished_count(self):
+        """ Number of submitted batches that are not in a final state. """
+        return sum(self.status_counts) - self._get_finished_count()
+    
+    def _poll_states(self):
+        """ Updates the state of the submitted batches from the server.
         
-        if not self.state == State.INITIALIZED:
-            print("Error: runs already submitted, cannot resubmit.")
-            self.timer.stop()
-            return
+            Returns:
+                indices of the batches whose state changed.
+        """
+        summaries_by_uuid = self.batches_module.get_summaries(
+            self.project, known_states=self.known_states)
+        changed = []
+        for uuid, summary in summaries_by_uuid.items():
+            i = self.uuid_index.get(uuid)
+            if i is not None and \
+                    self.state_codes[i] != _STATE_CODES[summary.get_calc_state()]:
+                changed.append((i, summary))
+        self._set_state_summaries(changed)
+        self.polling_scheduler.observe([summary for i, summary in changed])
+        return [i for i, summary in changed]
+    
+    def _get_opm_string(self, i):
+        if isinstance(self.batch_runs, BatchSet):
+            return self.batch_runs.generate_opm(i)
+        return self.batch_runs[i].get_opm_params().generate_opm()
+    
+    def _compute_cache_keys(self):
+        self.cache_keys = [propagation_key(self.batch_runs[i].get_propagation_params(),
+                                           self._get_opm_string(i))
+                           for i in range(len(self.batch_runs))]
+    
+    def _apply_result_cache(self):
+        """ Gives every batch whose results are in the result cache those results, and
+            leaves only the others to be submitted.
+        """
+        submitted = []
+        cached_summaries = []
+        for i, key in enumerate(self.cache_keys):
+            cached = self.result_cache.get(key)
+            if cached is None:
+                submitted.append(i)
+            else:
+                cached_summaries.append((i, cached[0]))
+                self.batch_runs[i].set_results(cached[1])
+        self._set_state_summaries(cached_summaries)
+        self.submitted = submitted
         
-        # Batch runs are most efficient when submitted in a single call because of the
-        # overhead of authorization, connecting to the database, etc. The server takes
-        # ~20 seconds to submit 500 batch runs. We don't want to take more time than that 
-        # because calls time out around 60 seconds.
-        submission_batch_size = 500
+        if self.do_timing:
+            print("%s of %s runs found in result cache." % (
+                len(self.batch_runs) - len(submitted), len(self.batch_runs)))
+    
+    # Batch runs are most efficient when submitted in a single call because of the
+    # overhead of authorization, connecting to the database, etc. The server takes
+    # ~20 seconds to submit 500 batch runs. We don't want to take more time than that 
+    # because calls time out around 60 seconds.
+    SUBMISSION_BATCH_SIZE = 500
+    
+    def _prepare_submission(self):
+        """ Looks up cached results, and returns the chunks of batch indices to submit
+            and the number of threads to submit them with.
+        """
+        if self.result_cache is not None or self.trajectory_archive is not None:
+            self._compute_cache_keys()
+        if self.result_cache is not None:
+            self._apply_result_cache()
+        submitted = self.submitted
         
         # Use as many threads as we have batches to submit, up to an arbitrary maximum
         # of 10, which allows us to submit 5000 batches in parallel.
+        size = self.SUBMISSION_BATCH_SIZE
         if self.multi_threaded:
-            num_batches = round(len(self.batch_runs) / submission_batch_size) + 1
-            threads = min(num_batches, 10)
+            num_batches = round(len(submitted) / size) + 1
+            threads = min(num_batches, self.max_submission_threads)
         else:
             threads = 1
         
-        def _submit_batches(i):
-            # Grab all the creation parameters from the batch objects.
-            runs = self.batch_runs[i:i+submission_batch_size]
+        # Break up the batches into chunks and submit them in chunks. For fewer than
+        # <SUBMISSION_BATCH_SIZE> runs, this just submits them all in one request on one
+        # thread.
+        chunks = [submitted[i:i+size] for i in range(0, len(submitted), size)]
+        return chunks, threads
+    
+    def _submit_chunk(self, indices):
+        # Grab all the creation parameters from the batch objects.
+        if isinstance(self.batch_runs, BatchSet):
+            if isinstance(indices, range):
+                params = self.batch_runs.subset(indices.start, indices.stop)
+            else:
+                params = self.batch_runs.select(indices)
+        else:
+            runs = [self.batch_runs[j] for j in indices]
             params = [[b.get_propagation_params(), b.get_opm_params()] for b in runs]
-            
-            # Call to the server to create the batches.
-            summaries = self.batches_module.new_batches(params)
-            
-            # Update the batches with the resulting state summaries.
-            for summary_i in range(len(summaries)):
-                self.batch_runs[i + summary_i].set_state_summary(summaries[summary_i])
         
+        # Call to the server to create the batches.
+        summaries = self.batches_module.new_batches(params)
+        
+        # Update the batches with the resulting state summaries.
+        self._set_state_summaries(zip(indices, summaries))
+        return indices
+    
+    def _submit(self):
+        if self.do_timing:
+            self.timer.start("Submitting %s runs." % (len(self.batch_runs)))
+        
+        if not self.state == State.INITIALIZED:
+            print("Error: runs already submitted, cannot resubmit.")
+            self.timer.stop()
+            return
+        
+        chunks, threads = self._prepare_submission()
         pool = ThreadPool(threads)
-        # Break up the batches into chunks and submit them in chunks. For fewer than
-        # <submission_batch_size> runs, this just submits them all in one request on one
-        # thread.
-        pool.map(_submit_batches, 
-            [i for i in range(0, len(self.batch_runs), submission_batch_size)])
+        pool.map(self._submit_chunk, chunks)
         pool.close()
         pool.join()
         
-        self._update_cached_status()
-        
         if self.do_timing:
             self.timer.stop()
         
@@ -162,22 +336,14 @@ class BatchRunManager(object):
             # No update is necessary, since nothing changes once the state is COMPLETED.
             return
         
-        # First, update the status of all batches.
-        summaries_by_uuid = self.batches_module.get_summaries(self.project)
-        
-        for batch in self.batch_runs:
-            batch.set_state_summary(summaries_by_uuid[batch.get_uuid()])
+        # First, update the status of all submitted batches. Batches with cached
+        # results are already complete.
+        if len(self.submitted) > 0:
+            self._poll_states()
         
         # Then, if the state of this whole batch should be updated, do that.
-        complete = True
-        for b in self.batch_runs:
-            if not b.get_calc_state() in ['COMPLETED', 'FAILED']:
-                complete = False
-                break
-        if complete:
+        if self._get_finished_count() == len(self.batch_runs):
             self.state = State.COMPLETED
-        
-        self._update_cached_status()
     
     def _wait_for_completion(self):
         """ Waits for the completion of all the batches managed by this object. When this 
@@ -187,34 +353,155 @@ class BatchRunManager(object):
         if self.do_timing:
             self.timer.start("Running.")
             
-        while self.state != State.COMPLETED:
+        while True:
             self._update_state()
+            if self.state == State.COMPLETED:
+                break
+            time.sleep(self.polling_scheduler.get_next_interval())
         
         if self.do_timing:
             self.timer.stop()
     
+    def _get_batch_results(self, i):
+        b = self.batch_runs[i]
+        # Batches are already retrieved results_threads at a time, so the parts of each
+        # are retrieved one after another, keeping to one connection per thread.
+        results = self.batches_module.get_propagation_results(
+            b.get_state_summary(), parts=self.results_parts, threads=1)
+        b.set_results(results)
+        if self.result_cache is not None:
+            self.result_cache.put(self.cache_keys[i], b.get_state_summary(), results)
+        if self.trajectory_archive is not None:
+            self.trajectory_archive.add(i, b.get_state_summary(), results,
+                                        self.cache_keys[i])
+    
+    def _archive_cached_results(self):
+        # Batches with cached results go into the archive too.
+        if self.trajectory_archive is not None and len(self.submitted) < len(self.batch_runs):
+            submitted = set(self.submitted)
+            for i in range(len(self.batch_runs)):
+                if i not in submitted:
+                    b = self.batch_runs[i]
+                    self.trajectory_archive.add(i, b.get_state_summary(), b.get_results(),
+                                                self.cache_keys[i])
+    
+    def _get_results_threads(self):
+        return self.results_threads if self.multi_threaded else 1
+    
     def _get_results(self):
         if self.do_timing:
             self.timer.start("Retrieving propagation results.")
         
-        def _get_results(i):
-            b = self.batch_runs[i]
-            results = self.batches_module.get_propagation_results(b.get_state_summary())
-            b.set_results(results)
+        self._archive_cached_results()
         
-        if self.multi_threaded:
-            threads = 5
-        else:
-            threads = 1
-        pool = ThreadPool(threads)
-        pool.map(_get_results, [i for i in range(len(self.batch_runs))])
+        pool = ThreadPool(self._get_results_threads())
+        pool.map(self._get_batch_results, self.submitted)
         pool.close()
         pool.join()
         
         if self.do_timing:
             self.timer.stop()
+    
+    def _run_pipelined(self):
+        """ Submits the batches, waits for them and retrieves their results all at once.
+            Submission happens on its own threads. This thread polls the batches that
+            have been submitted so far, and hands each batch to a results thread as soon
+            as it reaches a final state.
+        """
+        if self.do_timing:
+            self.timer.start("Running %s runs, pipelined." % (len(self.batch_runs)))
+        
+        if not self.state == State.INITIALIZED:
+            print("Error: runs already submitted, cannot resubmit.")
+            if self.do_timing:
+                self.timer.stop()
+            return
+        
+        chunks, threads = self._prepare_submission()
+        self._archive_cached_results()
+        # Submission, results retrieval and polling all talk to the server at once, so
+        # share out max_connections between them: one for polling, then results
+        # threads, leaving at least one for each, and the rest for submission.
+        results_threads = min(self._get_results_threads(),
+                              max(self.max_connections - 2, 1))
+        threads = min(threads, max(self.max_connections - results_threads - 1, 1))
+        
+        # Indices of the batches in submitted chunks, handed over by submission threads.
+        accepted = []
+        errors = []
+        remaining_chunks = [len(chunks)]
+        condition = threading.Condition()
+        
+        def _on_submitted(indices):
+            with condition:
+                accepted.extend(indices)
+                remaining_chunks[0] -= 1
+                condition.notify()
+        
+        def _on_error(error):
+            with condition:
+                errors.append(error)
+                condition.notify()
+        
+        submission_pool = ThreadPool(threads)
+        results_pool = ThreadPool(results_threads)
+        for chunk in chunks:
+            submission_pool.apply_async(self._submit_chunk, (chunk,),
+                callback=_on_submitted, error_callback=_on_error)
+        submission_pool.close()
+        
+        retrievals = []
+        # Whether each batch has been handed to a results thread. A batch can be seen
+        # to finish by a poll before its chunk is accepted.
+        handed_over = np.zeros(len(self.batch_runs), dtype=bool)
+        
+        def _retrieve_finished(indices):
+            for i in indices:
+                if not handed_over[i] and self.state_codes[i] in (_COMPLETED, _FAILED):
+                    handed_over[i] = True
+                    retrievals.append(
+                        results_pool.apply_async(self._get_batch_results, (i,)))
+        
+        try:
+            while True:
+                with condition:
+                    while not (accepted or errors or remaining_chunks[0] == 0 or
+                               self._get_unfinished_count() > 0):
+                        condition.wait()
+                    if errors:
+                        raise errors[0]
+                    # Batches can already be finished when they are accepted.
+                    newly_accepted = accepted[:]
+                    del accepted[:]
+                    if remaining_chunks[0] == 0:
+                        self.state = State.SUBMITTED
+                _retrieve_finished(newly_accepted)
+                if self._get_unfinished_count() == 0:
+                    if self.state == State.SUBMITTED:
+                        break
+                    continue
+                
+                _retrieve_finished(self._poll_states())
+                if self._get_unfinished_count() > 0:
+                    time.sleep(self.polling_scheduler.get_next_interval())
+        finally:
+            submission_pool.join()
+            results_pool.close()
+            results_pool.join()
+        
+        # Raise any error from retrieving results.
+        for retrieval in retrievals:
+            retrieval.get()
+        
+        self.state = State.COMPLETED
+        
+        if self.do_timing:
+            self.timer.stop()
             
     def run(self):
+        if self.pipelined:
+            self._run_pipelined()
+            return
         self._submit()
         self._wait_for_completion()
         self._get_results()
@@ -1,9 +1,13 @@
 from adam.batch_run_manager import BatchRunManager
+from adam.batch_run_manager import State
 from adam.batch import Batch
 from adam.batch import PropagationParams
 from adam.batch import OpmParams
 from adam.batch import StateSummary
 from adam.batch import PropagationResults
+from adam.batch import Batches
+from adam.polling_scheduler import PollingScheduler
+from adam.rest_proxy import _ConcurrentRestProxyForTest
 
 import unittest
     
@@ -22,7 +26,7 @@ class MockBatches:
     def expect_new_batch(self, batch, response):
         self.expected_new_batch.append([batch, response])
     
-    def get_propagation_results(self, batch):
+    def get_propagation_results(self, batch, parts=None, threads=None):
         if len(self.expected_get_results) == 0:
             raise AssertionError("Did not expect any calls")
             
@@ -33,7 +37,7 @@ class MockBatches:
         
         return expectation[1]
         
-    def get_summaries(self, project):
+    def get_summaries(self, project, known_states=None):
         if len(self.expected_get_summaries) == 0:
             raise AssertionError("Did not expect any calls")
             
@@ -62,6 +66,11 @@ class MockBatches:
         if not len(self.expected_get_summaries) == 0:
             raise AssertionError("Still expecting call to get_batch_states")
 
+def no_wait():
+    """A polling scheduler that polls again straight away, since mocks don't change
+    over time."""
+    return PollingScheduler(min_interval=0, max_interval=0)
+
 def get_dummy_batch(project):
     return Batch(PropagationParams({
         'start_time': 'today',
@@ -91,7 +100,7 @@ class BatchRunnerTest(unittest.TestCase):
         batches.expect_get_summaries("p1", {"b1": completed_state})
         batches.expect_get_results(completed_state, results)
         
-        batch_runner = BatchRunManager(batches, [b1], "p1")
+        batch_runner = BatchRunManager(batches, [b1], "p1", polling_scheduler=no_wait())
         batch_runner.run()
         self.assertEqual(b1.get_state_summary(), completed_state)
         self.assertEqual(b1.get_results(), results)
@@ -105,7 +114,7 @@ class BatchRunnerTest(unittest.TestCase):
         batches.expect_get_summaries("p1", {"b1": completed_state})
         batches.expect_get_results(completed_state, results)
         
-        batch_runner = BatchRunManager(batches, [b1])
+        batch_runner = BatchRunManager(batches, [b1], polling_scheduler=no_wait())
         batch_runner.run()
         self.assertEqual(b1.get_state_summary(), completed_state)
         self.assertEqual(b1.get_results(), results)
@@ -117,7 +126,7 @@ class BatchRunnerTest(unittest.TestCase):
         batches.expect_get_summaries("p1", {"b1": failed_state})
         batches.expect_get_results(failed_state, results)
         
-        batch_runner = BatchRunManager(batches, [b1])
+        batch_runner = BatchRunManager(batches, [b1], polling_scheduler=no_wait())
         batch_runner.run()
         self.assertEqual(b1.get_state_summary(), failed_state)
         self.assertEqual(b1.get_results(), results)
@@ -125,8 +134,127 @@ class BatchRunnerTest(unittest.TestCase):
         batches.clear_expectations()
     
     def test_get_latest_statuses(self):
-        # TODO
-        pass
+        batches = MockBatches()
+        b1 = get_dummy_batch("p1")
+        b2 = get_dummy_batch("p1")
+        batches.expect_new_batch(b1, StateSummary({'uuid': 'b1', 'calc_state': 'PENDING'}))
+        batches.expect_new_batch(b2, StateSummary({'uuid': 'b2', 'calc_state': 'PENDING'}))
+        
+        batch_runner = BatchRunManager(batches, [b1, b2], do_timing=False,
+                                       multi_threaded=False, polling_scheduler=no_wait())
+        self.assertEqual({'PENDING': [], 'RUNNING': [], 'COMPLETED': [], 'FAILED': []},
+                         batch_runner.get_latest_statuses())
+        batch_runner._submit()
+        self.assertEqual(['b1', 'b2'], batch_runner.get_latest_statuses()['PENDING'])
+        
+        # Batches of the project from other runs are ignored.
+        batches.expect_get_summaries("p1", {
+            'b0': StateSummary({'uuid': 'b0', 'calc_state': 'COMPLETED'}),
+            'b1': StateSummary({'uuid': 'b1', 'calc_state': 'RUNNING'}),
+            'b2': StateSummary({'uuid': 'b2', 'calc_state': 'PENDING'})})
+        batch_runner._update_state()
+        statuses = batch_runner.get_latest_statuses()
+        self.assertEqual(['b2'], statuses['PENDING'])
+        self.assertEqual(['b1'], statuses['RUNNING'])
+        self.assertEqual([], statuses['COMPLETED'])
+        self.assertEqual({'PENDING': 1, 'RUNNING': 1, 'COMPLETED': 0, 'FAILED': 0},
+                         batch_runner.get_status_counts())
+        
+        completed = StateSummary({'uuid': 'b1', 'calc_state': 'COMPLETED'})
+        batches.expect_get_summaries("p1", {
+            'b1': completed,
+            'b2': StateSummary({'uuid': 'b2', 'calc_state': 'FAILED'})})
+        batch_runner._update_state()
+        self.assertEqual({'PENDING': [], 'RUNNING': [], 'COMPLETED': ['b1'], 'FAILED': ['b2']},
+                         batch_runner.get_latest_statuses())
+        self.assertEqual({'PENDING': 0, 'RUNNING': 0, 'COMPLETED': 1, 'FAILED': 1},
+                         batch_runner.get_status_counts())
+        self.assertEqual(completed, b1.get_state_summary())
+        self.assertEqual(State.COMPLETED, batch_runner.state)
+        batches.clear_expectations()
+
+class BatchRunnerMultiThreadedTest(unittest.TestCase):
+    """Unit tests for the multi-threaded paths of batch runner.
+
+    """
+
+    def get_batch(self, i):
+        return Batch(PropagationParams({
+            'start_time': 'today',
+            'end_time': 'tomorrow',
+            'project_uuid': 'p1'
+        }), OpmParams({
+            'epoch': 'today',
+            'state_vector': [i, 2, 3, 4, 5, 6]
+        }))
+
+    def test_run(self):
+        rest = _ConcurrentRestProxyForTest(latency=0.002)
+        batch_runs = [self.get_batch(i) for i in range(1200)]
+
+        # Chunks of 500 are submitted on separate threads, in any order. Tell them
+        # apart by the state vector of their first batch.
+        for start in range(0, 1200, 500):
+            rest.expect_post('/batches',
+                lambda data, start=start: '\nX = %s\n' % (start) in data['requests'][0]['opm_string'],
+                200, {'requests': [{'uuid': 'b%s' % (i), 'calc_state': 'PENDING'}
+                    for i in range(start, min(start + 500, 1200))]})
+        rest.expect_get('/batch?project_uuid=p1', 200, {'items': [
+            {'uuid': 'b%s' % (i), 'calc_state': 'COMPLETED', 'parts_count': 1}
+            for i in range(1200)]})
+        rest.expect_get(lambda path: path.startswith('/batch/b') and path.endswith('/1'),
+            200, {'part_index': 1, 'calc_state': 'COMPLETED'}, times=1200)
+
+        batch_runner = BatchRunManager(Batches(rest), batch_runs, do_timing=False,
+                                       polling_scheduler=no_wait())
+        batch_runner.run()
+        rest.clear_expectations()
+
+        self.assertEqual(['b%s' % (i) for i in range(1200)], [b.get_uuid() for b in batch_runs])
+        self.assertEqual(1200, len(batch_runner.get_latest_statuses()['COMPLETED']))
+        for i in [0, 499, 500, 1199]:
+            self.assertEqual(1, rest.get_call_count('GET', '/batch/b%s/1' % (i)))
+            self.assertEqual('COMPLETED', batch_runs[i].get_results().get_parts()[0].get_calc_state())
+        self.assertLess(1, rest.get_max_in_flight())
+        self.assertGreaterEqual(BatchRunManager.RESULTS_THREADS, rest.get_max_in_flight())
+
+    def test_get_results_thread_count(self):
+        rest = _ConcurrentRestProxyForTest(latency=0.01)
+        batch_runs = [self.get_batch(i) for i in range(20)]
+        rest.expect_post('/batches', lambda data: True, 200, {'requests': [
+            {'uuid': 'b%s' % (i), 'calc_state': 'COMPLETED', 'parts_count': 1}
+            for i in range(20)]})
+        rest.expect_get('/batch?project_uuid=p1', 200, {'items': [
+            {'uuid': 'b%s' % (i), 'calc_state': 'COMPLETED', 'parts_count': 1}
+            for i in range(20)]})
+        rest.expect_get(lambda path: path.startswith('/batch/b'), 200,
+            {'part_index': 1, 'calc_state': 'COMPLETED'}, times=None)
+
+        batch_runner = BatchRunManager(Batches(rest), batch_runs, do_timing=False,
+                                       results_threads=2, polling_scheduler=no_wait())
+        batch_runner.run()
+        rest.clear_expectations()
+        self.assertEqual(2, rest.get_max_in_flight())
+        self.assertEqual(22, rest.get_call_count())
+
+    def test_parts_are_retrieved_within_results_threads(self):
+        rest = _ConcurrentRestProxyForTest(latency=0.01)
+        batch_runs = [self.get_batch(i) for i in range(10)]
+        rest.expect_post('/batches', lambda data: True, 200, {'requests': [
+            {'uuid': 'b%s' % (i), 'calc_state': 'COMPLETED', 'parts_count': 4}
+            for i in range(10)]})
+        rest.expect_get('/batch?project_uuid=p1', 200, {'items': [
+            {'uuid': 'b%s' % (i), 'calc_state': 'COMPLETED', 'parts_count': 4}
+            for i in range(10)]})
+        rest.expect_get(lambda path: path.startswith('/batch/b'), 200,
+            {'part_index': 1, 'calc_state': 'COMPLETED'}, times=None)
+
+        batch_runner = BatchRunManager(Batches(rest), batch_runs, do_timing=False,
+                                       results_threads=2, polling_scheduler=no_wait())
+        batch_runner.run()
+        rest.clear_expectations()
+        self.assertEqual(2, rest.get_max_in_flight())
+        self.assertEqual(42, rest.get_call_count())
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,177 @@
+from adam.batch import Batch
+from adam.batch import Batches
+from adam.batch import BatchSet
+from adam.batch import OpmParams
+from adam.batch import PropagationParams
+from adam.batch import PropagationResults
+from adam.batch import StateSummary
+from adam.rest_proxy import _RestProxyForTest
+from adam.stand_in_server import make_stk_ephemeris
+import numpy as np
+import numpy.testing as npt
+import unittest
+
+def get_propagation_params():
+    return PropagationParams({
+        'start_time': 'today',
+        'end_time': 'tomorrow',
+        'project_uuid': 'p1'
+    })
+
+def get_opm_params(x, mass=None):
+    params = {'epoch': 'today', 'state_vector': [float(x), 2.0, 3.0, 4.0, 5.0, 6.0]}
+    if mass is not None:
+        params['mass'] = mass
+    return OpmParams(params)
+
+class BatchSetTest(unittest.TestCase):
+    """Unit tests for batch set.
+
+    """
+
+    def test_members(self):
+        batch_set = BatchSet(get_propagation_params(), get_opm_params(0),
+                             [[i, 2, 3, 4, 5, 6] for i in range(3)], mass=[10, 20, 30])
+        self.assertEqual(3, len(batch_set))
+        self.assertEqual([2.0, 2, 3, 4, 5, 6], batch_set[2].get_opm_params().get_state_vector())
+        self.assertIn('MASS = 20\n', batch_set[1].get_opm_params().generate_opm())
+        self.assertIn('MASS = 30\n', batch_set[-1].get_opm_params().generate_opm())
+        self.assertEqual(2, len(batch_set[1:]))
+        with self.assertRaises(IndexError):
+            batch_set[3]
+
+        # The template is left alone.
+        self.assertIn('MASS = 1000\n', batch_set._opm_params.generate_opm())
+
+        # State is kept by the set, not by the members.
+        batch_set[1].set_state_summary(StateSummary({'uuid': 'b1', 'calc_state': 'PENDING'}))
+        self.assertEqual('b1', batch_set[1].get_uuid())
+        self.assertEqual([None, 'b1', None], [b.get_uuid() for b in batch_set])
+
+    def test_generate_opm(self):
+        batch_set = BatchSet(get_propagation_params(), get_opm_params(0),
+                             [[float(i), 2, 3, 4, 5, 6] for i in range(3)], mass=[10, 20, 30])
+        opms = batch_set.generate_opms(creation_date='then')
+        for i in range(3):
+            self.assertEqual(opms[i], batch_set.generate_opm(i, creation_date='then'))
+            expected = batch_set.get_opm_params(i).generate_opm().split('\n')
+            self.assertEqual(expected[2:], opms[i].split('\n')[2:])
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(KeyError):
+            BatchSet(get_propagation_params(), get_opm_params(0), [[1, 2, 3, 4, 5, 6]],
+                     project_uuid=['p2'])
+        with self.assertRaises(ValueError):
+            BatchSet(get_propagation_params(), get_opm_params(0), [[1, 2, 3]])
+        with self.assertRaises(ValueError):
+            BatchSet(get_propagation_params(), get_opm_params(0), [[1, 2, 3, 4, 5, 6]],
+                     mass=[1, 2])
+
+    def test_new_batches(self):
+        rest = _RestProxyForTest()
+        batches = Batches(rest)
+        batch_set = BatchSet(get_propagation_params(), get_opm_params(0),
+                             [[i, 2, 3, 4, 5, 6] for i in range(4)], mass=[10, 20, 30, 40])
+
+        # Creation data matches that of the equivalent individual batches.
+        expected = [batches._build_batch_creation_data(get_propagation_params(),
+                                                       get_opm_params(i, mass=10 * (i + 1)))
+                    for i in range(1, 3)]
+
+        def check(data):
+            actual = list(data['requests'])
+            for a, e in zip(actual, expected):
+                a['opm_string'] = a['opm_string'].split('\n', 2)[2]
+                e['opm_string'] = e['opm_string'].split('\n', 2)[2]
+            return actual == expected
+
+        rest.expect_post('/batches', check, 200, {'requests': [
+            {'uuid': 'b1', 'calc_state': 'PENDING'},
+            {'uuid': 'b2', 'calc_state': 'PENDING'}]})
+        summaries = batches.new_batches(batch_set.subset(1, 3))
+        self.assertEqual(['b1', 'b2'], [s.get_uuid() for s in summaries])
+
+    def test_end_state_vectors(self):
+        batch_set = BatchSet(get_propagation_params(), get_opm_params(0),
+                             [[i, 2, 3, 4, 5, 6] for i in range(2)])
+        batch_set[0].set_results(PropagationResults([{
+            'part_index': 1, 'calc_state': 'COMPLETED',
+            'stk_ephemeris': '0 1000 2000 3000 4000 5000 6000'}]))
+        end_state_vectors = batch_set.get_end_state_vectors()
+        npt.assert_allclose([1, 2, 3, 4, 5, 6], end_state_vectors[0])
+        self.assertTrue(np.isnan(end_state_vectors[1]).all())
+
+    def test_states_at(self):
+        batch_set = BatchSet(get_propagation_params(), get_opm_params(0),
+                             [[i, 2, 3, 4, 5, 6] for i in range(3)])
+        for i in [0, 2]:
+            batch_set[i].set_results(PropagationResults([{
+                'part_index': 1, 'calc_state': 'COMPLETED',
+                'stk_ephemeris': make_stk_ephemeris(
+                    3, state_vector=[i, 2.0, 3.0, 4.0, 5.0, 6.0])}]))
+        states = batch_set.get_states_at([0, 86400])
+        self.assertEqual((3, 2, 6), states.shape)
+        npt.assert_allclose([[0, 2, 3, 4, 5, 6], [4 * 86400, 2 + 5 * 86400, 3 + 6 * 86400, 4, 5, 6]],
+                            states[0])
+        self.assertTrue(np.isnan(states[1]).all())
+        npt.assert_allclose(2 + 4 * 86400, states[2][1][0])
+
+        # Batches with different times are interpolated one at a time.
+        batch_set[2].set_results(PropagationResults([{
+            'part_index': 1, 'calc_state': 'COMPLETED',
+            'stk_ephemeris': make_stk_ephemeris(
+                5, step_size=43200, state_vector=[2.0, 2.0, 3.0, 4.0, 5.0, 6.0])}]))
+        npt.assert_allclose(states, batch_set.get_states_at([0, 86400]))
+
+class PropagationResultsTest(unittest.TestCase):
+    """Unit tests for propagation results.
+
+    """
+
+    def test_ephemeris_array(self):
+        results = PropagationResults([None, {
+            'part_index': 2, 'calc_state': 'COMPLETED',
+            'stk_ephemeris': make_stk_ephemeris(5, start=86400)}])
+        part = results.get_parts()[1]
+        end_state_vector = results.get_end_state_vector()
+        # Reading the end state doesn't parse the whole ephemeris.
+        self.assertIsNone(part.get_parsed_ephemeris_array())
+
+        states = part.get_ephemeris_array()
+        self.assertEqual((5, 7), states.shape)
+        self.assertIs(states, part.get_ephemeris_array())
+        self.assertIs(states, part.get_parsed_ephemeris_array())
+        self.assertEqual(end_state_vector, states[-1][1:].tolist())
+        self.assertEqual(end_state_vector, results.get_end_state_vector())
+
+    def test_trajectory(self):
+        results = PropagationResults([{
+            'part_index': i + 1, 'calc_state': 'COMPLETED',
+            'stk_ephemeris': make_stk_ephemeris(3, start=2 * 86400 * i)} for i in range(3)])
+        trajectory = results.get_trajectory()
+        npt.assert_array_equal(np.arange(7) * 86400.0, trajectory[:, 0])
+        self.assertEqual(results.get_end_state_vector(), trajectory[-1][1:].tolist())
+
+        results.get_parts()[1]._calc_state = 'RUNNING'
+        self.assertIsNone(results.get_trajectory())
+
+    def test_states_at(self):
+        results = PropagationResults([{
+            'part_index': i + 1, 'calc_state': 'COMPLETED',
+            'stk_ephemeris': make_stk_ephemeris(3, start=2 * 86400 * i,
+                state_vector=[1.0, 2.0, 3.0, 0.5, 0.25, 0.125])} for i in range(2)])
+        states = results.get_states_at([43200, 3 * 86400, 5 * 86400])
+        npt.assert_allclose([1.0 + 0.5 * 43200, 2.0 + 0.25 * 43200, 3.0 + 0.125 * 43200,
+                             0.5, 0.25, 0.125], states[0])
+        npt.assert_allclose(1.0 + 0.5 * 3 * 86400, states[1][0])
+        self.assertTrue(np.isnan(states[2]).all())
+
+    def test_no_end_state_vector(self):
+        self.assertIsNone(PropagationResults([{
+            'part_index': 1, 'calc_state': 'RUNNING'}]).get_end_state_vector())
+        self.assertIsNone(PropagationResults([{
+            'part_index': 1, 'calc_state': 'COMPLETED',
+            'stk_ephemeris': make_stk_ephemeris(0)}]).get_end_state_vector())
+
+if __name__ == '__main__':
+    unittest.main()
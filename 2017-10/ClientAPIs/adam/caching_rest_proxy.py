@@ -0,0 +1,159 @@
+"""
+    caching_rest_proxy.py
+
+    Rest proxy that caches batch part responses once they can no longer change. Once a
+    part is COMPLETED or FAILED, GET /batch/<uuid>/<part> always returns the same
+    thing, so e.g. re-running get_results in a notebook need not download every part
+    again.
+"""
+
+from adam.rest_proxy import RestProxy
+from adam.rest_proxy import _remove_token_from_path
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import threading
+
+# Matches /batch/<uuid>/<part index>, with or without a query string.
+_PART_PATH_PATTERN = re.compile(r'^/batch/[^/?]+/[0-9]+(\?.*)?$')
+
+class CachingRestProxy(RestProxy):
+    """ Rest proxy implementation that wraps another rest proxy and caches responses to
+    GETs of batch parts that are in a final state (COMPLETED or FAILED). Responses are
+    keyed by path with the auth token removed, so they are shared across tokens.
+
+    Cached responses are kept in memory, least recently used first out once their
+    total size exceeds max_bytes. If a directory is given, they are also written
+    there, and responses evicted from memory (or cached by an earlier process) are
+    read back from disk.
+
+    Cached responses are shared between callers, so callers must not modify them.
+    """
+
+    # Default budget for responses held in memory.
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    FINAL_STATES = {'COMPLETED', 'FAILED'}
+
+    def __init__(self, rest_proxy, max_bytes=DEFAULT_MAX_BYTES, directory=None):
+        """
+        Args:
+            rest_proxy (RestProxy): proxy to send requests through.
+            max_bytes (int): approximate number of bytes of responses to keep in memory.
+            directory (str): if given, directory to also keep cached responses in. It
+                is created if it does not exist.
+        """
+        self._rest_proxy = rest_proxy
+        self._max_bytes = max_bytes
+        self._directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        # Maps key to [response, size].
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    def __repr__(self):
+        return "Caching rest proxy [%s responses, %s bytes in memory]" % (
+            len(self._memory), self._memory_bytes)
+
+    def get_stats(self):
+        """Returns a dict with counts of cacheable GETs answered from memory
+        ('memory_hits'), from disk ('disk_hits') or by the server ('misses'), the
+        overall 'hit_rate', and the number and size of responses held in memory.
+        """
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._misses
+            hits = self._memory_hits + self._disk_hits
+            return {'memory_hits': self._memory_hits,
+                    'disk_hits': self._disk_hits,
+                    'misses': self._misses,
+                    'hit_rate': float(hits) / lookups if lookups else 0.0,
+                    'entries': len(self._memory),
+                    'bytes': self._memory_bytes}
+
+    def clear(self):
+        """Empties the in-memory cache. Responses on disk are kept."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def _disk_path(self, key):
+        return os.path.join(self._directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _read_from_disk(self, key):
+        try:
+            with open(self._disk_path(key), 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _write_to_disk(self, key, response):
+        path = self._disk_path(key)
+        # Write to a temporary file first so that a reader never sees half a file.
+        temp_path = '%s.%s.tmp' % (path, threading.get_ident())
+        with open(temp_path, 'w') as f:
+            json.dump(response, f)
+        os.replace(temp_path, path)
+
+    def _estimate_size(self, response):
+        # Part responses are dominated by the ephemeris string, so counting string
+        # lengths is close enough without serializing the response again.
+        size = 0
+        for k, v in response.items():
+            size += len(k) + (len(v) if isinstance(v, str) else 16)
+        return size
+
+    def _add_to_memory(self, key, response, size):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = [response, size]
+            self._memory_bytes += size
+            while self._memory_bytes > self._max_bytes and len(self._memory) > 0:
+                evicted_key, (evicted, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def get(self, path):
+        if not _PART_PATH_PATTERN.match(path):
+            return self._rest_proxy.get(path)
+
+        key = _remove_token_from_path(path)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return 200, entry[0]
+
+        if self._directory is not None:
+            response = self._read_from_disk(key)
+            if response is not None:
+                with self._lock:
+                    self._disk_hits += 1
+                self._add_to_memory(key, response, self._estimate_size(response))
+                return 200, response
+
+        with self._lock:
+            self._misses += 1
+        code, response = self._rest_proxy.get(path)
+        if code == 200 and response.get('calc_state') in self.FINAL_STATES:
+            self._add_to_memory(key, response, self._estimate_size(response))
+            if self._directory is not None:
+                self._write_to_disk(key, response)
+        return code, response
+
+    def post(self, path, data_dict):
+        return self._rest_proxy.post(path, data_dict)
+
+    def delete(self, path):
+        return self._rest_proxy.delete(path)
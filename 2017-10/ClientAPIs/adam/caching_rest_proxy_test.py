@@ -0,0 +1,93 @@
+from adam.caching_rest_proxy import CachingRestProxy
+from adam.rest_proxy import _RestProxyForTest
+import shutil
+import tempfile
+import unittest
+
+def part(index, calc_state, ephemeris=''):
+    return {'part_index': index, 'calc_state': calc_state, 'stk_ephemeris': ephemeris}
+
+class CachingRestProxyTest(unittest.TestCase):
+    """Unit tests for caching rest proxy.
+
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_caches_final_parts(self):
+        rest = _RestProxyForTest()
+        caching = CachingRestProxy(rest)
+
+        rest.expect_get('/batch/b1/1?token=t1', 200, part(1, 'COMPLETED'))
+        self.assertEqual((200, part(1, 'COMPLETED')), caching.get('/batch/b1/1?token=t1'))
+        # Served from cache, even with a different token.
+        self.assertEqual((200, part(1, 'COMPLETED')), caching.get('/batch/b1/1?token=t2'))
+        self.assertEqual((200, part(1, 'COMPLETED')), caching.get('/batch/b1/1'))
+
+        rest.expect_get('/batch/b1/2', 200, part(2, 'FAILED'))
+        caching.get('/batch/b1/2')
+        caching.get('/batch/b1/2')
+
+        stats = caching.get_stats()
+        self.assertEqual(3, stats['memory_hits'])
+        self.assertEqual(2, stats['misses'])
+        self.assertEqual(0.6, stats['hit_rate'])
+
+    def test_does_not_cache_other_responses(self):
+        rest = _RestProxyForTest()
+        caching = CachingRestProxy(rest)
+
+        # Parts that may still change.
+        rest.expect_get('/batch/b1/1', 200, part(1, 'RUNNING'))
+        rest.expect_get('/batch/b1/1', 200, part(1, 'COMPLETED'))
+        self.assertEqual('RUNNING', caching.get('/batch/b1/1')[1]['calc_state'])
+        self.assertEqual('COMPLETED', caching.get('/batch/b1/1')[1]['calc_state'])
+
+        # Errors.
+        rest.expect_get('/batch/b2/1', 404, {})
+        rest.expect_get('/batch/b2/1', 404, {})
+        caching.get('/batch/b2/1')
+        caching.get('/batch/b2/1')
+
+        # Anything but parts.
+        rest.expect_get('/batch/b1', 200, {'uuid': 'b1', 'calc_state': 'COMPLETED'})
+        rest.expect_get('/batch/b1', 200, {'uuid': 'b1', 'calc_state': 'COMPLETED'})
+        caching.get('/batch/b1')
+        caching.get('/batch/b1')
+
+    def test_evicts_least_recently_used(self):
+        rest = _RestProxyForTest()
+        ephemeris = 'x' * 1000
+        caching = CachingRestProxy(rest, max_bytes=2500)
+
+        for i in range(1, 4):
+            rest.expect_get('/batch/b1/%s' % (i), 200, part(i, 'COMPLETED', ephemeris))
+            caching.get('/batch/b1/%s' % (i))
+        # Only the two most recent parts fit.
+        self.assertEqual(2, caching.get_stats()['entries'])
+        caching.get('/batch/b1/3')
+        rest.expect_get('/batch/b1/1', 200, part(1, 'COMPLETED', ephemeris))
+        caching.get('/batch/b1/1')
+
+    def test_disk_cache(self):
+        rest = _RestProxyForTest()
+        caching = CachingRestProxy(rest, directory=self.directory)
+
+        rest.expect_get('/batch/b1/1', 200, part(1, 'COMPLETED', 'ephemeris'))
+        caching.get('/batch/b1/1')
+
+        # A new cache sharing the directory doesn't need the server.
+        caching = CachingRestProxy(rest, directory=self.directory)
+        self.assertEqual((200, part(1, 'COMPLETED', 'ephemeris')),
+                         caching.get('/batch/b1/1?token=t'))
+        caching.get('/batch/b1/1')
+        stats = caching.get_stats()
+        self.assertEqual(1, stats['disk_hits'])
+        self.assertEqual(1, stats['memory_hits'])
+
+if __name__ == '__main__':
+    unittest.main()
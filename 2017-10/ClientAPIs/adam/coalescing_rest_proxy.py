@@ -0,0 +1,132 @@
+"""
+    coalescing_rest_proxy.py
+
+    Rest proxy that makes concurrent identical GETs share a single request to the
+    server. E.g. several BatchRunManagers polling the same project in one process cost
+    one GET /batch?project_uuid=... per poll between them instead of one each.
+"""
+
+from adam.rest_proxy import RestProxy
+
+import threading
+import time
+
+class _Flight(object):
+    def __init__(self, generation):
+        # Number of writes that had returned when the flight began.
+        self.generation = generation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = None
+
+class CoalescingRestProxy(RestProxy):
+    """ Rest proxy implementation that wraps another rest proxy. A GET that arrives
+    while an identical GET is in flight waits for that request and returns its result
+    instead of sending its own. Optionally, a result is also reused for GETs arriving
+    within freshness seconds after it came back.
+
+    Results are shared between callers, so callers must not modify them.
+
+    POSTs and DELETEs are passed straight through. Since they may change what the
+    server would return, once one returns no GET after it shares a request that began
+    before it, and no result of such a request is kept for freshness.
+    """
+
+    def __init__(self, rest_proxy, freshness=0):
+        """
+        Args:
+            rest_proxy (RestProxy): proxy to send requests through.
+            freshness (float): number of seconds a GET result may be reused for after
+                it came back. 0 only shares requests that are in flight.
+        """
+        self._rest_proxy = rest_proxy
+        self._freshness = freshness
+        self._flights = {}
+        # Number of POSTs and DELETEs that have returned.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self._requests = 0
+        self._coalesced = 0
+        self._fresh_hits = 0
+
+    def __repr__(self):
+        return "Coalescing rest proxy [%s in flight]" % (len(self._flights))
+
+    def get_stats(self):
+        """Returns a dict with the number of GETs actually sent to the server
+        ('requests'), the number that waited for an identical GET in flight
+        ('coalesced'), and the number answered by a fresh earlier result
+        ('fresh_hits').
+        """
+        with self._lock:
+            return {'requests': self._requests,
+                    'coalesced': self._coalesced,
+                    'fresh_hits': self._fresh_hits}
+
+    def get(self, path):
+        with self._lock:
+            flight = self._flights.get(path)
+            leader = False
+            if flight is not None and flight.finished is not None and \
+                    time.monotonic() - flight.finished > self._freshness:
+                # Too old to reuse.
+                flight = None
+            if flight is None:
+                if self._freshness > 0 and self._requests % 100 == 0:
+                    self._prune_stale_results()
+                flight = _Flight(self._generation)
+                self._flights[path] = flight
+                self._requests += 1
+                leader = True
+            elif flight.finished is None:
+                self._coalesced += 1
+            else:
+                self._fresh_hits += 1
+
+        if leader:
+            try:
+                flight.result = self._rest_proxy.get(path)
+            except Exception as e:
+                flight.error = e
+            with self._lock:
+                if flight.error is None and self._freshness > 0 and \
+                        flight.generation == self._generation:
+                    flight.finished = time.monotonic()
+                elif self._flights.get(path) is flight:
+                    del self._flights[path]
+            flight.done.set()
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _prune_stale_results(self):
+        # Must be called with the lock held. Keeps results for many different paths
+        # (e.g. part downloads) from piling up.
+        now = time.monotonic()
+        for path in [p for p, f in self._flights.items()
+                     if f.finished is not None and now - f.finished > self._freshness]:
+            del self._flights[path]
+
+    def _detach_flights(self):
+        # Called after a write returns. Flights still in flight finish for the callers
+        # already waiting on them, but later GETs start flights of their own.
+        with self._lock:
+            self._generation += 1
+            self._flights.clear()
+
+    def post(self, path, data_dict):
+        try:
+            return self._rest_proxy.post(path, data_dict)
+        finally:
+            self._detach_flights()
+
+    def delete(self, path):
+        try:
+            return self._rest_proxy.delete(path)
+        finally:
+            self._detach_flights()
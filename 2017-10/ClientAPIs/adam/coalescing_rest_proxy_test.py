@@ -0,0 +1,133 @@
+from adam.coalescing_rest_proxy import CoalescingRestProxy
+from adam.rest_proxy import RestProxy
+from adam.rest_proxy import _RestProxyForTest
+from multiprocessing.dummy import Pool as ThreadPool
+import threading
+import time
+import unittest
+
+class BlockingRestProxy(RestProxy):
+    """Answers every GET with a count of calls so far, once release is set."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def get(self, path):
+        self.calls += 1
+        calls = self.calls
+        self.release.wait()
+        if path == '/error':
+            raise RuntimeError("Failed")
+        return 200, {'path': path, 'calls': calls}
+
+    def post(self, path, data_dict):
+        return 200, {}
+
+class CoalescingRestProxyTest(unittest.TestCase):
+    """Unit tests for coalescing rest proxy.
+
+    """
+
+    def _get_concurrently(self, rest, coalescing, path, num_callers):
+        pool = ThreadPool(num_callers)
+        results = pool.map_async(lambda i: coalescing.get(path), range(num_callers))
+        # Wait until every caller but the one sending the request is waiting on it.
+        while coalescing.get_stats()['coalesced'] < num_callers - 1:
+            time.sleep(0.001)
+        rest.release.set()
+        pool.close()
+        pool.join()
+        return results.get()
+
+    def test_concurrent_gets_share_request(self):
+        rest = BlockingRestProxy()
+        coalescing = CoalescingRestProxy(rest)
+
+        results = self._get_concurrently(rest, coalescing, '/batch?project_uuid=p1', 8)
+        self.assertEqual(1, rest.calls)
+        self.assertEqual([(200, {'path': '/batch?project_uuid=p1', 'calls': 1})] * 8,
+                         results)
+        self.assertEqual({'requests': 1, 'coalesced': 7, 'fresh_hits': 0},
+                         coalescing.get_stats())
+
+        # Without a freshness window, the next GET goes to the server again.
+        coalescing.get('/batch?project_uuid=p1')
+        self.assertEqual(2, rest.calls)
+
+    def test_errors_are_shared(self):
+        rest = BlockingRestProxy()
+        coalescing = CoalescingRestProxy(rest)
+
+        pool = ThreadPool(4)
+        results = [pool.apply_async(coalescing.get, ['/error']) for i in range(4)]
+        while coalescing.get_stats()['coalesced'] < 3:
+            time.sleep(0.001)
+        rest.release.set()
+        pool.close()
+        pool.join()
+        for r in results:
+            with self.assertRaises(RuntimeError):
+                r.get()
+        self.assertEqual(1, rest.calls)
+
+    def test_freshness(self):
+        rest = _RestProxyForTest()
+        coalescing = CoalescingRestProxy(rest, freshness=60)
+
+        rest.expect_get('/batch?project_uuid=p1', 200, {'items': []})
+        coalescing.get('/batch?project_uuid=p1')
+        # Answered from the previous result; no further expectation needed.
+        self.assertEqual((200, {'items': []}), coalescing.get('/batch?project_uuid=p1'))
+        self.assertEqual(1, coalescing.get_stats()['fresh_hits'])
+
+        # Different paths are not shared.
+        rest.expect_get('/batch?project_uuid=p2', 200, {'items': []})
+        coalescing.get('/batch?project_uuid=p2')
+
+        # Writes discard fresh results.
+        rest.expect_delete('/batch/b1', 204)
+        coalescing.delete('/batch/b1')
+        rest.expect_get('/batch?project_uuid=p1', 200, {'items': [{'uuid': 'b2'}]})
+        self.assertEqual((200, {'items': [{'uuid': 'b2'}]}),
+                         coalescing.get('/batch?project_uuid=p1'))
+
+    def test_writes_detach_gets_in_flight(self):
+        rest = BlockingRestProxy()
+        coalescing = CoalescingRestProxy(rest, freshness=60)
+
+        pool = ThreadPool(2)
+        before = pool.apply_async(coalescing.get, ['/batch?project_uuid=p1'])
+        while rest.calls < 1:
+            time.sleep(0.001)
+        coalescing.post('/batch', {})
+        # Issued after the POST returned, so it must not share the GET sent before it.
+        after = pool.apply_async(coalescing.get, ['/batch?project_uuid=p1'])
+        deadline = time.time() + 5
+        while rest.calls < 2 and time.time() < deadline:
+            time.sleep(0.001)
+        rest.release.set()
+        pool.close()
+        pool.join()
+
+        self.assertEqual(1, before.get()[1]['calls'])
+        self.assertEqual(2, after.get()[1]['calls'])
+        self.assertEqual(0, coalescing.get_stats()['coalesced'])
+
+        # Only the result of the GET sent after the POST is kept for freshness.
+        self.assertEqual(2, coalescing.get('/batch?project_uuid=p1')[1]['calls'])
+        self.assertEqual(1, coalescing.get_stats()['fresh_hits'])
+
+    def test_freshness_expires(self):
+        rest = _RestProxyForTest()
+        coalescing = CoalescingRestProxy(rest, freshness=0.01)
+
+        rest.expect_get('/me', 200, {})
+        coalescing.get('/me')
+        time.sleep(0.02)
+        rest.expect_get('/me', 200, {})
+        coalescing.get('/me')
+        self.assertEqual(2, coalescing.get_stats()['requests'])
+
+if __name__ == '__main__':
+    unittest.main()
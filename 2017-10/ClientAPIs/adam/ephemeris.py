@@ -0,0 +1,402 @@
+"""
+    ephemeris.py
+
+    Parsing of the STK ephemerides the server returns for each part of a batch
+    propagation. States are converted in bulk with numpy rather than one field at a
+    time.
+
+    Times in an ephemeris are elapsed seconds since its scenario epoch, which is given
+    in UTC. They can be converted to seconds since another epoch in one of
+    TIME_SCALES, taking leap seconds into account.
+"""
+
+from datetime import datetime
+from datetime import timedelta
+import numpy as np
+
+M2KM = 1E-3  # meters to kilometers
+
+# Columns of a parsed ephemeris: time, then position and velocity.
+COLUMNS = 7
+
+_DATA_START = 'EphemerisTimePosVel'
+_DATA_END = 'END Ephemeris'
+_SCENARIO_EPOCH = 'ScenarioEpoch'
+
+TIME_SCALES = ('UTC', 'TAI', 'TT', 'GPS')
+
+# Offsets of time scales other than UTC from TAI.
+_OFFSETS_FROM_TAI = {'TAI': 0.0, 'TT': 32.184, 'GPS': -19.0}
+
+# Start of each period of a constant TAI - UTC, in UTC, with its TAI - UTC in seconds.
+# Must be extended when a leap second is announced. Times before 1972 are treated as
+# having the first offset.
+LEAP_SECONDS = [
+    (datetime(1972, 1, 1), 10), (datetime(1972, 7, 1), 11), (datetime(1973, 1, 1), 12),
+    (datetime(1974, 1, 1), 13), (datetime(1975, 1, 1), 14), (datetime(1976, 1, 1), 15),
+    (datetime(1977, 1, 1), 16), (datetime(1978, 1, 1), 17), (datetime(1979, 1, 1), 18),
+    (datetime(1980, 1, 1), 19), (datetime(1981, 7, 1), 20), (datetime(1982, 7, 1), 21),
+    (datetime(1983, 7, 1), 22), (datetime(1985, 7, 1), 23), (datetime(1988, 1, 1), 24),
+    (datetime(1990, 1, 1), 25), (datetime(1991, 1, 1), 26), (datetime(1992, 7, 1), 27),
+    (datetime(1993, 7, 1), 28), (datetime(1994, 7, 1), 29), (datetime(1996, 1, 1), 30),
+    (datetime(1997, 7, 1), 31), (datetime(1999, 1, 1), 32), (datetime(2006, 1, 1), 33),
+    (datetime(2009, 1, 1), 34), (datetime(2012, 7, 1), 35), (datetime(2015, 7, 1), 36),
+    (datetime(2017, 1, 1), 37),
+]
+
+# Parts of a stitched trajectory closer together in time than this are the same state.
+_BOUNDARY_TOLERANCE = 1e-6
+
+def _to_km(states):
+    """Converts the position and velocity columns of the given states from m to km in
+    place."""
+    states[..., 1:COLUMNS] *= M2KM
+    return states
+
+def _parse_lines(stk_ephemeris):
+    # Slow path for ephemerides not laid out as expected: every line with at least 7
+    # fields is a state.
+    states = []
+    for line in stk_ephemeris.splitlines():
+        fields = line.split()
+        if len(fields) >= COLUMNS:
+            states.append([float(f) for f in fields[:COLUMNS]])
+    return np.array(states, dtype=float).reshape(-1, COLUMNS)
+
+def parse_stk_ephemeris(stk_ephemeris):
+    """Parses all states of an STK ephemeris.
+
+    Args:
+        stk_ephemeris (str): STK ephemeris, as returned by the server for a part.
+
+    Returns:
+        n x 7 array of [t, rx, ry, rz, vx, vy, vz] [s, km, km/s], one row per state,
+        with t in seconds since the scenario epoch of the ephemeris.
+
+    Raises:
+        ValueError if a state cannot be parsed
+    """
+    start = stk_ephemeris.find(_DATA_START)
+    end = stk_ephemeris.rfind(_DATA_END)
+    if start < 0 or end < start:
+        return _to_km(_parse_lines(stk_ephemeris))
+
+    block = stk_ephemeris[start + len(_DATA_START):end].strip()
+    if len(block) == 0:
+        return np.empty((0, COLUMNS))
+    values = np.fromstring(block, sep=' ')
+    # fromstring stops quietly at anything it can't parse, so check that every line
+    # was read in full.
+    if len(values) != COLUMNS * (block.count('\n') + 1):
+        return _to_km(_parse_lines(block))
+    return _to_km(values.reshape(-1, COLUMNS))
+
+def parse_stk_end_state(stk_ephemeris):
+    """Parses only the last state of an STK ephemeris, reading back from its end so
+    that the rest of the ephemeris is not looked at.
+
+    Args:
+        stk_ephemeris (str): STK ephemeris, as returned by the server for a part.
+
+    Returns:
+        array of [t, rx, ry, rz, vx, vy, vz] [s, km, km/s], or None if the ephemeris
+        has no states.
+
+    Raises:
+        ValueError if the last state cannot be parsed
+    """
+    end = stk_ephemeris.rfind(_DATA_END)
+    if end < 0:
+        end = len(stk_ephemeris)
+    while end > 0:
+        start = stk_ephemeris.rfind('\n', 0, end) + 1
+        fields = stk_ephemeris[start:end].split()
+        if len(fields) >= COLUMNS:
+            return _to_km(np.array(fields[:COLUMNS], dtype=float))
+        end = start - 1
+    return None
+
+def tai_minus_utc(utc):
+    """Returns TAI - UTC in seconds at the given UTC time (datetime)."""
+    offset = LEAP_SECONDS[0][1]
+    for start, leap_offset in LEAP_SECONDS:
+        if utc < start:
+            break
+        offset = leap_offset
+    return offset
+
+def _parse_time(time):
+    if isinstance(time, datetime):
+        return time
+    for format in ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S']:
+        try:
+            return datetime.strptime(time.rstrip('Z'), format)
+        except ValueError:
+            pass
+    raise ValueError("Unable to parse time %s" % (time))
+
+def _to_tai(time, time_scale):
+    """Converts a time (datetime) in the given scale to TAI (datetime)."""
+    if time_scale == 'UTC':
+        return time + timedelta(seconds=tai_minus_utc(time))
+    return time - timedelta(seconds=_OFFSETS_FROM_TAI[time_scale])
+
+def parse_stk_scenario_epoch(stk_ephemeris):
+    """Returns the scenario epoch (datetime, UTC) of an STK ephemeris, or None if it
+    has none. Only the header is looked at."""
+    start = stk_ephemeris.find(_SCENARIO_EPOCH)
+    if start < 0:
+        return None
+    end = stk_ephemeris.find('\n', start)
+    value = stk_ephemeris[start + len(_SCENARIO_EPOCH):end if end >= 0 else None].strip()
+    for format in ['%d %b %Y %H:%M:%S.%f', '%d %b %Y %H:%M:%S']:
+        try:
+            return datetime.strptime(value, format)
+        except ValueError:
+            pass
+    raise ValueError("Unable to parse scenario epoch %s" % (value))
+
+def _utc_after(scenario_epoch, seconds):
+    """Returns the UTC time (datetime) the given number of seconds after the given UTC
+    time, counting leap seconds."""
+    tai = _to_tai(scenario_epoch, 'UTC') + timedelta(seconds=seconds)
+    guess = tai - timedelta(seconds=tai_minus_utc(scenario_epoch))
+    return tai - timedelta(seconds=tai_minus_utc(guess))
+
+def parse_stk_time_span(stk_ephemeris):
+    """Returns the UTC times (datetime) of the first and last states of an STK
+    ephemeris, or None if it has no states or no scenario epoch. Only the header and
+    the first and last states are looked at."""
+    scenario_epoch = parse_stk_scenario_epoch(stk_ephemeris)
+    end_state = parse_stk_end_state(stk_ephemeris)
+    if scenario_epoch is None or end_state is None:
+        return None
+
+    # The first state is the first line with enough fields after the header.
+    start = max(stk_ephemeris.find(_DATA_START), 0)
+    while True:
+        end = stk_ephemeris.find('\n', start)
+        fields = stk_ephemeris[start:end if end >= 0 else None].split()
+        if len(fields) >= COLUMNS:
+            start_time = float(fields[0])
+            break
+        if end < 0:
+            return None
+        start = end + 1
+
+    return (_utc_after(scenario_epoch, start_time),
+            _utc_after(scenario_epoch, end_state[0]))
+
+def stitch_ephemerides(parts, epoch=None, time_scale='UTC'):
+    """Joins the states of consecutive ephemerides into one trajectory.
+
+    Args:
+        parts (list): (states, scenario_epoch) pairs in time order, where states is an
+            n x 7 array as returned by parse_stk_ephemeris and scenario_epoch (datetime)
+            is the UTC time its times are relative to.
+        epoch (datetime or str): time the returned times are relative to, in the given
+            time scale, e.g. '2017-10-04T00:00:00Z'. Defaults to the scenario epoch of
+            the first part.
+        time_scale (str): time scale of the returned times and of epoch, one of
+            TIME_SCALES.
+
+    Returns:
+        m x 7 array of [t, rx, ry, rz, vx, vy, vz] [s, km, km/s], with t in seconds
+        since epoch in the given time scale. States that appear at the end of one part
+        and the start of the next are only included once.
+
+    Raises:
+        KeyError if the time scale is not supported
+        ValueError if a part has no scenario epoch
+    """
+    if time_scale not in TIME_SCALES:
+        raise KeyError("Time scale must be one of %s." % (TIME_SCALES,))
+    if any(scenario_epoch is None for states, scenario_epoch in parts):
+        raise ValueError("Cannot place states of an ephemeris with no scenario epoch")
+    if len(parts) == 0:
+        return np.empty((0, COLUMNS))
+
+    if epoch is None:
+        epoch_tai = _to_tai(parts[0][1], 'UTC')
+    else:
+        epoch_tai = _to_tai(_parse_time(epoch), time_scale)
+
+    # Work in TAI seconds since epoch, which don't skip or repeat around leap seconds,
+    # to line up the parts.
+    stitched = []
+    last_time = -np.inf
+    for states, scenario_epoch in parts:
+        offset = (_to_tai(scenario_epoch, 'UTC') - epoch_tai).total_seconds()
+        new = states[:, 0] + offset > last_time + _BOUNDARY_TOLERANCE
+        # Either way, states is a copy that can be changed from here on.
+        states = states.copy() if new.all() else states[new]
+        if len(states) == 0:
+            continue
+        states[:, 0] += offset
+        stitched.append(states)
+        last_time = states[-1, 0]
+    trajectory = np.concatenate(stitched) if stitched else np.empty((0, COLUMNS))
+
+    if time_scale == 'UTC':
+        # UTC falls behind TAI by a second at every leap second.
+        epoch_offset = tai_minus_utc(_parse_time(epoch)) if epoch is not None \
+            else tai_minus_utc(parts[0][1])
+        leap_times = np.array([(_to_tai(start, 'UTC') - epoch_tai).total_seconds()
+                               for start, offset in LEAP_SECONDS])
+        leap_offsets = np.array([LEAP_SECONDS[0][1]] +
+                                [offset for start, offset in LEAP_SECONDS])
+        offsets = leap_offsets[np.searchsorted(leap_times, trajectory[:, 0], side='right')]
+        trajectory[:, 0] -= offsets - epoch_offset
+    return trajectory
+
+INTERPOLATION_METHODS = ('hermite', 'lagrange')
+
+class EphemerisInterpolator(object):
+    """Evaluates states at arbitrary times from the states of an ephemeris.
+
+    Interpolation is either cubic Hermite between consecutive states, which uses both
+    position and velocity, or Lagrange over a window of consecutive states around each
+    time, as STK does. The times of the states are indexed once, so that finding the
+    states around each query time is a binary search, and all query times are
+    interpolated together.
+
+    Several ephemerides can be interpolated at once if they all have the same times,
+    e.g. those of batches propagated with the same fixed step.
+    """
+
+    def __init__(self, states, method='hermite', samples=6):
+        """
+        Args:
+            states (array): n x 7 array of [t, rx, ry, rz, vx, vy, vz] in increasing
+                order of time, as returned by parse_stk_ephemeris or
+                stitch_ephemerides. Or a b x n x 7 array of b such ephemerides, all with
+                the same times.
+            method (str): 'hermite' or 'lagrange'.
+            samples (int): number of states each Lagrange interpolation uses.
+
+        Raises:
+            KeyError if the method is not supported
+            ValueError if there are too few states, or the ephemerides given don't all
+                have the same times
+        """
+        if method not in INTERPOLATION_METHODS:
+            raise KeyError("Method must be one of %s." % (INTERPOLATION_METHODS,))
+        states = np.asarray(states, dtype=float)
+        self._single = states.ndim == 2
+        if self._single:
+            states = states[np.newaxis]
+        if states.ndim != 3 or states.shape[2] != COLUMNS:
+            raise ValueError("Expected n x 7 or b x n x 7 states, got shape %s" %
+                (states.shape,))
+
+        self._method = method
+        self._times = states[0, :, 0]
+        if len(self._times) < 2:
+            raise ValueError("At least 2 states are needed to interpolate")
+        if not (states[:, :, 0] == self._times).all():
+            raise ValueError("All ephemerides must have the same times")
+
+        self._steps = np.diff(self._times)
+        self._samples = min(samples, len(self._times))
+        self._states = states[:, :, 1:]
+
+    def __repr__(self):
+        return "Ephemeris interpolator [%s, %s states]" % (self._method, len(self._times))
+
+    def get_start_time(self):
+        return self._times[0]
+
+    def get_end_time(self):
+        return self._times[-1]
+
+    def get_states(self, times):
+        """Interpolates states at the given times.
+
+        Args:
+            times (array): m times, in the same terms as the times of the states.
+
+        Returns:
+            m x 6 array of [rx, ry, rz, vx, vy, vz] [km, km/s], or b x m x 6 if several
+            ephemerides were given. States at times outside those of the ephemeris are
+            NaN.
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        # Index of the state at or before each time.
+        indices = np.searchsorted(self._times, times, side='right') - 1
+        indices = np.clip(indices, 0, len(self._times) - 2)
+
+        # Every state is a weighted sum of the states around its time, with weights
+        # that depend only on the time, so they are shared by all ephemerides.
+        if self._method == 'hermite':
+            window, weights = self._hermite_weights(times, indices)
+        else:
+            window, weights = self._lagrange_weights(times, indices)
+
+        # As matrices that take the positions and velocities of the k samples around
+        # each time (2k x 3) to its position and velocity (2 x 3): m x 2 x 2k.
+        k = window.shape[1]
+        weights = weights.reshape(len(times), 2 * k, 2).transpose(0, 2, 1)
+
+        # Ephemerides are interpolated a few at a time, so that intermediate arrays
+        # stay small enough to be cached.
+        count = len(self._states)
+        chunk = max(1, self._CHUNK_VALUES // max(1, len(times) * k))
+        states = np.empty((count, len(times), 6))
+        for start in range(0, count, chunk):
+            samples = self._states[start:start + chunk, window]
+            samples = samples.reshape(samples.shape[:2] + (2 * k, 3))
+            states[start:start + chunk] = np.matmul(weights, samples).reshape(
+                -1, len(times), 6)
+
+        outside = (times < self._times[0]) | (times > self._times[-1])
+        states[:, outside] = np.nan
+        return states[0] if self._single else states
+
+    # Approximate number of sample values interpolated at once.
+    _CHUNK_VALUES = 1 << 16
+
+    def _hermite_weights(self, times, indices):
+        """Returns the indices of the two states around each time (m x 2) and the
+        weights (m x 2 x 2 x 2) that give the position and velocity at each time from
+        the positions and velocities of those states."""
+        h = self._steps[indices]
+        s = (times - self._times[indices]) / h
+        s2 = s * s
+        s3 = s2 * s
+
+        # Cubic Hermite basis functions of the fraction s of the way between the
+        # states, and their derivatives with respect to time.
+        basis = [[2 * s3 - 3 * s2 + 1, (s3 - 2 * s2 + s) * h],
+                 [-2 * s3 + 3 * s2, (s3 - s2) * h]]
+        derivatives = [[(6 * s2 - 6 * s) / h, 3 * s2 - 4 * s + 1],
+                       [(6 * s - 6 * s2) / h, 3 * s2 - 2 * s]]
+
+        weights = np.empty((len(times), 2, 2, 2))
+        for k in range(2):
+            weights[:, k, 0, 0] = basis[k][0]
+            weights[:, k, 1, 0] = basis[k][1]
+            weights[:, k, 0, 1] = derivatives[k][0]
+            weights[:, k, 1, 1] = derivatives[k][1]
+        window = indices[:, np.newaxis] + np.arange(2)
+        return window, weights
+
+    def _lagrange_weights(self, times, indices):
+        """Returns the indices of the samples around each time (m x k) and the weights
+        (m x k x 2 x 2) that give the position and velocity at each time from the
+        positions and velocities of those samples."""
+        # Window of samples around each time, as centered as the ends allow.
+        k = self._samples
+        starts = np.clip(indices - (k - 1) // 2, 0, len(self._times) - k)
+        window = starts[:, np.newaxis] + np.arange(k)
+        window_times = self._times[window]
+
+        # Lagrange basis, m x k. Positions and velocities are interpolated alike.
+        differences = times[:, np.newaxis] - window_times
+        denominators = window_times[:, :, np.newaxis] - window_times[:, np.newaxis, :]
+        numerators = np.broadcast_to(differences[:, np.newaxis, :], denominators.shape)
+        off_diagonal = ~np.eye(k, dtype=bool)
+        basis = np.prod(np.where(off_diagonal, numerators / np.where(
+            off_diagonal, denominators, 1.0), 1.0), axis=2)
+
+        weights = basis[:, :, np.newaxis, np.newaxis] * np.eye(2)
+        return window, weights
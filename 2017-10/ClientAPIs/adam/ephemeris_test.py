@@ -0,0 +1,195 @@
+from adam.ephemeris import EphemerisInterpolator
+from adam.ephemeris import parse_stk_end_state
+from adam.ephemeris import parse_stk_ephemeris
+from adam.ephemeris import parse_stk_scenario_epoch
+from adam.ephemeris import stitch_ephemerides
+from adam.ephemeris import tai_minus_utc
+from adam.stand_in_server import make_stk_ephemeris
+from datetime import datetime
+import numpy as np
+import numpy.testing as npt
+import unittest
+
+def _parse_line_by_line(stk_ephemeris):
+    # How PropagationResults used to parse ephemerides.
+    states = []
+    for line in stk_ephemeris.splitlines():
+        split_line = line.split()
+        if len(split_line) >= 7:
+            state = [float(i) * 1E-3 for i in split_line]
+            states.append([float(split_line[0])] + state[1:7])
+    return states
+
+class EphemerisTest(unittest.TestCase):
+    """Unit tests for ephemeris parsing.
+
+    """
+
+    def test_parse(self):
+        stk_ephemeris = make_stk_ephemeris(50, step_size=3600, start=86400)
+        states = parse_stk_ephemeris(stk_ephemeris)
+        self.assertEqual((50, 7), states.shape)
+        npt.assert_array_equal(_parse_line_by_line(stk_ephemeris), states)
+        self.assertEqual(86400 + 49 * 3600, states[-1][0])
+
+    def test_parse_without_header(self):
+        stk_ephemeris = '\n'.join(['0 1000 2000 3000 4000 5000 6000',
+                                   'comment',
+                                   '',
+                                   '60 1060 2060 3060 4060 5060 6060'])
+        npt.assert_allclose([[0, 1, 2, 3, 4, 5, 6], [60, 1.06, 2.06, 3.06, 4.06, 5.06, 6.06]],
+                            parse_stk_ephemeris(stk_ephemeris))
+
+    def test_parse_irregular_data_block(self):
+        stk_ephemeris = make_stk_ephemeris(3).replace('EphemerisTimePosVel\n',
+                                                       'EphemerisTimePosVel\n\n')
+        npt.assert_array_equal(_parse_line_by_line(stk_ephemeris),
+                               parse_stk_ephemeris(stk_ephemeris))
+
+    def test_parse_empty(self):
+        self.assertEqual((0, 7), parse_stk_ephemeris(make_stk_ephemeris(0)).shape)
+        self.assertIsNone(parse_stk_end_state(make_stk_ephemeris(0)))
+
+    def test_parse_invalid(self):
+        stk_ephemeris = make_stk_ephemeris(3).replace('e+', 'x+', 1)
+        with self.assertRaises(ValueError):
+            parse_stk_ephemeris(stk_ephemeris)
+
+    def test_end_state(self):
+        stk_ephemeris = make_stk_ephemeris(20)
+        npt.assert_array_equal(parse_stk_ephemeris(stk_ephemeris)[-1],
+                               parse_stk_end_state(stk_ephemeris))
+
+        # Trailing lines that are not states are skipped.
+        npt.assert_array_equal(parse_stk_end_state(stk_ephemeris),
+                               parse_stk_end_state(stk_ephemeris + '\n\n'))
+        npt.assert_array_equal([1, 2, 3, 4, 5, 6, 7],
+            parse_stk_end_state('1 2000 3000 4000 5000 6000 7000'))
+
+class StitchEphemeridesTest(unittest.TestCase):
+    """Unit tests for joining ephemerides into trajectories.
+
+    """
+
+    def part(self, num_points, step_size=3600, start=0, epoch=datetime(2017, 10, 4)):
+        stk_ephemeris = make_stk_ephemeris(num_points, step_size, start,
+                                           [1.0, 2.0, 3.0, 0.5, 0.25, 0.125], epoch)
+        return parse_stk_ephemeris(stk_ephemeris), parse_stk_scenario_epoch(stk_ephemeris)
+
+    def test_scenario_epoch(self):
+        self.assertEqual(datetime(2017, 10, 4, 1, 2, 3, 456000),
+            parse_stk_scenario_epoch(make_stk_ephemeris(1, epoch=datetime(
+                2017, 10, 4, 1, 2, 3, 456000))))
+        self.assertIsNone(parse_stk_scenario_epoch('0 1 2 3 4 5 6'))
+
+    def test_tai_minus_utc(self):
+        self.assertEqual(10, tai_minus_utc(datetime(1960, 1, 1)))
+        self.assertEqual(36, tai_minus_utc(datetime(2016, 12, 31, 23, 59, 59)))
+        self.assertEqual(37, tai_minus_utc(datetime(2017, 1, 1)))
+
+    def test_boundary_states_are_not_repeated(self):
+        trajectory = stitch_ephemerides([self.part(5), self.part(5, start=4 * 3600),
+                                         self.part(5, start=8 * 3600)])
+        self.assertEqual((13, 7), trajectory.shape)
+        npt.assert_array_equal(np.arange(13) * 3600.0, trajectory[:, 0])
+        npt.assert_allclose(1.0 + 0.5 * 12 * 3600, trajectory[-1, 1])
+
+    def test_parts_with_different_scenario_epochs(self):
+        trajectory = stitch_ephemerides([
+            self.part(3, step_size=43200),
+            self.part(3, step_size=43200, epoch=datetime(2017, 10, 5))])
+        npt.assert_array_equal([0, 43200, 86400, 129600, 172800], trajectory[:, 0])
+
+    def test_epoch(self):
+        trajectory = stitch_ephemerides([self.part(2)], epoch='2017-10-03T00:00:00Z')
+        npt.assert_array_equal([86400, 90000], trajectory[:, 0])
+
+    def test_time_scales(self):
+        # The scenario starts 12 hours before the leap second at the end of 2016.
+        parts = [self.part(3, step_size=43200, epoch=datetime(2016, 12, 31, 12))]
+
+        npt.assert_array_equal([0, 43200, 86399], stitch_ephemerides(parts)[:, 0])
+        npt.assert_array_equal([0, 43200, 86400],
+                               stitch_ephemerides(parts, time_scale='TAI')[:, 0])
+        npt.assert_array_equal([-43200, 0, 86399 - 43200],
+            stitch_ephemerides(parts, epoch='2017-01-01T00:00:00Z')[:, 0])
+        npt.assert_allclose([-43131.816, 68.184, 43268.184],
+            stitch_ephemerides(parts, epoch='2017-01-01T00:00:00Z', time_scale='TT')[:, 0])
+        with self.assertRaises(KeyError):
+            stitch_ephemerides(parts, time_scale='TDB')
+
+class EphemerisInterpolatorTest(unittest.TestCase):
+    """Unit tests for ephemeris interpolator.
+
+    """
+
+    def states(self, times):
+        # Positions are a quintic in time, so that Lagrange over 6 states is exact.
+        times = np.asarray(times, dtype=float)
+        positions = [times ** 3, times ** 5 / 100, -2 * times]
+        velocities = [3 * times ** 2, times ** 4 / 20, np.full(len(times), -2.0)]
+        return np.column_stack([times] + positions + velocities)
+
+    def test_hermite(self):
+        # Cubic positions are reproduced exactly.
+        times = np.arange(0, 11, 1.0)
+        states = self.states(times)
+        states[:, 2] = times ** 2
+        states[:, 5] = 2 * times
+        query = np.array([0.0, 0.25, 3.5, 9.999, 10.0])
+        expected = self.states(query)[:, 1:]
+        expected[:, 1] = query ** 2
+        expected[:, 4] = 2 * query
+        npt.assert_allclose(expected, EphemerisInterpolator(states).get_states(query),
+                            atol=1e-9)
+
+    def test_lagrange(self):
+        times = np.array([0, 1, 2, 4, 5, 7, 8, 9, 10.5])
+        query = np.linspace(0, 10.5, 40)
+        npt.assert_allclose(self.states(query)[:, 1:], EphemerisInterpolator(
+            self.states(times), method='lagrange').get_states(query), atol=1e-9)
+
+    def test_sine(self):
+        times = np.linspace(0, 10, 201)
+        states = np.column_stack([times, np.sin(times), np.cos(times), times,
+                                  np.cos(times), -np.sin(times), np.ones(len(times))])
+        query = np.random.RandomState(0).uniform(0, 10, 1000)
+        expected = np.column_stack([np.sin(query), np.cos(query), query,
+                                    np.cos(query), -np.sin(query), np.ones(len(query))])
+        for method in ['hermite', 'lagrange']:
+            npt.assert_allclose(expected, EphemerisInterpolator(
+                states, method).get_states(query), atol=1e-5)
+
+    def test_outside(self):
+        interpolator = EphemerisInterpolator(self.states([1, 2, 3]))
+        self.assertEqual(1, interpolator.get_start_time())
+        self.assertEqual(3, interpolator.get_end_time())
+        states = interpolator.get_states([0.5, 2, 3.5])
+        self.assertTrue(np.isnan(states[0]).all())
+        self.assertFalse(np.isnan(states[1]).any())
+        self.assertTrue(np.isnan(states[2]).all())
+
+    def test_many_ephemerides(self):
+        times = np.arange(0, 10, 1.0)
+        first = self.states(times)
+        second = first.copy()
+        second[:, 1:] *= 2
+        query = [0.5, 4.25]
+        for method in ['hermite', 'lagrange']:
+            states = EphemerisInterpolator(np.stack([first, second]), method).get_states(query)
+            self.assertEqual((2, 2, 6), states.shape)
+            npt.assert_allclose(EphemerisInterpolator(first, method).get_states(query),
+                                states[0])
+            npt.assert_allclose(EphemerisInterpolator(second, method).get_states(query),
+                                states[1])
+
+    def test_invalid(self):
+        with self.assertRaises(KeyError):
+            EphemerisInterpolator(self.states([1, 2]), method='spline')
+        with self.assertRaises(ValueError):
+            EphemerisInterpolator(self.states([1]))
+        with self.assertRaises(ValueError):
+            EphemerisInterpolator(np.stack([self.states([1, 2]), self.states([1, 3])]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+"""
+    governing_rest_proxy.py
+
+    Shares a concurrency and rate budget between everything that talks to the server,
+    and adapts that budget to how the server is coping.
+
+    Implementations:
+        - ConcurrencyGovernor: tracks the budget. Adjusts the number of requests allowed
+          in flight with AIMD (additive increase, multiplicative decrease).
+        - GoverningRestProxy: wraps a RestProxy and makes every call go through a
+          governor.
+"""
+
+from adam.auth import is_auth_error
+from adam.rest_proxy import RestProxy
+
+import threading
+import time
+
+class ConcurrencyGovernor(object):
+    """Limits the number of requests in flight (and optionally the rate at which they
+    are started) across all threads that share this object.
+
+    The in-flight limit grows by about one request for every limit's worth of healthy
+    responses, and is cut by backoff_factor as soon as a response signals overload: an
+    overload status code, an exception such as a timeout, or a response slower than
+    target_latency. Only one cut is made per burst of overloaded responses, since all
+    requests that were already in flight when the limit was cut saw the old limit.
+    """
+
+    # Status codes that indicate the server would like fewer requests.
+    OVERLOAD_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, initial_limit=5, min_limit=1, max_limit=50, max_rate=None,
+                 target_latency=30.0, backoff_factor=0.5):
+        """Creates a governor.
+
+        Args:
+            initial_limit (int): number of requests allowed in flight to begin with.
+            min_limit (int): the in-flight limit never drops below this.
+            max_limit (int): the in-flight limit never grows above this.
+            max_rate (float): maximum number of requests started per second, or None
+                for no rate limit.
+            target_latency (float): responses slower than this many seconds are
+                treated as overload. App Engine times requests out around 60 seconds,
+                so the default leaves plenty of margin.
+            backoff_factor (float): the in-flight limit is multiplied by this on
+                overload.
+        """
+        self._limit = float(initial_limit)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._min_interval = 1.0 / max_rate if max_rate else 0
+        self._target_latency = target_latency
+        self._backoff_factor = backoff_factor
+
+        self._in_flight = 0
+        self._next_start = 0
+        self._last_decrease = 0
+
+        self._completed = 0
+        self._overloaded = 0
+
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return "Concurrency governor [limit %.1f, %s in flight]" % (
+            self._limit, self._in_flight)
+
+    def get_limit(self):
+        """Current number of requests allowed in flight."""
+        return int(self._limit)
+
+    def get_in_flight(self):
+        return self._in_flight
+
+    def get_stats(self):
+        """Returns a dict summarizing what the governor has seen so far."""
+        with self._condition:
+            return {'limit': int(self._limit),
+                    'in_flight': self._in_flight,
+                    'completed': self._completed,
+                    'overloaded': self._overloaded}
+
+    def acquire(self):
+        """Blocks until a request may be sent.
+
+        Returns:
+            The time the request was admitted, to be passed back to release().
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self._min_interval
+
+        # Wait out the rate limit outside the lock so other threads can reserve slots.
+        if start > now:
+            time.sleep(start - now)
+        return start
+
+    def release(self, start, overloaded=False):
+        """Records the outcome of a request admitted by acquire() and frees its slot.
+
+        Args:
+            start (float): value returned by the matching call to acquire().
+            overloaded (bool): whether the server signalled overload, independent of
+                latency (which is measured here).
+        """
+        now = time.monotonic()
+        overloaded = overloaded or now - start > self._target_latency
+        with self._condition:
+            self._in_flight -= 1
+            self._completed += 1
+            if overloaded:
+                self._overloaded += 1
+                if start >= self._last_decrease:
+                    self._limit = max(self._min_limit, self._limit * self._backoff_factor)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self._max_limit, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+
+class GoverningRestProxy(RestProxy):
+    """ Rest proxy implementation that wraps another rest proxy and makes each call wait
+    for room in a ConcurrencyGovernor. Share one governor between all proxies that talk
+    to the same server so that they share one budget.
+
+    """
+
+    def __init__(self, rest_proxy, governor=None):
+        self._rest_proxy = rest_proxy
+        self._governor = governor or ConcurrencyGovernor()
+
+    def get_governor(self):
+        return self._governor
+
+    def _is_overload(self, code, response):
+        # Authentication errors are also sent as 503s, but say nothing about load.
+        return code in ConcurrencyGovernor.OVERLOAD_CODES and \
+            not is_auth_error(code, response)
+
+    def _call(self, method, *args):
+        start = self._governor.acquire()
+        try:
+            result = method(*args)
+        except Exception:
+            # Timeouts and dropped connections are the strongest overload signals.
+            self._governor.release(start, overloaded=True)
+            raise
+        if isinstance(result, tuple):
+            code, response = result
+        else:
+            code, response = result, None
+        self._governor.release(start, overloaded=self._is_overload(code, response))
+        return result
+
+    def post(self, path, data_dict):
+        return self._call(self._rest_proxy.post, path, data_dict)
+
+    def get(self, path):
+        return self._call(self._rest_proxy.get, path)
+
+    def delete(self, path):
+        return self._call(self._rest_proxy.delete, path)
@@ -0,0 +1,124 @@
+from adam.governing_rest_proxy import ConcurrencyGovernor
+from adam.governing_rest_proxy import GoverningRestProxy
+from adam.rest_proxy import _RestProxyForTest
+from multiprocessing.dummy import Pool as ThreadPool
+import threading
+import time
+import unittest
+
+class ConcurrencyGovernorTest(unittest.TestCase):
+    """Unit tests for concurrency governor.
+
+    """
+
+    def test_additive_increase(self):
+        governor = ConcurrencyGovernor(initial_limit=2, max_limit=4)
+        # Each limit's worth of healthy responses adds about one to the limit.
+        for i in range(3):
+            governor.release(governor.acquire())
+        self.assertEqual(3, governor.get_limit())
+        for i in range(20):
+            governor.release(governor.acquire())
+        self.assertEqual(4, governor.get_limit())
+
+    def test_multiplicative_decrease(self):
+        governor = ConcurrencyGovernor(initial_limit=16, min_limit=2)
+        governor.release(governor.acquire(), overloaded=True)
+        self.assertEqual(8, governor.get_limit())
+        governor.release(governor.acquire(), overloaded=True)
+        self.assertEqual(4, governor.get_limit())
+        governor.release(governor.acquire(), overloaded=True)
+        governor.release(governor.acquire(), overloaded=True)
+        self.assertEqual(2, governor.get_limit())
+        self.assertEqual(4, governor.get_stats()['overloaded'])
+
+    def test_one_decrease_per_burst(self):
+        governor = ConcurrencyGovernor(initial_limit=16)
+        # All of these were in flight before the first overload was seen.
+        starts = [governor.acquire() for i in range(8)]
+        for start in starts:
+            governor.release(start, overloaded=True)
+        self.assertEqual(8, governor.get_limit())
+
+    def test_slow_responses_are_overload(self):
+        governor = ConcurrencyGovernor(initial_limit=16, target_latency=0.01)
+        start = governor.acquire()
+        time.sleep(0.02)
+        governor.release(start)
+        self.assertEqual(8, governor.get_limit())
+
+    def test_limits_in_flight(self):
+        governor = ConcurrencyGovernor(initial_limit=3, max_limit=3)
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def work(i):
+            start = governor.acquire()
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            governor.release(start)
+
+        pool = ThreadPool(10)
+        pool.map(work, range(30))
+        pool.close()
+        pool.join()
+        self.assertEqual(3, peak[0])
+        self.assertEqual(0, governor.get_in_flight())
+
+    def test_rate_limit(self):
+        governor = ConcurrencyGovernor(max_rate=100)
+        start = time.monotonic()
+        for i in range(11):
+            governor.release(governor.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+class GoverningRestProxyTest(unittest.TestCase):
+    """Unit tests for governing rest proxy.
+
+    """
+
+    def test_overload_codes(self):
+        rest = _RestProxyForTest()
+        governor = ConcurrencyGovernor(initial_limit=16)
+        governed = GoverningRestProxy(rest, governor)
+
+        rest.expect_get('/test', 200, {'a': 1})
+        self.assertEqual((200, {'a': 1}), governed.get('/test'))
+        self.assertEqual(16, governor.get_limit())
+
+        rest.expect_get('/test', 503, {'error': {'message': 'Backend overloaded'}})
+        self.assertEqual(503, governed.get('/test')[0])
+        self.assertEqual(8, governor.get_limit())
+
+        rest.expect_delete('/test', 204)
+        self.assertEqual(204, governed.delete('/test'))
+        self.assertEqual(0, governor.get_in_flight())
+
+    def test_auth_errors_are_not_overload(self):
+        rest = _RestProxyForTest()
+        governor = ConcurrencyGovernor(initial_limit=16)
+        governed = GoverningRestProxy(rest, governor)
+
+        rest.expect_get('/test', 503, {'error': {
+            'message': 'org.apache.shiro.authc.ExpiredCredentialsException'}})
+        governed.get('/test')
+        self.assertEqual(16, governor.get_limit())
+
+    def test_exceptions_are_overload(self):
+        rest = _RestProxyForTest()
+        governor = ConcurrencyGovernor(initial_limit=16)
+        governed = GoverningRestProxy(rest, governor)
+
+        # No expectation set, so the call raises.
+        with self.assertRaises(AssertionError):
+            governed.get('/test')
+        self.assertEqual(8, governor.get_limit())
+        self.assertEqual(0, governor.get_in_flight())
+
+if __name__ == '__main__':
+    unittest.main()
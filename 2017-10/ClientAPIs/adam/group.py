@@ -6,6 +6,8 @@ from datetime import datetime
 from tabulate import tabulate
 
 class Group(object):
+    __slots__ = ('_uuid', '_name', '_description')
+    
     def __init__(self, uuid, name=None, description=None):
         self._uuid = uuid
         self._name = name
@@ -24,6 +26,8 @@ class Group(object):
         return self._description
 
 class GroupMember(object):
+    __slots__ = ('_id', '_type')
+    
     def __init__(self, id, type):
         self._id = id
         self._type = type
@@ -0,0 +1,220 @@
+"""
+    hedging_rest_proxy.py
+
+    Rest proxy that cuts the tail latency of GETs by hedging: if a GET has not come back
+    by the time most GETs have, an identical second GET is sent and whichever comes
+    back first is used. GETs are idempotent, so the duplicate is harmless to the
+    server. Results retrieval in BatchRunManager waits for its slowest part download,
+    so a few slow requests would otherwise dominate it.
+"""
+
+from adam.rest_proxy import RestProxy
+from adam.rest_proxy import RestRequests
+from adam.rest_proxy import clear_last_transfer_sizes
+from adam.rest_proxy import get_last_transfer_sizes
+from adam.rest_proxy import set_last_transfer_sizes
+
+from collections import deque
+from multiprocessing.dummy import Pool as ThreadPool
+import threading
+import time
+
+class _Race(object):
+    """Tracks the attempts at one GET. The first attempt to succeed wins."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.attempts = 0
+        self.failures = 0
+        self.result = None
+        self.transfer_sizes = None
+        self.error = None
+        self.winner = None
+        self.finished = None
+
+class HedgingRestProxy(RestProxy):
+    """ Rest proxy implementation that wraps another rest proxy and hedges GETs. Safe
+    to use from many threads at once.
+
+    Each GET is sent from a pool of threads, no larger than the connection pool of
+    RestRequests by default, so that attempts never need more connections than it
+    keeps. If it has not come back after the hedge delay, a second identical GET is sent, and the caller gets whichever response
+    arrives first. The hedge delay is the given percentile of recent GET latencies, so
+    only about (100 - percentile)% of GETs are hedged. The other request can't be
+    interrupted, so it is abandoned: it runs to completion in the background and its
+    response is discarded. If the pool is busy with abandoned requests, new requests
+    wait for a free thread.
+
+    The transfer sizes of the attempt that answered are handed back to the calling
+    thread, so that proxies wrapping this one can report them.
+
+    To keep hedges from adding to the load on a struggling server, at most
+    max_hedge_fraction of GETs are hedged.
+
+    POSTs and DELETEs are not idempotent and are passed straight through.
+    """
+
+    def __init__(self, rest_proxy, percentile=95, initial_delay=1.0, min_delay=0.01,
+                 max_hedge_fraction=0.1, window=1000,
+                 threads=RestRequests.DEFAULT_POOL_SIZE):
+        """
+        Args:
+            rest_proxy (RestProxy): proxy to send requests through.
+            percentile (float): percentile of recent GET latencies after which a hedge
+                is sent.
+            initial_delay (float): seconds after which a hedge is sent until enough
+                latencies have been seen to compute the percentile.
+            min_delay (float): hedges are never sent sooner than this many seconds.
+            max_hedge_fraction (float): maximum fraction of GETs that are hedged.
+            window (int): number of recent GET latencies the percentile is taken over.
+            threads (int): number of threads GETs are sent from. Also the most GETs,
+                hedges included, that are in flight at once.
+        """
+        self._rest_proxy = rest_proxy
+        self._percentile = percentile
+        self._min_delay = min_delay
+        self._max_hedge_fraction = max_hedge_fraction
+
+        self._hedge_delay = initial_delay
+        # Latencies of requests that came back, whether or not they won a race.
+        self._latencies = deque(maxlen=window)
+        # Pairs of [latency seen by the caller, latency of the first request], for GETs
+        # whose first request has come back.
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._pool = ThreadPool(threads)
+
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._time_saved = 0.0
+
+    def __repr__(self):
+        return "Hedging rest proxy [delay %.3fs]" % (self._hedge_delay)
+
+    def close(self):
+        """Stops the threads GETs are sent from, once any requests they are still
+        sending come back.
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def get_hedge_delay(self):
+        """Seconds after which a GET is currently hedged."""
+        return self._hedge_delay
+
+    def get_stats(self):
+        """Returns a dict describing how much hedging has helped.
+
+        Has the number of GETs ('requests'), hedges sent ('hedges') and hedges that
+        answered first ('hedge_wins'), the current 'hedge_delay', the total seconds
+        callers did not wait because a hedge answered first ('time_saved'), and the
+        given percentile (and the 99th) of latency over recent GETs both as seen by
+        callers ('observed_p<n>') and as the first request alone would have given
+        ('unhedged_p<n>').
+        """
+        with self._lock:
+            observed = sorted(o[0] for o in self._outcomes)
+            unhedged = sorted(o[1] for o in self._outcomes)
+            stats = {'requests': self._requests,
+                     'hedges': self._hedges,
+                     'hedge_wins': self._hedge_wins,
+                     'hedge_delay': self._hedge_delay,
+                     'time_saved': self._time_saved}
+        for p in sorted(set([self._percentile, 99])):
+            stats['observed_p%s' % (p)] = _percentile_of(observed, p)
+            stats['unhedged_p%s' % (p)] = _percentile_of(unhedged, p)
+        return stats
+
+    def _record_latency(self, latency):
+        # Must be called with the lock held.
+        self._latencies.append(latency)
+        if len(self._latencies) >= 20 and len(self._latencies) % 10 == 0:
+            self._hedge_delay = max(self._min_delay, _percentile_of(
+                sorted(self._latencies), self._percentile))
+
+    def _attempt(self, race, path, start, index):
+        attempt_start = time.monotonic()
+        # Pool threads are reused, so sizes left from an earlier request mustn't be
+        # taken for this one's.
+        clear_last_transfer_sizes()
+        try:
+            result = self._rest_proxy.get(path)
+            error = None
+        except Exception as e:
+            result = None
+            error = e
+        end = time.monotonic()
+        transfer_sizes = get_last_transfer_sizes()
+
+        with race.lock:
+            if race.winner is None and error is None:
+                race.winner = index
+                race.result = result
+                race.transfer_sizes = transfer_sizes
+                race.finished = end
+            elif error is not None:
+                race.failures += 1
+                if race.error is None:
+                    race.error = error
+            # Wake the caller once there is a winner, or once every attempt failed.
+            if race.winner is not None or race.failures == race.attempts:
+                race.done.set()
+
+        with self._lock:
+            if error is None:
+                self._record_latency(end - attempt_start)
+            if index == 0:
+                # The first request is the one the caller would have waited for
+                # without hedging.
+                if race.winner is not None:
+                    observed = race.finished - start
+                    self._outcomes.append([observed, end - start])
+                    if race.winner != 0:
+                        self._time_saved += (end - start) - observed
+
+    def _start_attempt(self, race, path, start):
+        with race.lock:
+            index = race.attempts
+            race.attempts += 1
+        self._pool.apply_async(self._attempt, (race, path, start, index))
+
+    def _may_hedge(self):
+        with self._lock:
+            if self._hedges + 1 > self._max_hedge_fraction * self._requests:
+                return False
+            self._hedges += 1
+            return True
+
+    def get(self, path):
+        with self._lock:
+            self._requests += 1
+            delay = self._hedge_delay
+
+        race = _Race()
+        start = time.monotonic()
+        self._start_attempt(race, path, start)
+        if not race.done.wait(delay) and self._may_hedge():
+            self._start_attempt(race, path, start)
+        race.done.wait()
+
+        if race.winner is None:
+            raise race.error
+        set_last_transfer_sizes(race.transfer_sizes)
+        if race.winner != 0:
+            with self._lock:
+                self._hedge_wins += 1
+        return race.result
+
+    def post(self, path, data_dict):
+        return self._rest_proxy.post(path, data_dict)
+
+    def delete(self, path):
+        return self._rest_proxy.delete(path)
+
+def _percentile_of(sorted_values, percentile):
+    if len(sorted_values) == 0:
+        return None
+    index = int(round(percentile / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
@@ -0,0 +1,126 @@
+from adam.hedging_rest_proxy import HedgingRestProxy
+from adam.rest_proxy import RestProxy
+from adam.rest_proxy import _RestProxyForTest
+from adam.rest_proxy import clear_last_transfer_sizes
+from adam.rest_proxy import get_last_transfer_sizes
+from adam.rest_proxy import set_last_transfer_sizes
+from multiprocessing.dummy import Pool as ThreadPool
+import threading
+import time
+import unittest
+
+class _SlowRestProxy(RestProxy):
+    """Answers GETs after the given delays, one per call in call order, then
+    immediately."""
+
+    def __init__(self, delays, error=None):
+        self._delays = list(delays)
+        self._error = error
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, path):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            delay = self._delays.pop(0) if self._delays else 0
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(delay)
+        with self._lock:
+            self.in_flight -= 1
+        if self._error is not None:
+            raise self._error
+        # As RestRequests does, on the thread that made the call.
+        set_last_transfer_sizes((0, call))
+        return 200, {'path': path}
+
+class HedgingRestProxyTest(unittest.TestCase):
+    """Unit tests for hedging rest proxy.
+
+    """
+
+    def test_fast_gets_are_not_hedged(self):
+        slow = _SlowRestProxy([])
+        hedging = HedgingRestProxy(slow, initial_delay=0.5, max_hedge_fraction=1)
+        self.addCleanup(hedging.close)
+        for i in range(5):
+            self.assertEqual((200, {'path': '/a'}), hedging.get('/a'))
+        self.assertEqual(5, slow.calls)
+        self.assertEqual(0, hedging.get_stats()['hedges'])
+
+    def test_slow_get_is_hedged(self):
+        slow = _SlowRestProxy([0.5])
+        hedging = HedgingRestProxy(slow, initial_delay=0.05, max_hedge_fraction=1)
+        self.addCleanup(hedging.close)
+
+        start = time.monotonic()
+        self.assertEqual((200, {'path': '/a'}), hedging.get('/a'))
+        self.assertGreater(0.3, time.monotonic() - start)
+        self.assertEqual(2, slow.calls)
+
+        # Time saved is known once the abandoned request comes back.
+        time.sleep(0.6)
+        stats = hedging.get_stats()
+        self.assertEqual(1, stats['hedges'])
+        self.assertEqual(1, stats['hedge_wins'])
+        self.assertLess(0.3, stats['time_saved'])
+        self.assertLess(stats['observed_p99'], stats['unhedged_p99'])
+
+    def test_hedges_are_limited(self):
+        slow = _SlowRestProxy([0.05] * 20)
+        hedging = HedgingRestProxy(slow, initial_delay=0.01, max_hedge_fraction=0.2)
+        self.addCleanup(hedging.close)
+        for i in range(10):
+            hedging.get('/a')
+        self.assertEqual(2, hedging.get_stats()['hedges'])
+
+    def test_hedge_delay_follows_latency(self):
+        slow = _SlowRestProxy([0.02] * 30)
+        hedging = HedgingRestProxy(slow, percentile=50, initial_delay=1, min_delay=0.001)
+        self.addCleanup(hedging.close)
+        for i in range(30):
+            hedging.get('/a')
+        self.assertLess(0.015, hedging.get_hedge_delay())
+        self.assertGreater(0.1, hedging.get_hedge_delay())
+
+    def test_error(self):
+        slow = _SlowRestProxy([], error=IOError('Connection reset'))
+        hedging = HedgingRestProxy(slow)
+        self.addCleanup(hedging.close)
+        with self.assertRaises(IOError):
+            hedging.get('/a')
+
+    def test_threads_are_bounded(self):
+        slow = _SlowRestProxy([0.05] * 20)
+        hedging = HedgingRestProxy(slow, initial_delay=0.01, max_hedge_fraction=1,
+                                   threads=3)
+        self.addCleanup(hedging.close)
+        pool = ThreadPool(6)
+        pool.map(lambda i: hedging.get('/a'), range(12))
+        pool.close()
+        pool.join()
+        self.assertLessEqual(slow.max_in_flight, 3)
+
+    def test_transfer_sizes_of_the_winner(self):
+        slow = _SlowRestProxy([0.5])
+        hedging = HedgingRestProxy(slow, initial_delay=0.05, max_hedge_fraction=1)
+        self.addCleanup(hedging.close)
+        clear_last_transfer_sizes()
+        hedging.get('/a')
+        # The hedge, the second call, answered first.
+        self.assertEqual((0, 2), get_last_transfer_sizes())
+
+    def test_post_and_delete_pass_through(self):
+        rest = _RestProxyForTest()
+        hedging = HedgingRestProxy(rest)
+        self.addCleanup(hedging.close)
+        rest.expect_post('/a', lambda data: data['x'] == 1, 200, {'b': 2})
+        rest.expect_delete('/a', 204)
+        self.assertEqual((200, {'b': 2}), hedging.post('/a', {'x': 1}))
+        self.assertEqual(204, hedging.delete('/a'))
+
+if __name__ == '__main__':
+    unittest.main()
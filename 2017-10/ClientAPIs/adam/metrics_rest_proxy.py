@@ -0,0 +1,226 @@
+"""
+    metrics_rest_proxy.py
+
+    Rest proxy that records per-endpoint metrics (latency histograms, bytes on the
+    wire, status codes, requests in flight) for every call, instead of printing them.
+    Metrics can be read as a snapshot dict, as JSON, or in the Prometheus text
+    exposition format.
+"""
+
+from adam.rest_proxy import RestProxy
+from adam.rest_proxy import clear_last_transfer_sizes
+from adam.rest_proxy import get_last_transfer_sizes
+
+import json
+import re
+import threading
+import time
+
+# Path components that identify individual objects. Replaced by placeholders so that
+# e.g. all part downloads are counted under one endpoint.
+_UUID_PATTERN = re.compile(
+    r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+_NUMBER_PATTERN = re.compile(r'^[0-9]+$')
+
+def endpoint_for_path(method, path):
+    """Returns the endpoint a call is counted under, e.g.
+    'GET /batch/{uuid}/{n}' for 'GET /batch/<uuid>/3?token=...'.
+    """
+    components = path.split('?', 1)[0].split('/')
+    for i in range(len(components)):
+        if _UUID_PATTERN.match(components[i]):
+            components[i] = '{uuid}'
+        elif _NUMBER_PATTERN.match(components[i]):
+            components[i] = '{n}'
+    return method + ' ' + '/'.join(components)
+
+class _EndpointMetrics(object):
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.codes = {}
+        self.in_flight = 0
+
+class MetricsRestProxy(RestProxy):
+    """ Rest proxy implementation that wraps another rest proxy and records metrics
+    for every call. Safe to use from many threads at once.
+
+    Byte counts are only available when a RestRequests sits somewhere underneath this
+    proxy; they are taken from what RestRequests actually sent and received, so no
+    request or response is serialized again to measure it.
+    """
+
+    # Upper bounds, in seconds, of the latency histogram buckets. A final bucket
+    # catches everything slower. App Engine times requests out around 60 seconds.
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+    def __init__(self, rest_proxy, buckets=DEFAULT_BUCKETS):
+        self._rest_proxy = rest_proxy
+        self._buckets = buckets
+        self._endpoints = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "Metrics rest proxy [%s endpoints]" % (len(self._endpoints))
+
+    def _start(self, endpoint):
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = _EndpointMetrics(self._buckets)
+                self._endpoints[endpoint] = metrics
+            metrics.in_flight += 1
+            self._in_flight += 1
+        clear_last_transfer_sizes()
+        return metrics, time.monotonic()
+
+    def _finish(self, metrics, start, code):
+        latency = time.monotonic() - start
+        sizes = get_last_transfer_sizes()
+        bucket = 0
+        while bucket < len(self._buckets) and latency > self._buckets[bucket]:
+            bucket += 1
+        with self._lock:
+            metrics.in_flight -= 1
+            self._in_flight -= 1
+            metrics.count += 1
+            metrics.bucket_counts[bucket] += 1
+            metrics.latency_sum += latency
+            metrics.latency_max = max(metrics.latency_max, latency)
+            if sizes is not None:
+                metrics.request_bytes += sizes[0]
+                metrics.response_bytes += sizes[1]
+            if code is None:
+                metrics.errors += 1
+            else:
+                metrics.codes[code] = metrics.codes.get(code, 0) + 1
+
+    def _call(self, endpoint, method, *args):
+        metrics, start = self._start(endpoint)
+        try:
+            result = method(*args)
+        except Exception:
+            self._finish(metrics, start, None)
+            raise
+        self._finish(metrics, start, result[0] if isinstance(result, tuple) else result)
+        return result
+
+    def post(self, path, data_dict):
+        return self._call(endpoint_for_path('POST', path),
+                          self._rest_proxy.post, path, data_dict)
+
+    def get(self, path):
+        return self._call(endpoint_for_path('GET', path), self._rest_proxy.get, path)
+
+    def delete(self, path):
+        return self._call(endpoint_for_path('DELETE', path),
+                          self._rest_proxy.delete, path)
+
+    def reset(self):
+        """Discards all metrics recorded so far."""
+        with self._lock:
+            for endpoint in list(self._endpoints.keys()):
+                if self._endpoints[endpoint].in_flight == 0:
+                    del self._endpoints[endpoint]
+                else:
+                    in_flight = self._endpoints[endpoint].in_flight
+                    self._endpoints[endpoint] = _EndpointMetrics(self._buckets)
+                    self._endpoints[endpoint].in_flight = in_flight
+
+    def get_snapshot(self):
+        """Returns a consistent copy of all metrics recorded so far.
+
+        Returns:
+            A dict with the total number of requests in flight under 'in_flight',
+            and a dict of per-endpoint metrics under 'endpoints'. Each endpoint has
+            'count', 'errors' (calls that raised), 'in_flight', 'latency_sum',
+            'latency_mean', 'latency_max' (seconds), 'request_bytes',
+            'response_bytes', 'codes' (count by status code) and 'latency_buckets'
+            (list of [upper bound, cumulative count] pairs, the last bound being
+            None for +Inf).
+        """
+        with self._lock:
+            endpoints = {}
+            for endpoint, m in self._endpoints.items():
+                cumulative = 0
+                buckets = []
+                for i in range(len(m.bucket_counts)):
+                    cumulative += m.bucket_counts[i]
+                    bound = self._buckets[i] if i < len(self._buckets) else None
+                    buckets.append([bound, cumulative])
+                endpoints[endpoint] = {
+                    'count': m.count,
+                    'errors': m.errors,
+                    'in_flight': m.in_flight,
+                    'latency_sum': m.latency_sum,
+                    'latency_mean': m.latency_sum / m.count if m.count else 0.0,
+                    'latency_max': m.latency_max,
+                    'request_bytes': m.request_bytes,
+                    'response_bytes': m.response_bytes,
+                    'codes': dict(m.codes),
+                    'latency_buckets': buckets}
+            return {'in_flight': self._in_flight, 'endpoints': endpoints}
+
+    def to_json(self):
+        """Returns the snapshot as a JSON string."""
+        snapshot = self.get_snapshot()
+        # JSON object keys must be strings.
+        for m in snapshot['endpoints'].values():
+            m['codes'] = {str(c): n for c, n in m['codes'].items()}
+        return json.dumps(snapshot, sort_keys=True)
+
+    def to_prometheus(self, prefix='adam_client'):
+        """Returns the snapshot in the Prometheus text exposition format. Requests in
+        flight are given per endpoint only; their sum is the total in the snapshot."""
+        snapshot = self.get_snapshot()
+        lines = []
+
+        def label(endpoint):
+            method, path = endpoint.split(' ', 1)
+            return 'method="%s",endpoint="%s"' % (method, path)
+
+        # Only the series per endpoint are given, since a series without labels next
+        # to them would be counted twice when they are summed.
+        lines.append('# TYPE %s_requests_in_flight gauge' % (prefix))
+        for endpoint in sorted(snapshot['endpoints']):
+            lines.append('%s_requests_in_flight{%s} %s' % (
+                prefix, label(endpoint), snapshot['endpoints'][endpoint]['in_flight']))
+
+        lines.append('# TYPE %s_request_duration_seconds histogram' % (prefix))
+        for endpoint in sorted(snapshot['endpoints']):
+            m = snapshot['endpoints'][endpoint]
+            for bound, count in m['latency_buckets']:
+                le = '+Inf' if bound is None else repr(float(bound))
+                lines.append('%s_request_duration_seconds_bucket{%s,le="%s"} %s' % (
+                    prefix, label(endpoint), le, count))
+            lines.append('%s_request_duration_seconds_sum{%s} %s' % (
+                prefix, label(endpoint), repr(m['latency_sum'])))
+            lines.append('%s_request_duration_seconds_count{%s} %s' % (
+                prefix, label(endpoint), m['count']))
+
+        lines.append('# TYPE %s_responses_total counter' % (prefix))
+        for endpoint in sorted(snapshot['endpoints']):
+            m = snapshot['endpoints'][endpoint]
+            for code in sorted(m['codes']):
+                lines.append('%s_responses_total{%s,code="%s"} %s' % (
+                    prefix, label(endpoint), code, m['codes'][code]))
+
+        lines.append('# TYPE %s_request_errors_total counter' % (prefix))
+        for endpoint in sorted(snapshot['endpoints']):
+            lines.append('%s_request_errors_total{%s} %s' % (
+                prefix, label(endpoint), snapshot['endpoints'][endpoint]['errors']))
+
+        for direction in ['request', 'response']:
+            lines.append('# TYPE %s_%s_bytes_total counter' % (prefix, direction))
+            for endpoint in sorted(snapshot['endpoints']):
+                lines.append('%s_%s_bytes_total{%s} %s' % (
+                    prefix, direction, label(endpoint),
+                    snapshot['endpoints'][endpoint][direction + '_bytes']))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,92 @@
+from adam.metrics_rest_proxy import MetricsRestProxy
+from adam.metrics_rest_proxy import endpoint_for_path
+from adam.rest_proxy import AuthorizingRestProxy
+from adam.rest_proxy import RestRequests
+from adam.rest_proxy import _RestProxyForTest
+from adam.stand_in_server import StandInServer
+import json
+import unittest
+
+class EndpointForPathTest(unittest.TestCase):
+    """Unit tests for endpoint naming.
+
+    """
+
+    def test_endpoint_for_path(self):
+        self.assertEqual('GET /me', endpoint_for_path('GET', '/me?token=abc'))
+        self.assertEqual('GET /batch/{uuid}/{n}', endpoint_for_path(
+            'GET', '/batch/61c25677-c328-45c4-af22-a0a4d5e54826/12?token=abc'))
+        self.assertEqual('POST /batches', endpoint_for_path('POST', '/batches'))
+
+class MetricsRestProxyTest(unittest.TestCase):
+    """Unit tests for metrics rest proxy.
+
+    """
+
+    def test_counts_and_codes(self):
+        rest = _RestProxyForTest()
+        metrics = MetricsRestProxy(rest)
+
+        rest.expect_get('/batch/b1', 200, {})
+        rest.expect_get('/batch/b1', 404, {})
+        rest.expect_delete('/batch/b1', 204)
+        rest.expect_post('/batches', lambda data: True, 200, {})
+        metrics.get('/batch/b1')
+        metrics.get('/batch/b1')
+        metrics.delete('/batch/b1')
+        metrics.post('/batches', {})
+        with self.assertRaises(AssertionError):
+            metrics.get('/batch/b1')
+
+        snapshot = metrics.get_snapshot()
+        self.assertEqual(0, snapshot['in_flight'])
+        get = snapshot['endpoints']['GET /batch/b1']
+        self.assertEqual(3, get['count'])
+        self.assertEqual(1, get['errors'])
+        self.assertEqual({200: 1, 404: 1}, get['codes'])
+        self.assertEqual(3, get['latency_buckets'][-1][1])
+        self.assertEqual({204: 1}, snapshot['endpoints']['DELETE /batch/b1']['codes'])
+        # No RestRequests underneath, so no sizes.
+        self.assertEqual(0, snapshot['endpoints']['POST /batches']['request_bytes'])
+
+        metrics.reset()
+        self.assertEqual({}, metrics.get_snapshot()['endpoints'])
+
+    def test_byte_counts(self):
+        server = StandInServer(ephemeris_points=100, compress_responses=False).start()
+        rest = RestRequests(server.get_url())
+        metrics = MetricsRestProxy(AuthorizingRestProxy(rest, 'token'))
+
+        code, response = metrics.post('/batches', {'requests': [{'project': 'p1'}]})
+        code, part = metrics.get('/batch/b1/1')
+        rest.close()
+        server.stop()
+
+        snapshot = metrics.get_snapshot()['endpoints']
+        self.assertEqual(server.get_bytes_received(),
+                         snapshot['POST /batches']['request_bytes'])
+        self.assertEqual(len(json.dumps(part)),
+                         snapshot['GET /batch/b1/{n}']['response_bytes'])
+
+    def test_formats(self):
+        rest = _RestProxyForTest()
+        metrics = MetricsRestProxy(rest, buckets=(1, 10))
+        rest.expect_get('/me', 200, {})
+        metrics.get('/me')
+
+        snapshot = json.loads(metrics.to_json())
+        self.assertEqual({'200': 1}, snapshot['endpoints']['GET /me']['codes'])
+
+        text = metrics.to_prometheus()
+        self.assertIn('adam_client_requests_in_flight'
+                      '{method="GET",endpoint="/me"} 0\n', text)
+        self.assertNotIn('adam_client_requests_in_flight 0\n', text)
+        self.assertIn('adam_client_request_duration_seconds_bucket'
+                      '{method="GET",endpoint="/me",le="1.0"} 1\n', text)
+        self.assertIn('adam_client_request_duration_seconds_bucket'
+                      '{method="GET",endpoint="/me",le="+Inf"} 1\n', text)
+        self.assertIn('adam_client_responses_total'
+                      '{method="GET",endpoint="/me",code="200"} 1\n', text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+"""
+    opm_template.py
+
+    Generates OPM strings in bulk. OpmParams.generate_opm assembles every OPM from
+    scratch; an OpmTemplate works out the text that is the same for every OPM once, so
+    that producing each OPM takes a single string formatting operation over only the
+    fields that vary.
+
+    The OPMs produced are identical to those OpmParams.generate_opm produces for the
+    same parameters.
+"""
+
+from datetime import datetime
+
+# Lines of an OPM, in order, as pairs of a format with at most one %s and the
+# parameter (with index, for list parameters) that fills it in, or None for lines
+# that never change. Must be kept in sync with OpmParams.generate_opm.
+_OPM_LINES = [
+    ("CCSDS_OPM_VERS = 2.0\n", None),
+    ("CREATION_DATE = %s\n", 'creation_date'),
+    ("ORIGINATOR = %s\n", 'originator'),
+    ("COMMENT Cartesian coordinate system\n", None),
+    ("OBJECT_NAME = %s\n", 'object_name'),
+    ("OBJECT_ID = %s\n", 'object_id'),
+    ("CENTER_NAME = SUN\n", None),
+    ("REF_FRAME = ITRF-97\n", None),
+    ("TIME_SYSTEM = UTC\n", None),
+    ("EPOCH = %s\n", 'epoch'),
+    ("X = %s\n", ('state_vector', 0)),
+    ("Y = %s\n", ('state_vector', 1)),
+    ("Z = %s\n", ('state_vector', 2)),
+    ("X_DOT = %s\n", ('state_vector', 3)),
+    ("Y_DOT = %s\n", ('state_vector', 4)),
+    ("Z_DOT = %s\n", ('state_vector', 5)),
+    ("MASS = %s\n", 'mass'),
+    ("SOLAR_RAD_AREA = %s\n", 'solar_rad_area'),
+    ("SOLAR_RAD_COEFF = %s\n", 'solar_rad_coeff'),
+    ("DRAG_AREA = %s\n", 'drag_area'),
+    ("DRAG_COEFF = %s", 'drag_coeff'),
+]
+
+_COVARIANCE_NAMES = ['CX_X', 'CY_X', 'CY_Y', 'CZ_X', 'CZ_Y', 'CZ_Z',
+                     'CX_DOT_X', 'CX_DOT_Y', 'CX_DOT_Z', 'CX_DOT_X_DOT',
+                     'CY_DOT_X', 'CY_DOT_Y', 'CY_DOT_Z', 'CY_DOT_X_DOT', 'CY_DOT_Y_DOT',
+                     'CZ_DOT_X', 'CZ_DOT_Y', 'CZ_DOT_Z', 'CZ_DOT_X_DOT', 'CZ_DOT_Y_DOT',
+                     'CZ_DOT_Z_DOT']
+
+# The covariance block, present only if a covariance is given.
+_COVARIANCE_LINES = [
+    (("\n" if i == 0 else "") + name + " = %s\n", ('covariance', i))
+    for i, name in enumerate(_COVARIANCE_NAMES)] + [
+    ("USER_DEFINED_ADAM_INITIAL_PERTURBATION = %s [sigma]\n", 'perturbation'),
+    ("USER_DEFINED_ADAM_HYPERCUBE = %s\n", 'hypercube'),
+]
+
+# Parameters that can vary between OPMs generated from one template.
+VARYING_PARAMS = {'originator', 'object_name', 'object_id', 'epoch', 'state_vector',
+                  'mass', 'solar_rad_area', 'solar_rad_coeff', 'drag_area', 'drag_coeff',
+                  'covariance', 'perturbation', 'hypercube'}
+
+def _creation_date():
+    return "%s" % datetime.utcnow()
+
+class OpmTemplate(object):
+    """An OPM with the text that is the same for every OPM generated from it already
+    filled in, and placeholders for the parameters that vary.
+    """
+
+    def __init__(self, opm_params, varying=('state_vector',)):
+        """Compiles a template.
+
+        Args:
+            opm_params (OpmParams): parameters shared by all OPMs. Values it has for the
+                varying parameters are ignored, but whether it has a covariance decides
+                whether the OPMs include one.
+            varying (list<str>): names of the parameters, as OpmParams takes them, that
+                are given separately for each OPM. See VARYING_PARAMS.
+
+        Raises:
+            KeyError if unsupported parameters are given as varying
+        """
+        extra_params = set(varying) - VARYING_PARAMS
+        if len(extra_params) > 0:
+            raise KeyError("Unexpected parameters provided: %s" % (extra_params))
+        self._varying = list(varying)
+
+        values = opm_params.get_values()
+        lines = _OPM_LINES
+        if values['covariance'] is not None:
+            lines = lines + _COVARIANCE_LINES
+
+        # Parameters in the order their placeholders appear, as (name, index) pairs.
+        self._placeholders = []
+        pieces = []
+        for line, param in lines:
+            if param is None:
+                pieces.append(line.replace('%', '%%'))
+                continue
+            name, index = param if isinstance(param, tuple) else (param, None)
+            if name == 'creation_date' or name in self._varying:
+                pieces.append(line)
+                self._placeholders.append((name, index))
+            else:
+                value = values[name]
+                if index is not None:
+                    value = value[index]
+                pieces.append((line % (value,)).replace('%', '%%'))
+        self._format = ''.join(pieces)
+
+    def __repr__(self):
+        return "OPM template varying %s" % (self._varying)
+
+    def get_varying(self):
+        return self._varying
+
+    def generate_opm(self, values, creation_date=None):
+        """Generates a single OPM.
+
+        Args:
+            values (dict): value of every varying parameter, by name.
+            creation_date (str): creation date to record in the OPM. Defaults to now.
+
+        Returns:
+            OPM (str)
+        """
+        if creation_date is None:
+            creation_date = _creation_date()
+        args = []
+        for name, index in self._placeholders:
+            if name == 'creation_date':
+                args.append(creation_date)
+            elif index is None:
+                args.append(values[name])
+            else:
+                args.append(values[name][index])
+        return self._format % tuple(args)
+
+    def generate_opms(self, columns, creation_date=None):
+        """Generates one OPM per row of the given columns.
+
+        Args:
+            columns (dict): by name, a sequence or array with one value of every
+                varying parameter per OPM. List parameters such as state_vector take
+                a 2d array with one row per OPM.
+            creation_date (str): creation date to record in all the OPMs. Defaults to
+                now.
+
+        Returns:
+            list of OPMs (str)
+        """
+        if creation_date is None:
+            creation_date = _creation_date()
+        # Turn every column into a list of Python values, and split list parameters
+        # into one list per element, so each OPM's arguments are one row of a zip.
+        split = {}
+        count = None
+        for name in self._varying:
+            column = columns[name]
+            column = column.tolist() if hasattr(column, 'tolist') else list(column)
+            if count is None:
+                count = len(column)
+            elif len(column) != count:
+                raise ValueError("Expected %s values of %s, got %s" %
+                    (count, name, len(column)))
+            split[name] = column
+        if count is None:
+            count = 1
+
+        args = []
+        for name, index in self._placeholders:
+            if name == 'creation_date':
+                args.append([creation_date] * count)
+            elif index is None:
+                args.append(split[name])
+            else:
+                args.append([row[index] for row in split[name]])
+
+        opm_format = self._format
+        return [opm_format % row for row in zip(*args)]
+
+def generate_opms(opm_params, state_vectors, creation_date=None, **columns):
+    """Generates one OPM per state vector, with all other parameters taken from
+    opm_params except those given in columns.
+
+    Args:
+        opm_params (OpmParams): parameters shared by all OPMs.
+        state_vectors (array): N x 6 array of state vectors [rx, ry, rz, vx, vy, vz].
+        creation_date (str): creation date to record in all the OPMs. Defaults to now.
+        columns: sequences or arrays of length N of other parameters that vary, by the
+            names OpmParams takes.
+
+    Returns:
+        list of N OPMs (str)
+    """
+    columns['state_vector'] = state_vectors
+    template = OpmTemplate(opm_params, varying=list(columns))
+    return template.generate_opms(columns, creation_date)
@@ -0,0 +1,89 @@
+from adam.batch import OpmParams
+from adam.opm_template import OpmTemplate
+from adam.opm_template import generate_opms
+import numpy as np
+import unittest
+
+def _without_creation_date(opm):
+    return '\n'.join(line for line in opm.split('\n')
+                     if not line.startswith('CREATION_DATE'))
+
+class OpmTemplateTest(unittest.TestCase):
+    """Unit tests for OPM template.
+
+    """
+
+    def params(self, **extra):
+        params = {
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': [130347560.13690618, -74407287.6018632, -35247598.541470632,
+                             23.935241263310683, 27.146279819258538, 10.346605942591514],
+            'object_name': 'TestObj',
+            'mass': 500.5,
+        }
+        params.update(extra)
+        return OpmParams(params)
+
+    def assertSameOpm(self, expected, actual):
+        self.assertEqual(_without_creation_date(expected), _without_creation_date(actual))
+
+    def test_matches_opm_params(self):
+        opm_params = self.params()
+        template = OpmTemplate(opm_params)
+        opm = template.generate_opm({'state_vector': opm_params.get_state_vector()})
+        self.assertSameOpm(opm_params.generate_opm(), opm)
+
+    def test_matches_opm_params_with_covariance(self):
+        opm_params = self.params(covariance=[float(i) for i in range(21)],
+                                 perturbation=5, hypercube='CORNERS')
+        template = OpmTemplate(opm_params)
+        opm = template.generate_opm({'state_vector': opm_params.get_state_vector()})
+        self.assertSameOpm(opm_params.generate_opm(), opm)
+
+    def test_creation_date(self):
+        template = OpmTemplate(self.params())
+        opm = template.generate_opm({'state_vector': [0.0] * 6}, creation_date='then')
+        self.assertIn('\nCREATION_DATE = then\n', opm)
+
+    def test_percent_in_constant_values(self):
+        opm_params = self.params(object_name='100% real')
+        opm = OpmTemplate(opm_params).generate_opm(
+            {'state_vector': opm_params.get_state_vector()})
+        self.assertSameOpm(opm_params.generate_opm(), opm)
+
+    def test_varying_columns(self):
+        state_vectors = np.arange(18, dtype=float).reshape(3, 6)
+        masses = np.array([1.0, 2.5, 3.0])
+        names = ['a', 'b', 'c']
+        opms = generate_opms(self.params(), state_vectors, creation_date='then',
+                             mass=masses, object_name=names)
+
+        self.assertEqual(3, len(opms))
+        for i in range(3):
+            expected = self.params(state_vector=state_vectors[i].tolist(),
+                                   mass=masses[i].item(), object_name=names[i])
+            self.assertSameOpm(expected.generate_opm(), opms[i])
+            self.assertIn('\nCREATION_DATE = then\n', opms[i])
+
+    def test_generate_opms_matches_generate_opm(self):
+        template = OpmTemplate(self.params(), varying=['state_vector', 'epoch'])
+        state_vectors = np.random.rand(5, 6)
+        epochs = ['2017-10-0%sT00:00:00Z' % (i + 1) for i in range(5)]
+        opms = template.generate_opms(
+            {'state_vector': state_vectors, 'epoch': epochs}, creation_date='then')
+        for i in range(5):
+            self.assertEqual(template.generate_opm(
+                {'state_vector': state_vectors[i].tolist(), 'epoch': epochs[i]}, 'then'),
+                opms[i])
+
+    def test_mismatched_columns(self):
+        template = OpmTemplate(self.params(), varying=['state_vector', 'mass'])
+        with self.assertRaises(ValueError):
+            template.generate_opms({'state_vector': np.zeros((3, 6)), 'mass': [1.0, 2.0]})
+
+    def test_unsupported_varying(self):
+        with self.assertRaises(KeyError):
+            OpmTemplate(self.params(), varying=['state_vector', 'frame'])
+
+if __name__ == '__main__':
+    unittest.main()
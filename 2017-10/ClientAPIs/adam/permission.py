@@ -6,6 +6,8 @@ from datetime import datetime
 from tabulate import tabulate
 
 class Permission(object):
+    __slots__ = ('_right', '_target_type', '_target_uuid')
+    
     def __init__(self, right, target_type, target_uuid):
         """Creates representation of permission.
         
@@ -33,7 +35,9 @@ class Permission(object):
         return "Permission [%s, %s, %s]" % (self._right, self._target_type, self._target_uuid)
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+        return isinstance(other, self.__class__) and \
+            (self._right, self._target_type, self._target_uuid) == \
+            (other._right, other._target_type, other._target_uuid)
     
     def get_right(self):
         return self._right
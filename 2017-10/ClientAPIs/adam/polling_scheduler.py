@@ -0,0 +1,216 @@
+"""
+    polling_scheduler.py
+
+    Decides how long to wait between polls of the state of a run's batches. Each poll
+    lists every batch of the project, so polls are spaced out further and further while
+    nothing changes, and brought forward only when batches are expected to finish,
+    going by how long the batches of the run that have finished took to be picked up
+    and to run.
+"""
+
+from collections import deque
+from datetime import datetime
+import calendar
+import heapq
+import time
+
+_FINAL_STATES = ['COMPLETED', 'FAILED']
+
+def _parse_timestamp(time_str):
+    """Returns the given UTC time (str, as in a state summary) as seconds since the Unix
+    epoch, or None if there is none or it can't be parsed."""
+    if time_str is None:
+        return None
+    for format in ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S']:
+        try:
+            parsed = datetime.strptime(time_str.rstrip('Z'), format)
+        except ValueError:
+            continue
+        return calendar.timegm(parsed.timetuple()) + parsed.microsecond * 1e-6
+    return None
+
+def _first_after(heap, batches, cutoff):
+    """Returns the earliest start time after cutoff in a heap of (start time, uuid) of
+    batches still in the given dict, dropping the entries before it for good."""
+    while heap:
+        start_time, uuid = heap[0]
+        if uuid in batches and start_time > cutoff:
+            return start_time
+        heapq.heappop(heap)
+    return None
+
+def _median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+class PollingScheduler(object):
+    """Schedules polls of a run's batches.
+
+    After every poll, the state summaries of the batches polled are passed to observe(),
+    and get_next_interval() gives the time to wait before the next poll. While no batch
+    finishes, the interval grows by backoff from min_interval up to max_interval. It is
+    shortened, down to min_interval, to the time at which the next batch is expected to
+    finish. Completion times are predicted from the create, execute and complete times
+    of the batches that have finished so far: a RUNNING batch is expected to take the
+    typical run duration from its execute time, and a PENDING batch the typical queue
+    delay and run duration from its create time. Once a batch's predicted completion has
+    passed it is no longer predicted, so a batch that runs long doesn't bring every poll
+    forward.
+
+    Every RUNNING batch is expected to take as long as every other, so the next one
+    expected to finish is the one that started first, and likewise for PENDING batches.
+    Both are kept in heaps by start time, so the work per poll depends on the number
+    of batches that changed state, not on the number of batches.
+
+    Times in state summaries come from the server's clock. Because a batch can't have
+    finished after the poll that saw it finished, the client's clock is corrected for
+    being behind the server's. Not thread-safe.
+    """
+
+    # Default bounds on the interval between polls, in seconds, and the factor it grows
+    # by on every poll at which no batch finished.
+    MIN_INTERVAL = 0.25
+    MAX_INTERVAL = 30
+    BACKOFF = 2
+
+    # Number of recently finished batches whose durations predictions are based on.
+    HISTORY = 100
+
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 backoff=BACKOFF, clock=time.time):
+        """
+        Args:
+            min_interval (float): shortest time to wait between polls, in seconds.
+            max_interval (float): longest time to wait between polls, in seconds.
+            backoff (float): factor the interval grows by while no batch finishes.
+            clock (function): returns the current time in seconds since the Unix epoch.
+
+        Raises:
+            ValueError if the intervals or backoff are out of range
+        """
+        if min_interval < 0 or max_interval < min_interval or backoff < 1:
+            raise ValueError("Invalid polling intervals [%s, %s] or backoff %s" % (
+                min_interval, max_interval, backoff))
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._clock = clock
+
+        # Execute times of RUNNING batches and create times of PENDING batches, by uuid,
+        # and uuids of the batches seen in a final state.
+        self._running = {}
+        self._pending = {}
+        self._finished = set()
+        # (execute time, uuid) of RUNNING batches and (create time, uuid) of PENDING
+        # batches, as heaps. Entries of batches that have since changed state are left
+        # in place and skipped when they come to the top.
+        self._running_heap = []
+        self._pending_heap = []
+        self._run_durations = deque(maxlen=self.HISTORY)
+        self._queue_delays = deque(maxlen=self.HISTORY)
+        # How far the server's clock is known to be ahead of the client's.
+        self._clock_offset = 0
+        # Interval between polls before predictions are taken into account.
+        self._interval = None
+
+    def __repr__(self):
+        return "Polling scheduler [%s running, %s pending, %s finished]" % (
+            len(self._running), len(self._pending), len(self._finished))
+
+    def get_expected_run_duration(self):
+        """Typical time (s) from execution to completion of the batches finished so far,
+        or None if none have finished."""
+        return _median(self._run_durations) if self._run_durations else None
+
+    def get_expected_queue_delay(self):
+        """Typical time (s) from creation to execution of the batches finished so far,
+        or None if none have finished."""
+        return _median(self._queue_delays) if self._queue_delays else None
+
+    def observe(self, state_summaries, now=None):
+        """Records the outcome of a poll.
+
+        Args:
+            state_summaries (iterable<StateSummary>): summaries from the poll of the
+                batches polled. It's enough to pass the ones that changed since the
+                last poll.
+            now (float): time of the poll, by the clock. Defaults to now.
+        """
+        if now is None:
+            now = self._clock()
+        finished = 0
+        for summary in state_summaries:
+            uuid = summary.get_uuid()
+            calc_state = summary.get_calc_state()
+            if calc_state in _FINAL_STATES:
+                if uuid in self._finished:
+                    continue
+                self._finished.add(uuid)
+                self._running.pop(uuid, None)
+                self._pending.pop(uuid, None)
+                finished += 1
+
+                create_time = _parse_timestamp(summary.get_create_time())
+                execute_time = _parse_timestamp(summary.get_execute_time())
+                complete_time = _parse_timestamp(summary.get_complete_time())
+                if execute_time is not None and complete_time is not None:
+                    self._run_durations.append(complete_time - execute_time)
+                if create_time is not None and execute_time is not None:
+                    self._queue_delays.append(execute_time - create_time)
+                if complete_time is not None:
+                    self._clock_offset = max(self._clock_offset, complete_time - now)
+            elif calc_state == 'RUNNING':
+                if uuid not in self._running:
+                    self._pending.pop(uuid, None)
+                    execute_time = _parse_timestamp(summary.get_execute_time())
+                    self._running[uuid] = execute_time
+                    if execute_time is not None:
+                        heapq.heappush(self._running_heap, (execute_time, uuid))
+            elif uuid not in self._pending:
+                create_time = _parse_timestamp(summary.get_create_time())
+                self._pending[uuid] = create_time
+                if create_time is not None:
+                    heapq.heappush(self._pending_heap, (create_time, uuid))
+
+        if finished > 0 or self._interval is None:
+            self._interval = self._min_interval
+        else:
+            self._interval = min(self._interval * self._backoff, self._max_interval)
+
+    def get_expected_completion(self, now=None):
+        """Returns the earliest time (s since the Unix epoch, by the clock) at which a
+        batch that hasn't finished is expected to finish, or None if there is no such
+        prediction that is still to come."""
+        if now is None:
+            now = self._clock()
+        run_duration = self.get_expected_run_duration()
+        if run_duration is None:
+            return None
+        server_now = now + self._clock_offset
+
+        earliest = None
+        cutoff = server_now - run_duration
+        execute_time = _first_after(self._running_heap, self._running, cutoff)
+        if execute_time is not None:
+            earliest = execute_time + run_duration
+
+        queue_delay = self.get_expected_queue_delay()
+        if queue_delay is not None:
+            create_time = _first_after(self._pending_heap, self._pending,
+                                       cutoff - queue_delay)
+            if create_time is not None:
+                completion = create_time + queue_delay + run_duration
+                if earliest is None or completion < earliest:
+                    earliest = completion
+
+        return earliest - self._clock_offset if earliest is not None else None
+
+    def get_next_interval(self, now=None):
+        """Returns the time (s) to wait before the next poll."""
+        if now is None:
+            now = self._clock()
+        interval = self._interval if self._interval is not None else self._min_interval
+        expected = self.get_expected_completion(now)
+        if expected is not None:
+            interval = min(interval, expected - now)
+        return max(interval, self._min_interval)
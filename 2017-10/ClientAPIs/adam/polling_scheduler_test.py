@@ -0,0 +1,111 @@
+from adam.batch import StateSummary
+from adam.polling_scheduler import PollingScheduler
+import unittest
+
+# Seconds since the Unix epoch of 2017-10-04T00:00:00Z.
+T0 = 1507075200
+
+def summary(uuid, calc_state, create=None, execute=None, complete=None):
+    def format_time(seconds):
+        if seconds is None:
+            return None
+        return '2017-10-04T00:%02d:%06.3fZ' % (seconds // 60, seconds % 60)
+    return StateSummary({'uuid': uuid, 'calc_state': calc_state,
+                         'create_time': format_time(create),
+                         'execute_time': format_time(execute),
+                         'complete_time': format_time(complete)})
+
+class PollingSchedulerTest(unittest.TestCase):
+    """Unit tests for polling scheduler.
+
+    """
+
+    def test_backs_off_while_nothing_finishes(self):
+        scheduler = PollingScheduler(min_interval=1, max_interval=5, backoff=2)
+        self.assertEqual(1, scheduler.get_next_interval(T0))
+        intervals = []
+        for i in range(5):
+            scheduler.observe([summary('a', 'PENDING', create=0)], T0 + i)
+            intervals.append(scheduler.get_next_interval(T0 + i))
+        self.assertEqual([1, 2, 4, 5, 5], intervals)
+
+        # A batch finishing resets the backoff.
+        scheduler.observe([summary('a', 'COMPLETED')], T0 + 10)
+        self.assertEqual(1, scheduler.get_next_interval(T0 + 10))
+
+    def test_predicts_completion_of_running_batches(self):
+        scheduler = PollingScheduler(min_interval=1, max_interval=60, backoff=2)
+        scheduler.observe([summary('a', 'COMPLETED', create=0, execute=2, complete=12),
+                           summary('b', 'RUNNING', create=0, execute=5),
+                           summary('c', 'RUNNING', create=0, execute=8)], T0 + 12)
+        self.assertEqual(10, scheduler.get_expected_run_duration())
+        self.assertEqual(2, scheduler.get_expected_queue_delay())
+        self.assertAlmostEqual(T0 + 15, scheduler.get_expected_completion(T0 + 12))
+
+        # Idle polls back off, but not past the next expected completion.
+        for i in range(4):
+            scheduler.observe([], T0 + 12)
+        self.assertAlmostEqual(3, scheduler.get_next_interval(T0 + 12))
+        self.assertAlmostEqual(1, scheduler.get_next_interval(T0 + 14.5))
+
+        # Once b is overdue, c is the next expected to finish.
+        self.assertAlmostEqual(T0 + 18, scheduler.get_expected_completion(T0 + 16))
+        # And once every prediction has passed, backoff takes over again.
+        self.assertIsNone(scheduler.get_expected_completion(T0 + 19))
+        self.assertEqual(16, scheduler.get_next_interval(T0 + 19))
+
+    def test_predicts_completion_of_pending_batches(self):
+        scheduler = PollingScheduler(min_interval=1, max_interval=60)
+        scheduler.observe([summary('a', 'COMPLETED', create=0, execute=2, complete=12),
+                           summary('b', 'PENDING', create=10)], T0 + 12)
+        self.assertAlmostEqual(T0 + 22, scheduler.get_expected_completion(T0 + 12))
+
+        # Once it runs, its execute time is used instead.
+        scheduler.observe([summary('b', 'RUNNING', create=10, execute=11)], T0 + 12)
+        self.assertAlmostEqual(T0 + 21, scheduler.get_expected_completion(T0 + 12))
+
+    def test_finished_batches_are_not_predicted(self):
+        scheduler = PollingScheduler(min_interval=1, max_interval=60)
+        scheduler.observe([summary('a', 'COMPLETED', create=0, execute=0, complete=10),
+                           summary('b', 'RUNNING', create=0, execute=5),
+                           summary('c', 'RUNNING', create=0, execute=8)], T0 + 10)
+        self.assertAlmostEqual(T0 + 15, scheduler.get_expected_completion(T0 + 10))
+        scheduler.observe([summary('b', 'COMPLETED', create=0, execute=5, complete=15)],
+                          T0 + 15)
+        self.assertAlmostEqual(T0 + 18, scheduler.get_expected_completion(T0 + 15))
+
+    def test_client_clock_behind_server(self):
+        scheduler = PollingScheduler(min_interval=1, max_interval=60)
+        # The client's clock is 100 s behind: it sees a batch finish at T0 + 12 at
+        # what it thinks is T0 - 88.
+        scheduler.observe([summary('a', 'COMPLETED', create=0, execute=2, complete=12),
+                           summary('b', 'RUNNING', create=0, execute=10)], T0 - 88)
+        self.assertAlmostEqual(T0 - 80, scheduler.get_expected_completion(T0 - 88))
+        for i in range(4):
+            scheduler.observe([], T0 - 88)
+        self.assertAlmostEqual(8, scheduler.get_next_interval(T0 - 88))
+
+    def test_finished_batches_are_counted_once(self):
+        scheduler = PollingScheduler(min_interval=1, max_interval=60)
+        done = summary('a', 'COMPLETED', create=0, execute=2, complete=12)
+        scheduler.observe([done], T0 + 12)
+        scheduler.observe([done], T0 + 13)
+        scheduler.observe([done], T0 + 14)
+        self.assertEqual(4, scheduler.get_next_interval(T0 + 14))
+
+    def test_summaries_without_times(self):
+        scheduler = PollingScheduler(min_interval=1, max_interval=60)
+        scheduler.observe([StateSummary({'uuid': 'a', 'calc_state': 'COMPLETED'}),
+                           StateSummary({'uuid': 'b', 'calc_state': 'RUNNING'})], T0)
+        self.assertIsNone(scheduler.get_expected_run_duration())
+        self.assertIsNone(scheduler.get_expected_completion(T0))
+        self.assertEqual(1, scheduler.get_next_interval(T0))
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            PollingScheduler(min_interval=2, max_interval=1)
+        with self.assertRaises(ValueError):
+            PollingScheduler(backoff=0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,8 @@ from datetime import datetime
 from tabulate import tabulate
 
 class Project(object):
+    __slots__ = ('_uuid', '_parent', '_name', '_description')
+    
     def __init__(self, uuid, parent=None, name=None, description=None):
         self._uuid = uuid
         self._parent = parent
@@ -55,7 +57,9 @@ class Projects(object):
         return projects
         
     def print_projects(self):
-        projects = self._get_projects()
+        # Copy before truncating, since responses may be shared with other callers
+        # (e.g. through a CoalescingRestProxy).
+        projects = [dict(p) for p in self._get_projects()]
         
         for p in projects:
             if len(p['description']) > 50:
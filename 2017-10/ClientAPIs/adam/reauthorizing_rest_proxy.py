@@ -0,0 +1,143 @@
+"""
+    reauthorizing_rest_proxy.py
+
+    Rest proxy that keeps long runs authorized. Sessions can expire in the middle of a
+    run that takes hours, after which every call fails with an org.apache.shiro.authc.*
+    error. Instead of letting the run die, the session is re-established once and the
+    failed calls are sent again.
+"""
+
+from adam.auth import is_auth_error
+from adam.rest_proxy import RestProxy
+from adam.rest_proxy import _add_token_to_path
+
+import threading
+
+class ReauthorizingRestProxy(RestProxy):
+    """ Rest proxy implementation that wraps another rest proxy and adds the
+    authorization token to every call, like AuthorizingRestProxy. Safe to use from many
+    threads at once.
+
+    When a call fails with an authentication error, the token is re-authorized with the
+    given Auth object and the call is sent again with the resulting token. If many
+    threads see the error at once, only one of them re-authorizes and the others wait
+    for it and then resend their calls.
+
+    DELETE responses carry no body to tell an authentication error from any other
+    error, so when a DELETE fails with a 503 the token it was sent with is checked, and
+    re-authorization is only triggered if that token's session has expired.
+    """
+
+    # Number of times authorization is attempted each time a session needs to be
+    # re-established. Session expired errors often clear up on the second try.
+    AUTHORIZATION_ATTEMPTS = 2
+
+    def __init__(self, rest_proxy, auth, token_source=None, max_retries=1):
+        """
+        Args:
+            rest_proxy (RestProxy): proxy to send requests through.
+            auth (Auth): Auth object that has already authorized the token to use.
+            token_source (func): returns the token to re-authorize with. Defaults to
+                the token auth held when this proxy was created, which is enough when
+                the server has only dropped the session.
+            max_retries (int): maximum number of times one call is sent again after
+                an authentication error.
+        """
+        self._rest_proxy = rest_proxy
+        self._auth = auth
+        self._token = auth.get_token()
+        initial_token = self._token
+        self._token_source = token_source or (lambda: initial_token)
+        self._max_retries = max_retries
+
+        # Incremented every time the token is re-authorized, so that threads that
+        # failed with an older token know not to re-authorize again.
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._reauthorization_lock = threading.Lock()
+        self._reauthorizations = 0
+        self._last_error = None
+
+    def __repr__(self):
+        return "Reauthorizing rest proxy [%s reauthorizations]" % (self._reauthorizations)
+
+    def get_token(self):
+        return self._token
+
+    def get_reauthorization_count(self):
+        """Number of times the token has been re-authorized."""
+        return self._reauthorizations
+
+    def get_last_error(self):
+        """Why the last re-authorization that failed did so (str), or None if none
+        has failed."""
+        return self._last_error
+
+    def _current(self):
+        with self._lock:
+            return self._token, self._generation
+
+    def _reauthorize(self, generation):
+        """Re-authorizes unless another thread already did so since the given
+        generation of the token.
+
+        Returns:
+            Whether a call that failed with that generation should be sent again.
+        """
+        with self._reauthorization_lock:
+            if self._generation != generation:
+                return True
+
+            token = self._token_source()
+            for i in range(self.AUTHORIZATION_ATTEMPTS):
+                try:
+                    authorized = self._auth.authorize(token)
+                except RuntimeError as e:
+                    # The server failed for some other reason. The call's own response
+                    # says more about that than anything a retry would.
+                    self._last_error = str(e)
+                    return False
+                if authorized:
+                    with self._lock:
+                        self._token = self._auth.get_token()
+                        self._generation += 1
+                        self._reauthorizations += 1
+                    return True
+
+            self._last_error = "Token not accepted after %s attempts" % (
+                self.AUTHORIZATION_ATTEMPTS)
+            return False
+
+    def _session_expired(self, token):
+        """Checks whether the session of the given token has expired, for responses
+        that don't say why they failed."""
+        code, response = self._rest_proxy.get(_add_token_to_path('/me', token))
+        if code == 200:
+            return not response.get('loggedIn', False)
+        return is_auth_error(code, response)
+
+    def post(self, path, data_dict):
+        for attempt in range(self._max_retries + 1):
+            token, generation = self._current()
+            data_dict['token'] = token
+            code, response = self._rest_proxy.post(path, data_dict)
+            if not is_auth_error(code, response) or attempt == self._max_retries or \
+                    not self._reauthorize(generation):
+                return code, response
+
+    def get(self, path):
+        for attempt in range(self._max_retries + 1):
+            token, generation = self._current()
+            code, response = self._rest_proxy.get(_add_token_to_path(path, token))
+            if not is_auth_error(code, response) or attempt == self._max_retries or \
+                    not self._reauthorize(generation):
+                return code, response
+
+    def delete(self, path):
+        for attempt in range(self._max_retries + 1):
+            token, generation = self._current()
+            code = self._rest_proxy.delete(_add_token_to_path(path, token))
+            if code != 503 or attempt == self._max_retries or \
+                    not self._session_expired(token) or \
+                    not self._reauthorize(generation):
+                return code
@@ -0,0 +1,132 @@
+from adam.auth import Auth
+from adam.reauthorizing_rest_proxy import ReauthorizingRestProxy
+from adam.rest_proxy import RestRequests
+from adam.rest_proxy import _RestProxyForTest
+from adam.stand_in_server import StandInServer
+from multiprocessing.dummy import Pool as ThreadPool
+import unittest
+
+EXPIRED = {'error': {'code': 503,
+                     'message': 'org.apache.shiro.authc.ExpiredCredentialsException'}}
+
+class ReauthorizingRestProxyTest(unittest.TestCase):
+    """Unit tests for reauthorizing rest proxy.
+
+    """
+
+    def authorized(self, rest, token):
+        rest.expect_get('/me?token=' + token, 200, {'loggedIn': True, 'email': 'a@b'})
+        auth = Auth(rest)
+        self.assertTrue(auth.authorize(token))
+        return auth
+
+    def test_adds_token(self):
+        rest = _RestProxyForTest()
+        reauthorizing = ReauthorizingRestProxy(rest, self.authorized(rest, 'my_token'))
+
+        rest.expect_get('/test?a=1&token=my_token', 200, {'b': 2})
+        self.assertEqual((200, {'b': 2}), reauthorizing.get('/test?a=1'))
+        rest.expect_post('/test', lambda data: data['token'] == 'my_token', 200, {})
+        reauthorizing.post('/test', {})
+        rest.expect_delete('/test?token=my_token', 204)
+        self.assertEqual(204, reauthorizing.delete('/test'))
+
+    def test_replays_after_reauthorizing(self):
+        rest = _RestProxyForTest()
+        reauthorizing = ReauthorizingRestProxy(rest, self.authorized(rest, 't1'),
+                                               token_source=lambda: 't2')
+
+        rest.expect_post('/test', lambda data: data['token'] == 't1', 503, EXPIRED)
+        rest.expect_get('/me?token=t2', 200, {'loggedIn': True, 'email': 'a@b'})
+        rest.expect_post('/test', lambda data: data['token'] == 't2', 200, {'b': 2})
+        self.assertEqual((200, {'b': 2}), reauthorizing.post('/test', {}))
+        self.assertEqual('t2', reauthorizing.get_token())
+        self.assertEqual(1, reauthorizing.get_reauthorization_count())
+
+    def test_retries_authorization_once(self):
+        rest = _RestProxyForTest()
+        reauthorizing = ReauthorizingRestProxy(rest, self.authorized(rest, 't1'))
+
+        rest.expect_get('/test?token=t1', 503, EXPIRED)
+        rest.expect_get('/me?token=t1', 503, EXPIRED)
+        rest.expect_get('/me?token=t1', 200, {'loggedIn': True, 'email': 'a@b'})
+        rest.expect_get('/test?token=t1', 200, {})
+        self.assertEqual((200, {}), reauthorizing.get('/test'))
+
+    def test_gives_up(self):
+        rest = _RestProxyForTest()
+        reauthorizing = ReauthorizingRestProxy(rest, self.authorized(rest, 't1'))
+
+        rest.expect_get('/test?token=t1', 503, EXPIRED)
+        rest.expect_get('/me?token=t1', 503, EXPIRED)
+        rest.expect_get('/me?token=t1', 503, EXPIRED)
+        self.assertEqual((503, EXPIRED), reauthorizing.get('/test'))
+        self.assertEqual("Token not accepted after 2 attempts",
+                         reauthorizing.get_last_error())
+
+    def test_other_errors_are_not_replayed(self):
+        rest = _RestProxyForTest()
+        reauthorizing = ReauthorizingRestProxy(rest, self.authorized(rest, 't1'))
+
+        rest.expect_get('/test?token=t1', 404, {'error': {'message': 'Not found'}})
+        self.assertEqual(404, reauthorizing.get('/test')[0])
+
+    def test_server_errors_while_reauthorizing(self):
+        rest = _RestProxyForTest()
+        reauthorizing = ReauthorizingRestProxy(rest, self.authorized(rest, 't1'))
+
+        rest.expect_get('/test?token=t1', 503, EXPIRED)
+        rest.expect_get('/me?token=t1', 500, {'error': {'message': 'Backend error'}})
+        self.assertEqual((503, EXPIRED), reauthorizing.get('/test'))
+        self.assertIn('Backend error', reauthorizing.get_last_error())
+        self.assertEqual(0, reauthorizing.get_reauthorization_count())
+
+    def test_delete_replayed_only_after_expiry(self):
+        rest = _RestProxyForTest()
+        reauthorizing = ReauthorizingRestProxy(rest, self.authorized(rest, 't1'),
+                                               token_source=lambda: 't2')
+
+        # The session is still valid, so the 503 is some other error.
+        rest.expect_delete('/test?token=t1', 503)
+        rest.expect_get('/me?token=t1', 200, {'loggedIn': True, 'email': 'a@b'})
+        self.assertEqual(503, reauthorizing.delete('/test'))
+        self.assertEqual(0, reauthorizing.get_reauthorization_count())
+
+        rest.expect_delete('/test?token=t1', 503)
+        rest.expect_get('/me?token=t1', 503, EXPIRED)
+        rest.expect_get('/me?token=t2', 200, {'loggedIn': True, 'email': 'a@b'})
+        rest.expect_delete('/test?token=t2', 204)
+        self.assertEqual(204, reauthorizing.delete('/test'))
+        self.assertEqual(1, reauthorizing.get_reauthorization_count())
+
+class ReauthorizingRestProxyServerTest(unittest.TestCase):
+    """Unit tests for reauthorizing rest proxy against a local stand-in server.
+
+    """
+
+    def setUp(self):
+        self.server = StandInServer(tokens=['t1']).start()
+        self.rest = RestRequests(self.server.get_url())
+
+    def tearDown(self):
+        self.rest.close()
+        self.server.stop()
+
+    def test_reauthorizes_once_for_all_threads(self):
+        auth = Auth(self.rest)
+        self.assertTrue(auth.authorize('t1'))
+        reauthorizing = ReauthorizingRestProxy(self.rest, auth, token_source=lambda: 't2')
+        batch = self.server.add_batch()
+
+        self.server.expire_token('t1')
+        self.server.add_token('t2')
+        pool = ThreadPool(8)
+        codes = pool.map(lambda i: reauthorizing.get('/batch/' + batch)[0], range(40))
+        pool.close()
+        pool.join()
+
+        self.assertEqual([200] * 40, codes)
+        self.assertEqual(1, reauthorizing.get_reauthorization_count())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+    recording_rest_proxy.py
+
+    Captures every request and response of a real run to a cassette file, and serves
+    them back later without a server. Replaying a cassette with no delay measures the
+    client-side overhead of Batches and BatchRunManager with the network taken out.
+
+    Implementations:
+        - RecordingRestProxy: wraps a RestProxy and writes all calls to a cassette.
+        - ReplayRestProxy: answers calls from a cassette.
+
+    A cassette is a file of JSON lines, one per call, each with 'method', 'path' and
+    'data' (POST body) with any auth token removed, 'code', 'response', 'start'
+    (seconds since recording started) and 'duration' (seconds).
+"""
+
+from adam.rest_proxy import RestProxy
+from adam.rest_proxy import RestRequests
+from adam.rest_proxy import _encode_json_stream
+from adam.rest_proxy import _remove_token_from_path
+
+from collections import deque
+import hashlib
+import json
+import re
+import threading
+import time
+
+# OPMs embed the time they were generated, which differs between a recording and a
+# replay of the same run. Matched in JSON, where the line break is escaped.
+_CREATION_DATE_PATTERN = re.compile(r'CREATION_DATE = [^\\]*\\n')
+
+def _strip_token(data_dict):
+    # JsonArrayStreams are kept as they are, so that large bodies are only ever
+    # encoded a piece at a time.
+    if data_dict is None or not 'token' in data_dict:
+        return data_dict
+    return {k: v for k, v in data_dict.items() if k != 'token'}
+
+def _fingerprint(data_dict):
+    """Digest of a POST body that ignores the token and OPM creation dates, so that
+    the same submission made at a different time matches."""
+    if data_dict is None:
+        return None
+    data_dict = _strip_token(data_dict)
+    digest = hashlib.sha1()
+    # Chunks end between array elements, so no creation date is split between two.
+    for chunk in _encode_json_stream({k: data_dict[k] for k in sorted(data_dict)},
+                                     RestRequests.STREAM_CHUNK_SIZE):
+        digest.update(_CREATION_DATE_PATTERN.sub('', chunk.decode('utf-8')).encode('utf-8'))
+    return digest.hexdigest()
+
+class RecordingRestProxy(RestProxy):
+    """ Rest proxy implementation that wraps another rest proxy and records every call
+    made through it to a cassette file. Safe to use from many threads at once. Calls
+    are written as they complete, so the cassette is usable even if the run dies.
+
+    """
+
+    def __init__(self, rest_proxy, cassette_path):
+        self._rest_proxy = rest_proxy
+        self._file = open(cassette_path, 'w')
+        self._lock = threading.Lock()
+        self._origin = time.monotonic()
+        self._count = 0
+
+    def __repr__(self):
+        return "Recording rest proxy [%s calls]" % (self._count)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _record(self, method, path, data_dict, start, code, response):
+        end = time.monotonic()
+        head = json.dumps({'method': method, 'path': _remove_token_from_path(path)})
+        tail = json.dumps({'code': code,
+                           'response': response,
+                           'start': start - self._origin,
+                           'duration': end - start})
+        data_dict = _strip_token(data_dict)
+        with self._lock:
+            # The body is written a piece at a time, so that a streamed submission is
+            # never held in memory in full.
+            self._file.write(head[:-1] + ', "data": ')
+            if data_dict is None:
+                self._file.write('null')
+            else:
+                for chunk in _encode_json_stream(data_dict, RestRequests.STREAM_CHUNK_SIZE):
+                    self._file.write(chunk.decode('utf-8'))
+            self._file.write(', ' + tail[1:] + '\n')
+            self._file.flush()
+            self._count += 1
+
+    def post(self, path, data_dict):
+        start = time.monotonic()
+        code, response = self._rest_proxy.post(path, data_dict)
+        self._record('POST', path, data_dict, start, code, response)
+        return code, response
+
+    def get(self, path):
+        start = time.monotonic()
+        code, response = self._rest_proxy.get(path)
+        self._record('GET', path, None, start, code, response)
+        return code, response
+
+    def delete(self, path):
+        start = time.monotonic()
+        code = self._rest_proxy.delete(path)
+        self._record('DELETE', path, None, start, code, None)
+        return code
+
+class ReplayRestProxy(RestProxy):
+    """ Rest proxy implementation that answers calls from a cassette written by a
+    RecordingRestProxy. Safe to use from many threads at once.
+
+    Calls need not arrive in the order they were recorded, so multi-threaded runs can
+    be replayed. A call is answered by the earliest unused recording of the same
+    method and path (ignoring the token) and, for POSTs, the same body (ignoring the
+    token and OPM creation dates). A POST whose body matches nothing falls back to the
+    earliest unused recording with the same method and path. Once all recordings for a
+    call are used up, the last of them is repeated, so e.g. a replay that polls more
+    often than the recording did sees the final state over and over.
+    """
+
+    def __init__(self, cassette_path, delay_factor=0.0):
+        """
+        Args:
+            cassette_path (str): cassette file to replay.
+            delay_factor (float): each call takes its recorded duration times this.
+                0 answers immediately, 1 replays at recorded speed.
+        """
+        self._delay_factor = delay_factor
+        self._entries = []
+        with open(cassette_path, 'r') as f:
+            for line in f:
+                if line.strip() != '':
+                    self._entries.append(json.loads(line))
+        self._used = [False] * len(self._entries)
+
+        # Queues of entry indices, by exact match and by method and path only.
+        self._by_body = {}
+        self._by_path = {}
+        for i in range(len(self._entries)):
+            e = self._entries[i]
+            self._by_body.setdefault((e['method'], e['path'], _fingerprint(e['data'])),
+                                     deque()).append(i)
+            self._by_path.setdefault((e['method'], e['path']), deque()).append(i)
+        # Last entry handed out for each method and path.
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "Replay rest proxy [%s of %s calls used]" % (
+            sum(self._used), len(self._entries))
+
+    def get_unused_count(self):
+        """Number of recorded calls that have not been replayed yet."""
+        with self._lock:
+            return len(self._used) - sum(self._used)
+
+    def _pop_unused(self, queue):
+        while queue:
+            i = queue.popleft()
+            if not self._used[i]:
+                return i
+        return None
+
+    def _find(self, method, path, data_dict):
+        path = _remove_token_from_path(path)
+        with self._lock:
+            i = self._pop_unused(self._by_body.get(
+                (method, path, _fingerprint(data_dict)), deque()))
+            if i is None:
+                i = self._pop_unused(self._by_path.get((method, path), deque()))
+            if i is None:
+                i = self._last.get((method, path))
+                if i is None:
+                    raise AssertionError("No recorded %s to %s" % (method, path))
+            self._used[i] = True
+            self._last[(method, path)] = i
+        entry = self._entries[i]
+        if self._delay_factor > 0:
+            time.sleep(entry['duration'] * self._delay_factor)
+        return entry
+
+    def post(self, path, data_dict):
+        entry = self._find('POST', path, data_dict)
+        return entry['code'], entry['response']
+
+    def get(self, path):
+        entry = self._find('GET', path, None)
+        return entry['code'], entry['response']
+
+    def delete(self, path):
+        return self._find('DELETE', path, None)['code']
@@ -0,0 +1,132 @@
+from adam.batch import Batch
+from adam.batch import Batches
+from adam.batch import OpmParams
+from adam.batch import PropagationParams
+from adam.batch_run_manager import BatchRunManager
+from adam.polling_scheduler import PollingScheduler
+from adam.recording_rest_proxy import RecordingRestProxy
+from adam.recording_rest_proxy import ReplayRestProxy
+from adam.rest_proxy import AuthorizingRestProxy
+from adam.rest_proxy import JsonArrayStream
+from adam.rest_proxy import _RestProxyForTest
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+def new_batch(x):
+    return Batch(PropagationParams({
+        'start_time': 'start', 'end_time': 'end', 'project_uuid': 'p1'
+    }), OpmParams({
+        'epoch': 'epoch', 'state_vector': [x, 2, 3, 4, 5, 6]
+    }))
+
+class RecordingRestProxyTest(unittest.TestCase):
+    """Unit tests for recording and replay rest proxies.
+
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cassette = os.path.join(self.directory, 'cassette.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record_run(self, num_batches):
+        rest = _RestProxyForTest()
+        recorder = RecordingRestProxy(rest, self.cassette)
+        batches = Batches(AuthorizingRestProxy(recorder, 'secret'))
+
+        rest.expect_post('/batches', lambda data: True, 200, {'requests': [
+            {'uuid': 'b%s' % (i), 'calc_state': 'PENDING', 'parts_count': 1}
+            for i in range(num_batches)]})
+        rest.expect_get('/batch?project_uuid=p1&token=secret', 200, {'items': [
+            {'uuid': 'b%s' % (i), 'calc_state': 'RUNNING', 'parts_count': 1}
+            for i in range(num_batches)]})
+        rest.expect_get('/batch?project_uuid=p1&token=secret', 200, {'items': [
+            {'uuid': 'b%s' % (i), 'calc_state': 'COMPLETED', 'parts_count': 1}
+            for i in range(num_batches)]})
+        for i in range(num_batches):
+            rest.expect_get('/batch/b%s/1?token=secret' % (i), 200,
+                {'part_index': 1, 'calc_state': 'COMPLETED', 'stk_ephemeris': str(i)})
+
+        runs = [new_batch(i) for i in range(num_batches)]
+        BatchRunManager(batches, runs, do_timing=False, multi_threaded=False,
+                        polling_scheduler=PollingScheduler(0, 0)).run()
+        recorder.close()
+        return runs
+
+    def test_recording_removes_token(self):
+        # The authorizing proxy adds the token to POST bodies as well as paths.
+        self.record_run(2)
+        with open(self.cassette, 'r') as f:
+            contents = f.read()
+        self.assertNotIn('secret', contents)
+        entries = [json.loads(line) for line in contents.splitlines()]
+        self.assertEqual(['POST', 'GET', 'GET', 'GET', 'GET'],
+                         [e['method'] for e in entries])
+        self.assertEqual('/batches', entries[0]['path'])
+        self.assertEqual(2, len(entries[0]['data']['requests']))
+
+    def test_multi_threaded_replay(self):
+        num_batches = 20
+        recorded = self.record_run(num_batches)
+
+        replay = ReplayRestProxy(self.cassette)
+        batches = Batches(AuthorizingRestProxy(replay, 'other_token'))
+        runs = [new_batch(i) for i in range(num_batches)]
+        BatchRunManager(batches, runs, do_timing=False, multi_threaded=True,
+                        polling_scheduler=PollingScheduler(0, 0)).run()
+
+        self.assertEqual(0, replay.get_unused_count())
+        for i in range(num_batches):
+            self.assertEqual(recorded[i].get_uuid(), runs[i].get_uuid())
+            self.assertEqual('COMPLETED', runs[i].get_calc_state())
+            self.assertEqual(str(i),
+                runs[i].get_results().get_parts()[0].get_ephemeris())
+
+    def test_replay_matches_post_bodies(self):
+        with open(self.cassette, 'w') as f:
+            for x in [1, 2]:
+                f.write(json.dumps({'method': 'POST', 'path': '/batch',
+                    'data': {'x': x}, 'code': 200, 'response': {'uuid': 'b%s' % x},
+                    'start': 0, 'duration': 0}) + '\n')
+
+        replay = ReplayRestProxy(self.cassette)
+        self.assertEqual((200, {'uuid': 'b2'}), replay.post('/batch', {'x': 2}))
+        self.assertEqual((200, {'uuid': 'b1'}), replay.post('/batch', {'x': 1}))
+        # Nothing left; the last recording for this path is repeated.
+        self.assertEqual((200, {'uuid': 'b1'}), replay.post('/batch', {'x': 3}))
+        with self.assertRaises(AssertionError):
+            replay.get('/batch')
+
+    def test_streamed_post_bodies(self):
+        def stream(creation_date, first):
+            def build(i):
+                return {'opm': 'CCSDS_OPM_VERS = 2.0\nCREATION_DATE = %s\nX = %s\n' % (
+                    creation_date, i)}
+            return JsonArrayStream(list(range(first, first + 3)), build)
+
+        rest = _RestProxyForTest()
+        recorder = RecordingRestProxy(rest, self.cassette)
+        for first in [0, 3]:
+            rest.expect_post('/batches', lambda data: True, 200, {'first': first})
+            recorder.post('/batches', {'requests': stream('2017-10-04 00:00:00', first),
+                                       'token': 'secret'})
+        recorder.close()
+        with open(self.cassette, 'r') as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual({'requests': stream('2017-10-04 00:00:00', 0).to_list()},
+                         entries[0]['data'])
+        self.assertEqual({'first': 0}, entries[0]['response'])
+
+        # The same submissions made later match despite their OPMs' creation dates.
+        replay = ReplayRestProxy(self.cassette)
+        for first in [3, 0]:
+            self.assertEqual((200, {'first': first}), replay.post(
+                '/batches', {'requests': stream('2017-10-05 12:00:00', first)}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,15 +4,157 @@
     Exposes an interface for making calls to the REST API.
     
     Implementations:
-        - RestRequests: makes simple calls to REST API.
+        - RestRequests: makes calls to REST API over pooled keep-alive connections.
         - AuthorizingRestProxy: wraps a RestProxy and adds the auth token to all calls.
+        - LoggingRestProxy: wraps a RestProxy and prints timing and size of all calls.
+          See MetricsRestProxy for a structured alternative suited to large runs.
         - _RestProxyForTest: mocks methods and exposes extra functionality to add expectations.
+        - _ConcurrentRestProxyForTest: like _RestProxyForTest, but thread-safe and
+          independent of call order.
 """
 
+import gzip
 import json
 import requests
+import threading
+import time
 import urllib
 import datetime
+import zlib
+
+# Sizes of the last request and response sent by RestRequests on each thread.
+_transfer_sizes = threading.local()
+
+def get_last_transfer_sizes():
+    """Returns the sizes of the request and response bodies, in bytes as sent over the
+    wire, of the last call that RestRequests made on the calling thread. Proxies that
+    wrap a RestRequests can use this to report sizes without re-serializing anything.
+
+    Returns:
+        Pair of request and response sizes, or None if no RestRequests call has been
+        made on this thread since clear_last_transfer_sizes() was last called.
+    """
+    return getattr(_transfer_sizes, 'sizes', None)
+
+def clear_last_transfer_sizes():
+    _transfer_sizes.sizes = None
+
+def set_last_transfer_sizes(sizes):
+    """Sets the sizes get_last_transfer_sizes() returns on the calling thread. Proxies
+    that make calls on other threads use this to hand the sizes back to the caller.
+    """
+    _transfer_sizes.sizes = sizes
+
+def _record_transfer_sizes(request_bytes, response):
+    # The Content-Length header reflects the compressed size if the response was
+    # compressed. Fall back to the decoded size for chunked responses.
+    response_bytes = response.headers.get('Content-Length')
+    if response_bytes is None:
+        response_bytes = len(response.content)
+    _transfer_sizes.sizes = (request_bytes, int(response_bytes))
+
+def _add_token_to_path(path, token):
+    parsed = list(urllib.parse.urlparse(path))
+    query = urllib.parse.parse_qs(parsed[4])
+    query['token'] = token
+    # doseq=True is required to avoid very strange encodings of all existing values.
+    # Existing values are parsed as lists by parse_qs, but then the lists are encoded
+    # as strings (like a=%5B%271%27%5D (encoded a=['1']) instead of a=1).
+    parsed[4] = urllib.parse.urlencode(query, doseq=True)
+    return urllib.parse.urlunparse(parsed)
+
+def _remove_token_from_path(path):
+    parsed = list(urllib.parse.urlparse(path))
+    query = urllib.parse.parse_qs(parsed[4])
+    if not 'token' in query:
+        return path
+    del query['token']
+    parsed[4] = urllib.parse.urlencode(query, doseq=True)
+    return urllib.parse.urlunparse(parsed)
+
+# From https://stackoverflow.com/questions/1094841/reusable-library-to-get-human-readable-version-of-file-size
+def _sizeof_fmt(num, suffix='B'):
+    for unit in ['','Ki','Mi','Gi','Ti','Pi','Ei','Zi']:
+        if abs(num) < 1024.0:
+            return "%3.1f%s%s" % (num, unit, suffix)
+        num /= 1024.0
+    return "%.1f%s%s" % (num, 'Yi', suffix)
+
+class JsonArrayStream(object):
+    """A JSON array whose elements are built one at a time, only when they are needed.
+
+    Put one in a POST body in place of a list to keep a large request from ever being
+    held in memory in full. RestRequests encodes and sends the elements one at a time,
+    and anything else that looks at the body sees a read-only sequence whose elements
+    are built again on every access.
+    """
+
+    def __init__(self, items, build_element):
+        """
+        Args:
+            items (list): one item per array element.
+            build_element (func): builds the JSON-serializable element for an item.
+        """
+        self._items = items
+        self._build_element = build_element
+
+    def __repr__(self):
+        return "JSON array stream [%s elements]" % (len(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._build_element(self._items[index])
+
+    def __iter__(self):
+        for item in self._items:
+            yield self._build_element(item)
+
+    def to_list(self):
+        return list(self)
+
+def _has_stream(data_dict):
+    return any(isinstance(v, JsonArrayStream) for v in data_dict.values())
+
+def _encode_json_stream(data_dict, chunk_size):
+    """Generates the JSON encoding of the given POST body in chunks of about
+    chunk_size bytes. The output is identical to json.dumps of the body with any
+    JsonArrayStreams turned into lists.
+    """
+    buffer = []
+    buffered = 0
+    for i, (key, value) in enumerate(data_dict.items()):
+        parts = ['{' if i == 0 else ', ', json.dumps(key), ': ']
+        if isinstance(value, JsonArrayStream):
+            parts.append('[')
+            for j, element in enumerate(value):
+                if j > 0:
+                    parts.append(', ')
+                parts.append(json.dumps(element))
+                buffer.extend(parts)
+                buffered += sum(len(p) for p in parts)
+                parts = []
+                if buffered >= chunk_size:
+                    yield ''.join(buffer).encode('utf-8')
+                    buffer = []
+                    buffered = 0
+            parts.append(']')
+        else:
+            parts.append(json.dumps(value))
+        buffer.extend(parts)
+        buffered += sum(len(p) for p in parts)
+    buffer.append('{}' if len(data_dict) == 0 else '}')
+    yield ''.join(buffer).encode('utf-8')
+
+def _gzip_stream(chunks):
+    # wbits=31 selects the gzip container, as gzip.compress would produce.
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if len(compressed) > 0:
+            yield compressed
+    yield compressor.flush()
 
 class RestProxy(object):
     """Interface for accessing the server
@@ -79,14 +221,7 @@ class AuthorizingRestProxy(RestProxy):
         self._token = token
     
     def _add_token_to_path(self, path):
-        parsed = list(urllib.parse.urlparse(path))
-        query = urllib.parse.parse_qs(parsed[4])
-        query['token'] = self._token
-        # doseq=True is required to avoid very strange encodings of all existing values.
-        # Existing values are parsed as lists by parse_qs, but then the lists are encoded
-        # as strings (like a=%5B%271%27%5D (encoded a=['1']) instead of a=1).
-        parsed[4] = urllib.parse.urlencode(query, doseq=True)
-        return urllib.parse.urlunparse(parsed)
+        return _add_token_to_path(path, self._token)
     
     def post(self, path, data_dict):
         data_dict['token'] = self._token
@@ -109,22 +244,25 @@ class LoggingRestProxy(RestProxy):
     def __init__(self, rest_proxy):
         self._rest_proxy = rest_proxy
 
-    # From https://stackoverflow.com/questions/1094841/reusable-library-to-get-human-readable-version-of-file-size
     def _sizeof_fmt(self, num, suffix='B'):
-        for unit in ['','Ki','Mi','Gi','Ti','Pi','Ei','Zi']:
-            if abs(num) < 1024.0:
-                return "%3.1f%s%s" % (num, unit, suffix)
-            num /= 1024.0
-        return "%.1f%s%s" % (num, 'Yi', suffix)
+        return _sizeof_fmt(num, suffix)
+    
+    def _transfer_size_fmt(self, index):
+        # Sizes are only known when a RestRequests sits underneath this proxy.
+        sizes = get_last_transfer_sizes()
+        if sizes is None:
+            return "unknown"
+        return self._sizeof_fmt(sizes[index])
     
     def post(self, path, data_dict):
         print("--------------------------------------------------------")
         print("| Post to " + path)
+        clear_last_transfer_sizes()
         start = datetime.datetime.now()
         code, response = self._rest_proxy.post(path, data_dict)
         end = datetime.datetime.now()
-        print("|    Request size: " + self._sizeof_fmt(len(json.dumps(data_dict))))
-        print("|    Response size: " + self._sizeof_fmt(len(str(response))))
+        print("|    Request size: " + self._transfer_size_fmt(0))
+        print("|    Response size: " + self._transfer_size_fmt(1))
         print("|    Call duration: " + str(end - start))
         print("--------------------------------------------------------")
         return code, response
@@ -132,10 +270,11 @@ class LoggingRestProxy(RestProxy):
     def get(self, path):
         print("--------------------------------------------------------")
         print("| Get to " + path)
+        clear_last_transfer_sizes()
         start = datetime.datetime.now()
         code, response = self._rest_proxy.get(path)
         end = datetime.datetime.now()
-        print("|    Response size: " + self._sizeof_fmt(len(str(response))))
+        print("|    Response size: " + self._transfer_size_fmt(1))
         print("|    Call duration: " + str(end - start))
         print("--------------------------------------------------------")
         return code, response
@@ -160,18 +299,75 @@ class RestRequests(RestProxy):
     # Default base URL corresponding to ADAM project.
     DEFAULT_BASE_URL = 'https://pro-equinox-162418.appspot.com/_ah/api/adam/v1'
     
-    def __init__(self, base_url=DEFAULT_BASE_URL):
+    # Default number of keep-alive connections held open to the server. Matches the
+    # largest number of threads BatchRunManager uses to talk to the server at once, so
+    # that no thread has to open a fresh connection (and pay for a new TCP+TLS
+    # handshake) because the pool was exhausted.
+    DEFAULT_POOL_SIZE = 10
+    
+    # Request bodies smaller than this are never compressed, since the gzip header and
+    # the work of compressing outweigh the savings.
+    DEFAULT_COMPRESSION_THRESHOLD = 1024
+    
+    # Approximate size of the pieces a streamed request body is sent in.
+    STREAM_CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, base_url=DEFAULT_BASE_URL, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=None, compress_requests=False, accept_compressed=True,
+                 compression_threshold=DEFAULT_COMPRESSION_THRESHOLD):
         """Initialize with the give base URL. All paths for requests will be appended
         to this URL.
         
+        Args:
+            base_url (str): URL that all request paths are appended to.
+            pool_size (int): maximum number of connections kept alive to the server.
+                Calls made from more threads than this still work, but the extra
+                connections are closed instead of being returned to the pool.
+            timeout (float or tuple): passed through to requests. Either a single
+                number of seconds or a (connect timeout, read timeout) pair. None
+                means wait forever.
+            compress_requests (bool): if true, POST bodies of at least
+                compression_threshold bytes are gzipped and sent with
+                Content-Encoding: gzip. Only enable this against servers that accept
+                compressed request bodies.
+            accept_compressed (bool): if true, keep the Accept-Encoding: gzip, deflate
+                that requests sends by default, so the server may compress
+                responses. If false, ask for uncompressed responses instead, e.g. to
+                measure what compression saves. Responses are decompressed
+                transparently either way.
+            compression_threshold (int): minimum size in bytes of a POST body for it
+                to be compressed.
         """
         self._base_url = base_url
+        self._timeout = timeout
+        self._compress_requests = compress_requests
+        self._compression_threshold = compression_threshold
+        
+        # A single session is shared by all threads. The connection pool underneath it
+        # is thread-safe, and sharing it means connections opened by one thread can be
+        # reused by any other.
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        if not accept_compressed:
+            self._session.headers['Accept-Encoding'] = 'identity'
+    
+    def close(self):
+        """Closes all pooled connections. The object may still be used afterwards, in
+        which case new connections are opened as needed.
+        """
+        self._session.close()
 
     def post(self, path, data_dict):
         """Send POST request to the server
 
         This function is used to POST a request to the actual server
 
+        If data_dict contains a JsonArrayStream, the body is encoded and sent a piece
+        at a time with chunked transfer encoding instead of being built up front.
+
         Args:
             path (str): the path to send the POST to
             data_dict (dict): dictionary to be sent in the body of the POST
@@ -179,7 +375,41 @@ class RestRequests(RestProxy):
         Returns:
             Pair of code and json data (actual from server)
         """
-        req = requests.post(self._base_url + path, data=json.dumps(data_dict))
+        if _has_stream(data_dict):
+            return self._post_stream(path, data_dict)
+        body = json.dumps(data_dict).encode('utf-8')
+        headers = {}
+        if self._compress_requests and len(body) >= self._compression_threshold:
+            # Mostly-numeric OPM text compresses very well, and the lowest level gets
+            # nearly all of the size reduction for a fraction of the CPU time.
+            body = gzip.compress(body, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        req = self._session.post(self._base_url + path, data=body, headers=headers,
+            timeout=self._timeout)
+        _record_transfer_sizes(len(body), req)
+        return self._parse_response(req)
+
+    def _post_stream(self, path, data_dict):
+        chunks = _encode_json_stream(data_dict, self.STREAM_CHUNK_SIZE)
+        headers = {}
+        if self._compress_requests:
+            # Streamed bodies are large by design, so they are always compressed.
+            chunks = _gzip_stream(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        sent = [0]
+        
+        def _count(chunks):
+            for chunk in chunks:
+                sent[0] += len(chunk)
+                yield chunk
+        
+        # requests sends generators with Transfer-Encoding: chunked.
+        req = self._session.post(self._base_url + path, data=_count(chunks),
+            headers=headers, timeout=self._timeout)
+        _record_transfer_sizes(sent[0], req)
+        return self._parse_response(req)
+
+    def _parse_response(self, req):
         req_json = {}
         try:
             req_json = req.json()
@@ -199,14 +429,9 @@ class RestRequests(RestProxy):
         Returns:
             Pair of code and json data
         """
-        req = requests.get(self._base_url + path)
-        req_json = {}
-        try:
-            req_json = req.json()
-        except ValueError:
-            # TODO(laura): make the rest server return json responses, always
-            print("Received non-JSON response from API: " + str(req.status_code) + ", " +  str(req.content))
-        return req.status_code, req_json
+        req = self._session.get(self._base_url + path, timeout=self._timeout)
+        _record_transfer_sizes(0, req)
+        return self._parse_response(req)
 
     def delete(self, path):
         """Send DELETE request to the server
@@ -219,7 +444,8 @@ class RestRequests(RestProxy):
         Returns:
             Pair of code and json data
         """
-        req = requests.delete(self._base_url + path)
+        req = self._session.delete(self._base_url + path, timeout=self._timeout)
+        _record_transfer_sizes(0, req)
         return req.status_code
 
 class _RestProxyForTest(RestProxy):
@@ -386,3 +612,118 @@ class _RestProxyForTest(RestProxy):
             raise AssertionError("Expected DELETE request to %s, got %s" % (exp[1], path))
         
         return exp[3]
+
+class _ConcurrentRestProxyForTest(RestProxy):
+    """Mock REST proxy that can be called from many threads at once.
+
+    Unlike _RestProxyForTest, calls may arrive in any order. Each call is answered by the
+    first expectation, in the order they were added, whose method, path and data match
+    and that has not been used up. This lets the multi-threaded paths of e.g.
+    BatchRunManager be tested deterministically.
+
+    """
+    def __init__(self, latency=0):
+        """Initializes attributes
+
+        Args:
+            latency (float): seconds every call takes, to simulate a server and give
+                calls on different threads a chance to overlap.
+        """
+        self._latency = latency
+        # Expectations as lists [method, path, data_func, code, resp_data, remaining]
+        self._expectations = []
+        self._calls = {}
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _expect(self, method, path, data_func, code, resp_data, times):
+        with self._lock:
+            self._expectations.append([method, path, data_func, code, resp_data, times])
+
+    def expect_post(self, path, data_func, code, resp_data, times=1):
+        """Expectations for POST method
+
+        Args:
+            path (str or func): the path to send the POST to, or a function that
+                returns whether a path matches
+            data_func (func): function to validate the input data to send to the POST
+            code (int): return code from POST
+            resp_data (dict): response data returned from POST
+            times (int): number of calls this expectation answers. None answers any
+                number of calls.
+        """
+        self._expect('POST', path, data_func, code, resp_data, times)
+
+    def expect_get(self, path, code, resp_data, times=1):
+        """Expectations for GET method. See expect_post for arguments."""
+        self._expect('GET', path, None, code, resp_data, times)
+
+    def expect_delete(self, path, code, times=1):
+        """Expectations for DELETE method. See expect_post for arguments."""
+        self._expect('DELETE', path, None, code, None, times)
+
+    def get_call_count(self, method=None, path=None):
+        """Number of calls made so far with the given method and path, or in total if
+        they are not given."""
+        with self._lock:
+            return sum(n for (m, p), n in self._calls.items()
+                       if (method is None or m == method) and (path is None or p == path))
+
+    def get_max_in_flight(self):
+        """Largest number of calls that were in progress at the same time."""
+        return self._max_in_flight
+
+    def clear_expectations(self):
+        """Checks that every expectation with a fixed number of calls was used up.
+
+        Raises:
+            AssertionError: some expected calls were not made
+        """
+        with self._lock:
+            missing = [e for e in self._expectations if e[5] is not None and e[5] > 0]
+            self._expectations = []
+        if len(missing) > 0:
+            raise AssertionError("Still expecting calls: %s" % (
+                ["%s %s" % (e[0], e[1]) for e in missing]))
+
+    def _matches(self, exp, method, path, data_dict):
+        if exp[0] != method or exp[5] == 0:
+            return False
+        if callable(exp[1]):
+            if not exp[1](path):
+                return False
+        elif exp[1] != path:
+            return False
+        return exp[2] is None or exp[2](data_dict)
+
+    def _call(self, method, path, data_dict):
+        with self._lock:
+            self._calls[(method, path)] = self._calls.get((method, path), 0) + 1
+            exp = None
+            for e in self._expectations:
+                if self._matches(e, method, path, data_dict):
+                    exp = e
+                    break
+            if exp is None:
+                raise AssertionError("Did not expect %s request to %s" % (method, path))
+            if exp[5] is not None:
+                exp[5] -= 1
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+        if self._latency > 0:
+            time.sleep(self._latency)
+
+        with self._lock:
+            self._in_flight -= 1
+        return exp[3], exp[4]
+
+    def post(self, path, data_dict):
+        return self._call('POST', path, data_dict)
+
+    def get(self, path):
+        return self._call('GET', path, None)
+
+    def delete(self, path):
+        return self._call('DELETE', path, None)[0]
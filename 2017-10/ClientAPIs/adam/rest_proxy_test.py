@@ -1,6 +1,13 @@
 from adam import Auth
 from adam.rest_proxy import _RestProxyForTest
+from adam.rest_proxy import _ConcurrentRestProxyForTest
 from adam.rest_proxy import AuthorizingRestProxy
+from adam.rest_proxy import JsonArrayStream
+from adam.rest_proxy import _encode_json_stream
+from adam.rest_proxy import RestRequests
+from adam.stand_in_server import StandInServer
+from multiprocessing.dummy import Pool as ThreadPool
+import json
 import unittest
 
 class AuthorizingRestProxyTest(unittest.TestCase):
@@ -64,4 +71,195 @@ class AuthorizingRestProxyTest(unittest.TestCase):
         auth_rest.delete("/test")
         
         rest.expect_delete("/test?a=1&b=2&token=my_token", 200)
-        auth_rest.delete("/test?a=1&b=2")
\ No newline at end of file
+        auth_rest.delete("/test?a=1&b=2")
+
+class ConcurrentRestProxyForTestTest(unittest.TestCase):
+    """Unit tests for the thread-safe mock rest proxy.
+
+    """
+
+    def test_any_order(self):
+        rest = _ConcurrentRestProxyForTest()
+        rest.expect_get('/a', 200, {'a': 1})
+        rest.expect_post('/b', lambda data: data['x'] == 2, 200, {'b': 2})
+        rest.expect_post('/b', lambda data: data['x'] == 1, 200, {'b': 1})
+        rest.expect_delete('/c', 204)
+
+        self.assertEqual(204, rest.delete('/c'))
+        self.assertEqual((200, {'b': 1}), rest.post('/b', {'x': 1}))
+        self.assertEqual((200, {'b': 2}), rest.post('/b', {'x': 2}))
+        self.assertEqual((200, {'a': 1}), rest.get('/a'))
+        rest.clear_expectations()
+
+    def test_unexpected_calls(self):
+        rest = _ConcurrentRestProxyForTest()
+        rest.expect_get('/a', 200, {})
+        with self.assertRaises(AssertionError):
+            rest.post('/a', {})
+        rest.get('/a')
+        with self.assertRaises(AssertionError):
+            rest.get('/a')
+
+    def test_missing_calls(self):
+        rest = _ConcurrentRestProxyForTest()
+        rest.expect_get('/a', 200, {}, times=2)
+        rest.get('/a')
+        with self.assertRaises(AssertionError):
+            rest.clear_expectations()
+
+    def test_call_counts(self):
+        rest = _ConcurrentRestProxyForTest()
+        rest.expect_get(lambda path: path.startswith('/batch/'), 200, {}, times=None)
+        for i in range(5):
+            rest.get('/batch/%s' % (i % 2))
+        rest.clear_expectations()
+        self.assertEqual(3, rest.get_call_count('GET', '/batch/0'))
+        self.assertEqual(5, rest.get_call_count('GET'))
+        self.assertEqual(0, rest.get_call_count('POST'))
+
+    def test_concurrent_calls(self):
+        rest = _ConcurrentRestProxyForTest(latency=0.05)
+        rest.expect_get('/a', 200, {}, times=4)
+        pool = ThreadPool(4)
+        codes = pool.map(lambda i: rest.get('/a')[0], range(4))
+        pool.close()
+        pool.join()
+        self.assertEqual([200] * 4, codes)
+        self.assertEqual(4, rest.get_max_in_flight())
+        rest.clear_expectations()
+
+class JsonArrayStreamTest(unittest.TestCase):
+    """Unit tests for JSON array streams.
+
+    """
+
+    def test_sequence(self):
+        built = []
+        def build(i):
+            built.append(i)
+            return {'i': i}
+        stream = JsonArrayStream([1, 2, 3], build)
+        self.assertEqual([], built)
+        self.assertEqual(3, len(stream))
+        self.assertEqual({'i': 2}, stream[1])
+        self.assertEqual([{'i': 1}, {'i': 2}, {'i': 3}], stream.to_list())
+
+    def test_encoding_is_chunked(self):
+        stream = JsonArrayStream(list(range(100)), lambda i: {'opm': 'X = %s\n' % (i)})
+        chunks = list(_encode_json_stream({'requests': stream}, 100))
+        self.assertLess(10, len(chunks))
+        self.assertGreater(200, max(len(c) for c in chunks))
+
+    def test_encoding_matches_json_dumps(self):
+        stream = JsonArrayStream(list(range(100)), lambda i: {'opm': 'X = %s\n' % (i)})
+        for data in [{'requests': stream, 'token': 'my_token'},
+                     {'token': 'my_token', 'requests': stream},
+                     {'requests': JsonArrayStream([], None)}]:
+            expected = json.dumps({k: list(v) if isinstance(v, JsonArrayStream) else v
+                                   for k, v in data.items()})
+            for chunk_size in [1, 100, 100000]:
+                chunks = list(_encode_json_stream(data, chunk_size))
+                self.assertEqual(expected, b''.join(chunks).decode('utf-8'))
+
+class RestRequestsTest(unittest.TestCase):
+    """Unit tests for rest requests against a local stand-in server.
+
+    """
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.batch = self.server.add_batch()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_get(self):
+        rest = RestRequests(self.server.get_url())
+        code, response = rest.get('/me?token=my_token')
+        self.assertEqual(code, 200)
+        self.assertEqual(response['loggedIn'], True)
+
+        code, response = rest.get('/nonexistent')
+        self.assertEqual(code, 404)
+        rest.close()
+
+    def test_connections_are_reused(self):
+        rest = RestRequests(self.server.get_url())
+        for i in range(20):
+            code, response = rest.get('/batch/' + self.batch)
+            self.assertEqual(code, 200)
+        self.assertEqual(self.server.get_request_count(), 20)
+        self.assertEqual(self.server.get_connection_count(), 1)
+        rest.close()
+
+    def test_connections_are_reused_across_threads(self):
+        threads = 4
+        rest = RestRequests(self.server.get_url(), pool_size=threads)
+        pool = ThreadPool(threads)
+        codes = pool.map(lambda i: rest.get('/batch/%s/1' % (self.batch))[0], range(100))
+        pool.close()
+        pool.join()
+        self.assertEqual(codes, [200] * 100)
+        self.assertLessEqual(self.server.get_connection_count(), threads)
+        rest.close()
+
+class RestRequestsCompressionTest(unittest.TestCase):
+    """Unit tests for compression in rest requests against a local stand-in server.
+
+    """
+
+    def setUp(self):
+        self.server = StandInServer(ephemeris_points=1000).start()
+        self.batch = self.server.add_batch()
+        self.requests = {'requests': [{'project': 'p1', 'opm_string': 'X = 1.0\n' * 100}
+            for i in range(10)]}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_compressed_post(self):
+        rest = RestRequests(self.server.get_url(), compress_requests=True)
+        code, response = rest.post('/batches', self.requests)
+        self.assertEqual(code, 200)
+        self.assertEqual(10, len(response['requests']))
+        self.assertLess(self.server.get_bytes_received(), len(json.dumps(self.requests)) / 10)
+        rest.close()
+
+    def test_uncompressed_post(self):
+        rest = RestRequests(self.server.get_url())
+        code, response = rest.post('/batches', self.requests)
+        self.assertEqual(code, 200)
+        self.assertEqual(self.server.get_bytes_received(), len(json.dumps(self.requests)))
+        rest.close()
+
+    def test_streamed_post(self):
+        rest = RestRequests(self.server.get_url())
+        stream = JsonArrayStream(self.requests['requests'], lambda r: r)
+        code, response = rest.post('/batches', {'requests': stream})
+        self.assertEqual(code, 200)
+        self.assertEqual(10, len(response['requests']))
+        self.assertEqual(self.server.get_bytes_received(), len(json.dumps(self.requests)))
+        rest.close()
+
+    def test_compressed_streamed_post(self):
+        rest = RestRequests(self.server.get_url(), compress_requests=True)
+        stream = JsonArrayStream(self.requests['requests'], lambda r: r)
+        code, response = rest.post('/batches', {'requests': stream})
+        self.assertEqual(code, 200)
+        self.assertEqual(10, len(response['requests']))
+        self.assertLess(self.server.get_bytes_received(), len(json.dumps(self.requests)) / 10)
+        rest.close()
+
+    def test_compressed_response(self):
+        rest = RestRequests(self.server.get_url())
+        code, part = rest.get('/batch/%s/1' % (self.batch))
+        self.assertEqual(code, 200)
+        self.assertLess(self.server.get_bytes_sent(), len(json.dumps(part)) / 2)
+        rest.close()
+
+    def test_uncompressed_response(self):
+        rest = RestRequests(self.server.get_url(), accept_compressed=False)
+        code, part = rest.get('/batch/%s/1' % (self.batch))
+        self.assertEqual(code, 200)
+        self.assertEqual(self.server.get_bytes_sent(), len(json.dumps(part)))
+        rest.close()
@@ -0,0 +1,153 @@
+"""
+    result_cache.py
+
+    Local cache of propagation results, keyed by what was propagated. The same
+    propagations are often run again, e.g. when re-executing a notebook or running
+    StmPropagationModule around the same nominal state, and their results can be
+    reused instead of being computed again by the server.
+"""
+
+from adam.batch import PropagationResults
+from adam.batch import StateSummary
+
+import hashlib
+import json
+import os
+import threading
+
+# Bumped whenever the key or the stored format changes, so that old entries are
+# ignored rather than misread.
+_FORMAT_VERSION = 1
+
+def propagation_key(propagation_params, opm_string):
+    """Returns a key identifying the propagation of the given OPM with the given
+    propagation parameters.
+
+    Everything that can affect the results is part of the key. The creation date of the
+    OPM, and the project and description of the run, are not.
+
+    Args:
+        propagation_params (PropagationParams): parameters of the propagation.
+        opm_string (str): OPM of the object propagated, as sent to the server.
+
+    Returns:
+        key (str)
+    """
+    opm_lines = [line for line in opm_string.split('\n')
+                 if not line.startswith('CREATION_DATE')]
+    canonical = json.dumps([_FORMAT_VERSION,
+                            propagation_params.get_start_time(),
+                            propagation_params.get_end_time(),
+                            propagation_params.get_step_size(),
+                            propagation_params.get_propagator_uuid(),
+                            opm_lines])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def _summary_to_json(state_summary):
+    return {'uuid': state_summary.get_uuid(),
+            'calc_state': state_summary.get_calc_state(),
+            'step_duration_sec': state_summary.get_step_size(),
+            'create_time': state_summary.get_create_time(),
+            'execute_time': state_summary.get_execute_time(),
+            'complete_time': state_summary.get_complete_time(),
+            'project': state_summary.get_project_uuid(),
+            'parts_count': state_summary.get_parts_count()}
+
+def _part_to_json(part):
+    return {'part_index': part.get_part_index(),
+            'calc_state': part.get_calc_state(),
+            'stk_ephemeris': part.get_ephemeris(),
+            'error': part.get_error()}
+
+class ResultCache(object):
+    """Persistent cache of the results of completed propagations. Each entry is kept in
+    its own file in the given directory, so a cache can be shared between processes and
+    survives them. Safe to use from many threads at once.
+
+    Only results whose parts all COMPLETED are stored, since failures may be transient.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): directory to keep cached results in. It is created if it
+                does not exist.
+        """
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+
+    def __repr__(self):
+        return "Result cache in %s" % (self._directory)
+
+    def get_stats(self):
+        """Returns a dict with counts of lookups answered from the cache ('hits') or not
+        ('misses'), the overall 'hit_rate', and the number of results stored
+        ('stores').
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'hit_rate': float(self._hits) / lookups if lookups else 0.0,
+                    'stores': self._stores}
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + '.json')
+
+    def get(self, key):
+        """Looks up the results of a propagation.
+
+        Args:
+            key (str): key of the propagation, from propagation_key.
+
+        Returns:
+            (StateSummary, PropagationResults) of the run that computed the results, or
+            None if they are not cached.
+        """
+        try:
+            with open(self._path(key), 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return StateSummary(entry['summary']), PropagationResults(entry['parts'])
+
+    def put(self, key, state_summary, results):
+        """Stores the results of a propagation, if they are complete.
+
+        Args:
+            key (str): key of the propagation, from propagation_key.
+            state_summary (StateSummary): summary of the run that computed the results.
+            results (PropagationResults): results of the run.
+
+        Returns:
+            Whether the results were stored.
+        """
+        if results is None or state_summary.get_calc_state() != 'COMPLETED':
+            return False
+        parts = results.get_parts()
+        if any(p is None or p.get_calc_state() != 'COMPLETED' for p in parts):
+            return False
+
+        entry = {'summary': _summary_to_json(state_summary),
+                 'parts': [_part_to_json(p) for p in parts]}
+        path = self._path(key)
+        # Write to a temporary file first so that a reader never sees half a file.
+        temp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._stores += 1
+        return True
@@ -0,0 +1,132 @@
+from adam.batch import Batch
+from adam.batch import BatchSet
+from adam.batch import Batches
+from adam.batch import OpmParams
+from adam.batch import PropagationParams
+from adam.batch import PropagationResults
+from adam.batch import StateSummary
+from adam.batch_run_manager import BatchRunManager
+from adam.rest_proxy import RestRequests
+from adam.result_cache import ResultCache
+from adam.result_cache import propagation_key
+from adam.stand_in_server import StandInServer
+import numpy.testing as npt
+import shutil
+import tempfile
+import unittest
+
+def get_propagation_params(project='p1', step_size=86400, description=None):
+    return PropagationParams({'start_time': '2017-10-04T00:00:00Z',
+                              'end_time': '2017-10-06T00:00:00Z',
+                              'step_size': step_size,
+                              'project_uuid': project,
+                              'description': description})
+
+def get_opm_params(x=1.0):
+    return OpmParams({'epoch': '2017-10-04T00:00:00Z',
+                      'state_vector': [x, 2.0, 3.0, 4.0, 5.0, 6.0]})
+
+SUMMARY = {'uuid': 'b1', 'calc_state': 'COMPLETED', 'parts_count': 1, 'project': 'p1'}
+PART = {'part_index': 1, 'calc_state': 'COMPLETED', 'stk_ephemeris': 'ephem'}
+
+class ResultCacheTest(unittest.TestCase):
+    """Unit tests for result cache.
+
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def key(self, propagation_params=None, opm_params=None):
+        return propagation_key(propagation_params or get_propagation_params(),
+                               (opm_params or get_opm_params()).generate_opm())
+
+    def test_key(self):
+        key = self.key()
+        self.assertEqual(key, self.key())
+        self.assertEqual(key, self.key(get_propagation_params(project='p2')))
+        self.assertEqual(key, self.key(get_propagation_params(description='again')))
+        self.assertNotEqual(key, self.key(get_propagation_params(step_size=3600)))
+        self.assertNotEqual(key, self.key(opm_params=get_opm_params(x=1.5)))
+
+    def test_put_and_get(self):
+        cache = ResultCache(self.directory)
+        key = self.key()
+        self.assertIsNone(cache.get(key))
+        self.assertTrue(cache.put(key, StateSummary(SUMMARY), PropagationResults([PART])))
+
+        # Entries outlive the cache object.
+        summary, results = ResultCache(self.directory).get(key)
+        self.assertEqual('b1', summary.get_uuid())
+        self.assertEqual('COMPLETED', summary.get_calc_state())
+        self.assertEqual('ephem', results.get_parts()[0].get_ephemeris())
+        self.assertEqual({'hits': 0, 'misses': 1, 'hit_rate': 0.0, 'stores': 1},
+                         cache.get_stats())
+
+    def test_incomplete_results_are_not_stored(self):
+        cache = ResultCache(self.directory)
+        key = self.key()
+        failed = dict(PART, calc_state='FAILED', error='boom')
+        self.assertFalse(cache.put(key, StateSummary(dict(SUMMARY, calc_state='FAILED')),
+                                   PropagationResults([failed])))
+        self.assertFalse(cache.put(key, StateSummary(SUMMARY),
+                                   PropagationResults([PART, None])))
+        self.assertIsNone(cache.get(key))
+
+class ResultCacheRunTest(unittest.TestCase):
+    """Unit tests for running batches with a result cache against a local stand-in
+    server.
+
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = StandInServer(ephemeris_points=3).start()
+        self.rest = RestRequests(self.server.get_url())
+
+    def tearDown(self):
+        self.rest.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def run_batches(self, batch_runs):
+        manager = BatchRunManager(Batches(self.rest), batch_runs, do_timing=False,
+                                  multi_threaded=False,
+                                  result_cache=ResultCache(self.directory))
+        manager.run()
+        return manager
+
+    def test_only_misses_are_submitted(self):
+        self.run_batches([Batch(get_propagation_params(), get_opm_params(x))
+                          for x in [1.0, 2.0, 3.0]])
+        self.assertEqual(3, self.server.get_batch_count())
+
+        batch_runs = [Batch(get_propagation_params(project='p2'), get_opm_params(x))
+                      for x in [1.0, 4.0, 3.0]]
+        manager = self.run_batches(batch_runs)
+        self.assertEqual(4, self.server.get_batch_count())
+        for batch in batch_runs:
+            self.assertEqual('COMPLETED', batch.get_calc_state())
+            self.assertIsNotNone(batch.get_results().get_end_state_vector())
+        self.assertEqual(3, len(manager.get_latest_statuses()['COMPLETED']))
+
+    def test_batch_set(self):
+        self.run_batches(BatchSet(get_propagation_params(), get_opm_params(),
+                                  [[x, 2.0, 3.0, 4.0, 5.0, 6.0] for x in [1.0, 2.0]]))
+        batch_set = BatchSet(get_propagation_params(), get_opm_params(),
+                             [[x, 2.0, 3.0, 4.0, 5.0, 6.0] for x in [1.0, 4.0, 2.0, 5.0]])
+        self.run_batches(batch_set)
+        self.assertEqual(4, self.server.get_batch_count())
+        npt.assert_allclose([x + 2 * 86400 * 4.0 for x in [1.0, 4.0, 2.0, 5.0]],
+                            batch_set.get_end_state_vectors()[:, 0])
+
+        # Nothing is submitted when everything is cached.
+        self.run_batches(BatchSet(get_propagation_params(), get_opm_params(),
+                                  [[x, 2.0, 3.0, 4.0, 5.0, 6.0] for x in [5.0, 1.0]]))
+        self.assertEqual(4, self.server.get_batch_count())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,7 @@ from adam.permission import Permissions
 from adam.project import Projects
 from adam.timer import Timer
 from adam.rest_proxy import RestRequests
-from adam.rest_proxy import AuthorizingRestProxy
+from adam.reauthorizing_rest_proxy import ReauthorizingRestProxy
 
 import datetime
 
@@ -52,7 +52,8 @@ class Service():
                 timer.stop()
                 return False
         
-        self.rest = AuthorizingRestProxy(rest, self.auth.get_token())
+        # Long runs can outlive the session, so re-authorize whenever it expires.
+        self.rest = ReauthorizingRestProxy(rest, self.auth)
         self.projects = Projects(self.rest)
         self.batches = Batches(self.rest)
         self.groups = Groups(self.rest)
@@ -0,0 +1,591 @@
+"""
+    stand_in_server.py
+
+    A local HTTP server that implements the parts of the ADAM REST API used by this
+    package: authorization (/me), projects, batches (including bulk submission and part
+    retrieval), groups and permissions. Batches move through PENDING, RUNNING and
+    COMPLETED (or FAILED) on a simulated schedule, and latency, errors and bandwidth
+    can be injected, so BatchRunManager can be tested and load-tested on one machine.
+
+    Propagation is simulated as straight-line motion from the OPM state vector, so
+    ephemerides are cheap to produce but still consistent with what was submitted.
+"""
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import datetime
+import gzip
+import heapq
+import json
+import random
+import re
+import threading
+import time
+import urllib
+import uuid
+
+# Responses smaller than this are never compressed.
+COMPRESSION_THRESHOLD = 1024
+
+# Used when a batch's start time can't be parsed (e.g. in tests).
+DEFAULT_SCENARIO_EPOCH = datetime.datetime(2018, 1, 1)
+
+_OPM_VALUE_PATTERN = re.compile(r'^(X|Y|Z|X_DOT|Y_DOT|Z_DOT) = (\S+)$', re.MULTILINE)
+
+def _parse_time(time_str):
+    if time_str is None:
+        return None
+    for format in ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S']:
+        try:
+            return datetime.datetime.strptime(time_str.rstrip('Z'), format)
+        except ValueError:
+            pass
+    return None
+
+def _format_time(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.utcfromtimestamp(timestamp).isoformat() + 'Z'
+
+def _state_vector_from_opm(opm):
+    values = dict(_OPM_VALUE_PATTERN.findall(opm or ''))
+    try:
+        return [float(values[k]) for k in ['X', 'Y', 'Z', 'X_DOT', 'Y_DOT', 'Z_DOT']]
+    except (KeyError, ValueError):
+        return [130347560.13690618, -74407287.6018632, -35247598.541470632,
+                23.935241263310683, 27.146279819258538, 10.346605942591514]
+
+def make_stk_ephemeris(num_points, step_size=86400, start=0, state_vector=None,
+                       epoch=DEFAULT_SCENARIO_EPOCH):
+    """Generates a syntactically valid STK ephemeris with the given number of points,
+    in the format the server returns for each part (positions in m, velocities in m/s).
+
+    Args:
+        num_points (int): number of states in the ephemeris.
+        step_size (float): seconds between states.
+        start (float): time of the first state, in seconds since the scenario epoch.
+        state_vector (list): state at the scenario epoch [rx, ry, rz, vx, vy, vz]
+            [km, km/s]. The object moves in a straight line from it.
+        epoch (datetime): scenario epoch.
+    """
+    if state_vector is None:
+        state_vector = _state_vector_from_opm(None)
+    position = [1000.0 * x for x in state_vector[:3]]
+    velocity = [1000.0 * v for v in state_vector[3:]]
+    lines = ["stk.v.11.0",
+             "BEGIN Ephemeris",
+             "NumberOfEphemerisPoints %s" % (num_points),
+             "ScenarioEpoch %s" % (epoch.strftime('%d %b %Y %H:%M:%S.%f')),
+             "InterpolationMethod Lagrange",
+             "InterpolationSamplesM1 5",
+             "CentralBody Sun",
+             "CoordinateSystem ICRF",
+             "EphemerisTimePosVel"]
+    for i in range(num_points):
+        t = start + i * step_size
+        lines.append("%.16e %.16e %.16e %.16e %.16e %.16e %.16e" % (
+            t, position[0] + velocity[0] * t, position[1] + velocity[1] * t,
+            position[2] + velocity[2] * t, velocity[0], velocity[1], velocity[2]))
+    lines.append("END Ephemeris")
+    return "\n".join(lines)
+
+
+class _StandInRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 is required for connections to be kept alive between requests.
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately. With Nagle's algorithm on, the body of
+    # every response on a kept-alive connection waits out the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.stand_in.count_connection()
+
+    def log_message(self, format, *args):
+        # The default implementation writes a line to stderr for every request.
+        pass
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+            if size == 0:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        # Skip any trailers, up to the blank line that ends the body.
+        while self.rfile.readline().strip() != b'':
+            pass
+        return b''.join(chunks)
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = self._read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if len(body) == 0:
+            return {}
+        self.server.stand_in.transfer(received=len(body))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        data = json.loads(body.decode('utf-8'))
+        if not isinstance(data, dict):
+            raise ValueError("Request body is not a JSON object")
+        return data
+
+    def _accepts_gzip(self):
+        accepted = self.headers.get('Accept-Encoding') or ''
+        return 'gzip' in [e.split(';')[0].strip() for e in accepted.split(',')]
+
+    def _send_json(self, code, response):
+        body = json.dumps(response).encode('utf-8')
+        compress = self.server.stand_in.get_compress_responses() and \
+            len(body) >= COMPRESSION_THRESHOLD and self._accepts_gzip()
+        if compress:
+            body = gzip.compress(body, compresslevel=1)
+        self.server.stand_in.transfer(sent=len(body))
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_empty(self, code):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _dispatch(self, method):
+        parsed = urllib.parse.urlparse(self.path)
+        path = [urllib.parse.unquote(p) for p in parsed.path.split('/') if p != '']
+        query = urllib.parse.parse_qs(parsed.query)
+        self.server.stand_in.count_request()
+        try:
+            data = self._read_body() if method == 'POST' else None
+        except (ValueError, OSError) as e:
+            # Malformed chunking, compression or JSON. Answer rather than let the
+            # handler thread die and drop the connection.
+            code, response = self.server.stand_in.error(400, 'Bad request body: %s' % (e))
+        else:
+            code, response = self.server.stand_in.handle(method, path, query, data)
+        if response is None:
+            self._send_empty(code)
+        else:
+            self._send_json(code, response)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class _StandInBatch(object):
+    __slots__ = ['uuid', 'project', 'start_time', 'step_size', 'opm', 'parts_count',
+                 'create_time', 'execute_time', 'complete_time', 'failed']
+
+    def get_calc_state(self, now):
+        if now < self.execute_time:
+            return 'PENDING'
+        if now < self.complete_time:
+            return 'RUNNING'
+        return 'FAILED' if self.failed else 'COMPLETED'
+
+    def to_json(self, now):
+        calc_state = self.get_calc_state(now)
+        return {'uuid': self.uuid,
+                'calc_state': calc_state,
+                'step_duration_sec': self.step_size,
+                'create_time': _format_time(self.create_time),
+                'execute_time': _format_time(
+                    self.execute_time if calc_state != 'PENDING' else None),
+                'complete_time': _format_time(
+                    self.complete_time if calc_state in ['COMPLETED', 'FAILED'] else None),
+                'project': self.project,
+                'parts_count': self.parts_count}
+
+
+class StandInServer(object):
+    """Serves a simulated ADAM REST API from a background thread on localhost.
+
+    Each submitted batch waits queue_delay seconds (and, if workers is set, for one of
+    that many simulated workers to be free) in PENDING, then spends run_duration
+    seconds RUNNING before it is COMPLETED, or FAILED with probability failure_rate.
+    Independently of batch state, any request may be delayed by latency seconds (plus
+    tail_latency with probability tail_latency_rate) and may fail with a 503 with
+    probability error_rate.
+    """
+
+    def __init__(self, port=0, parts_count=1, ephemeris_points=0,
+                 compress_responses=True, bandwidth=None, latency=0,
+                 tail_latency=0, tail_latency_rate=0, error_rate=0, queue_delay=0,
+                 run_duration=0, workers=None, failure_rate=0, tokens=None, seed=None):
+        """Creates the server. Nothing is served until start() is called.
+
+        Args:
+            port (int): port to listen on. 0 picks a free port.
+            parts_count (int): number of parts every batch reports.
+            ephemeris_points (int): number of states in the ephemeris of every part.
+                Consecutive parts share their boundary state, as the real server's do.
+            compress_responses (bool): whether to gzip responses for clients that
+                send Accept-Encoding: gzip.
+            bandwidth (float): if given, bytes per second that request and response
+                bodies are throttled to, to imitate a link slower than loopback.
+            latency (float): seconds added to every request.
+            tail_latency (float): further seconds added to a fraction of requests.
+            tail_latency_rate (float): fraction of requests that get tail_latency.
+            error_rate (float): fraction of requests answered with a 503.
+            queue_delay (float): minimum seconds a batch stays PENDING.
+            run_duration (float): seconds a batch stays RUNNING.
+            workers (int): if given, at most this many batches are RUNNING at once,
+                and the rest queue up in PENDING.
+            failure_rate (float): fraction of batches that end up FAILED.
+            tokens (list<str>): if given, only these tokens are accepted. Otherwise any
+                token (or none) is.
+            seed (int): seed for the random choices above, for repeatable runs.
+        """
+        self._parts_count = parts_count
+        self._ephemeris_points = ephemeris_points
+        self._compress_responses = compress_responses
+        self._bandwidth = bandwidth
+        self._latency = latency
+        self._tail_latency = tail_latency
+        self._tail_latency_rate = tail_latency_rate
+        self._error_rate = error_rate
+        self._queue_delay = queue_delay
+        self._run_duration = run_duration
+        self._failure_rate = failure_rate
+        self._tokens = set(tokens) if tokens is not None else None
+        self._random = random.Random(seed)
+
+        # Times at which each simulated worker becomes free.
+        self._workers = [0.0] * workers if workers else None
+
+        self._batches = {}
+        self._batches_by_project = {}
+        self._projects = {}
+        self._groups = {}
+        self._user_permissions = {}
+        self._group_permissions = {}
+
+        self._bytes_received = 0
+        self._bytes_sent = 0
+        self._request_count = 0
+        self._connection_count = 0
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), _StandInRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.stand_in = self
+        self._thread = None
+
+    def __repr__(self):
+        return "Stand-in server at %s" % (self.get_url())
+
+    def get_url(self):
+        """Base URL to hand to RestRequests."""
+        return "http://127.0.0.1:%s" % (self._httpd.server_address[1])
+
+    def get_request_count(self):
+        return self._request_count
+
+    def get_connection_count(self):
+        return self._connection_count
+
+    def get_compress_responses(self):
+        return self._compress_responses
+
+    def get_bytes_received(self):
+        """Number of request body bytes received, as sent on the wire."""
+        return self._bytes_received
+
+    def get_bytes_sent(self):
+        """Number of response body bytes sent, as sent on the wire."""
+        return self._bytes_sent
+
+    def get_batch_count(self):
+        return len(self._batches)
+
+    def transfer(self, received=0, sent=0):
+        """Records bytes moved over the wire, and waits as long as moving them would
+        take at the configured bandwidth.
+        """
+        with self._lock:
+            self._bytes_received += received
+            self._bytes_sent += sent
+        if self._bandwidth:
+            time.sleep((received + sent) / self._bandwidth)
+
+    def count_request(self):
+        with self._lock:
+            self._request_count += 1
+
+    def count_connection(self):
+        with self._lock:
+            self._connection_count += 1
+
+    def start(self):
+        # A short poll interval keeps stop() from taking half a second.
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def expire_token(self, token):
+        """Stops accepting the given token, as if its session had expired. Only
+        meaningful if the server was created with a list of tokens.
+        """
+        with self._lock:
+            if self._tokens is not None:
+                self._tokens.discard(token)
+
+    def add_token(self, token):
+        """Starts accepting the given token. Only meaningful if the server was created
+        with a list of tokens.
+        """
+        with self._lock:
+            if self._tokens is not None:
+                self._tokens.add(token)
+
+    def add_batch(self, project=None, opm_string=None):
+        """Creates a batch directly, without a request, as if it had been submitted
+        now. Useful for setting up tests.
+
+        Returns:
+            The uuid of the new batch.
+        """
+        with self._lock:
+            return self._new_batch({'project': project, 'opm_string': opm_string},
+                                   time.time()).uuid
+
+    def error(self, code, message):
+        """Returns the code and json data of an error response, as the real server
+        gives them."""
+        return code, {'error': {'code': code, 'message': message,
+                                'errors': [{'message': message}]}}
+
+    def _get_token(self, query, data):
+        if data is not None and 'token' in data:
+            return data['token']
+        return query.get('token', [None])[0]
+
+    def handle(self, method, path, query, data):
+        """Produces the response to a request, after any injected latency.
+
+        Args:
+            method (str): 'GET', 'POST' or 'DELETE'
+            path (list<str>): non-empty components of the request path
+            query (dict): parsed query string, as returned by urllib.parse.parse_qs
+            data (dict): parsed JSON body of a POST, otherwise None
+
+        Returns:
+            Pair of code and json data. If the json data is None, the response has
+            no body.
+        """
+        with self._lock:
+            delay = self._latency
+            if self._tail_latency_rate > 0 and \
+                    self._random.random() < self._tail_latency_rate:
+                delay += self._tail_latency
+            inject_error = self._error_rate > 0 and \
+                self._random.random() < self._error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if inject_error:
+            return self.error(503, 'Backend error (injected)')
+        if len(path) == 0:
+            return self.error(404, 'Not found')
+
+        token = self._get_token(query, data)
+        with self._lock:
+            valid_token = self._tokens is None or token in self._tokens
+        if path == ['me']:
+            if token is None:
+                return 200, {'loggedIn': False}
+            if not valid_token:
+                return self.error(
+                    503, 'org.apache.shiro.authc.IncorrectCredentialsException')
+            return 200, {'loggedIn': True, 'email': 'stand-in@localhost'}
+        if not valid_token:
+            return self.error(503, 'org.apache.shiro.authc.ExpiredCredentialsException')
+
+        if path[0] in ['batch', 'batches']:
+            return self._handle_batch(method, path, query, data)
+        with self._lock:
+            if path[0] == 'project':
+                return self._handle_project(method, path, query, data)
+            if path[0] in ['group', 'group_membership']:
+                return self._handle_group(method, path, query, data)
+            if path[0] in ['user_permission', 'group_permission']:
+                return self._handle_permission(method, path, query, data)
+        return self.error(404, 'Not found')
+
+    # Batches.
+
+    def _new_batch(self, request, now):
+        batch = _StandInBatch()
+        batch.uuid = str(uuid.uuid4())
+        batch.project = request.get('project')
+        batch.start_time = _parse_time(request.get('start_time')) or DEFAULT_SCENARIO_EPOCH
+        batch.step_size = request.get('step_duration_sec') or 86400
+        batch.opm = request.get('opm_string')
+        batch.parts_count = self._parts_count
+        batch.create_time = now
+        batch.execute_time = now + self._queue_delay
+        if self._workers is not None:
+            batch.execute_time = max(batch.execute_time, heapq.heappop(self._workers))
+        batch.complete_time = batch.execute_time + self._run_duration
+        if self._workers is not None:
+            heapq.heappush(self._workers, batch.complete_time)
+        batch.failed = self._failure_rate > 0 and \
+            self._random.random() < self._failure_rate
+
+        self._batches[batch.uuid] = batch
+        self._batches_by_project.setdefault(batch.project, []).append(batch)
+        return batch
+
+    def _get_part(self, batch, index, now):
+        calc_state = batch.get_calc_state(now)
+        part = {'part_index': index, 'calc_state': calc_state}
+        if calc_state == 'COMPLETED':
+            # Each part starts where the previous one ended.
+            start = (index - 1) * max(self._ephemeris_points - 1, 0) * batch.step_size
+            part['stk_ephemeris'] = make_stk_ephemeris(
+                self._ephemeris_points, batch.step_size, start,
+                _state_vector_from_opm(batch.opm), batch.start_time)
+        elif calc_state == 'FAILED':
+            part['error'] = 'Propagation failed (simulated)'
+        return part
+
+    def _handle_batch(self, method, path, query, data):
+        now = time.time()
+        with self._lock:
+            if method == 'POST' and path == ['batches']:
+                return 200, {'requests': [self._new_batch(r, now).to_json(now)
+                                          for r in data['requests']]}
+            if method == 'POST' and path == ['batch']:
+                return 200, self._new_batch(data, now).to_json(now)
+            if method == 'GET' and path == ['batch']:
+                project = query.get('project_uuid', [None])[0]
+                return 200, {'items': [b.to_json(now)
+                                       for b in self._batches_by_project.get(project, [])]}
+
+            batch = self._batches.get(path[1]) if len(path) > 1 else None
+            if batch is None:
+                return self.error(404, 'Batch not found')
+            if method == 'GET' and len(path) == 2:
+                return 200, batch.to_json(now)
+            if method == 'DELETE' and len(path) == 2:
+                del self._batches[batch.uuid]
+                self._batches_by_project[batch.project].remove(batch)
+                return 204, None
+            if not (method == 'GET' and len(path) == 3):
+                return self.error(404, 'Not found')
+
+        # A batch doesn't change once created, so its ephemerides are built without
+        # holding up the requests of other threads.
+        try:
+            index = int(path[2])
+        except ValueError:
+            return self.error(404, 'Part not found')
+        if index < 1 or index > batch.parts_count:
+            return self.error(404, 'Part not found')
+        return 200, self._get_part(batch, index, now)
+
+    # Projects.
+
+    def _handle_project(self, method, path, query, data):
+        if method == 'GET' and len(path) == 1:
+            return 200, {'items': list(self._projects.values())}
+        if method == 'POST' and len(path) == 1:
+            project = {'uuid': str(uuid.uuid4()), 'parent': data.get('parent'),
+                       'name': data.get('name'), 'description': data.get('description')}
+            self._projects[project['uuid']] = project
+            return 200, project
+        if not path[1] in self._projects:
+            return self.error(404, 'Project not found')
+        if method == 'GET':
+            return 200, self._projects[path[1]]
+        if method == 'DELETE':
+            del self._projects[path[1]]
+            return 204, None
+        return self.error(404, 'Not found')
+
+    # Groups.
+
+    def _handle_group(self, method, path, query, data):
+        if path[0] == 'group_membership':
+            member_id = query.get('group_uuid', ['stand-in@localhost'])[0]
+            return 200, {'items': [
+                {'uuid': g['uuid'], 'name': g['name'], 'description': g['description']}
+                for g in self._groups.values()
+                if any(m['member_id'] == member_id for m in g['members'])]}
+
+        if method == 'POST' and len(path) == 1:
+            group = {'uuid': str(uuid.uuid4()), 'name': data.get('name'),
+                     'description': data.get('description'), 'members': []}
+            self._groups[group['uuid']] = group
+            return 200, {'uuid': group['uuid'], 'name': group['name'],
+                         'description': group['description']}
+        group = self._groups.get(path[1]) if len(path) > 1 else None
+        if group is None:
+            return self.error(404, 'Group not found')
+        if method == 'DELETE' and len(path) == 2:
+            del self._groups[path[1]]
+            return 204, None
+        if len(path) == 3 and path[2] == 'member':
+            if method == 'GET':
+                return 200, {'items': list(group['members'])}
+            if method == 'POST':
+                member = {'member_id': data['member_id'],
+                          'member_type': data['member_type']}
+                group['members'].append(member)
+                return 200, member
+            if method == 'DELETE':
+                group['members'] = [m for m in group['members'] if not (
+                    m['member_id'] == query.get('member_id', [None])[0] and
+                    m['member_type'] == query.get('member_type', [None])[0])]
+                return 204, None
+        return self.error(404, 'Not found')
+
+    # Permissions.
+
+    def _handle_permission(self, method, path, query, data):
+        if path[0] == 'user_permission':
+            permissions = self._user_permissions
+            grantee = path[1] if len(path) > 1 else 'stand-in@localhost'
+            # Directly granted user permissions are listed under ''.
+            key = ''
+        else:
+            if len(path) < 2:
+                return self.error(404, 'Not found')
+            permissions = self._group_permissions
+            grantee = path[1]
+            # Directly granted group permissions are listed under the group itself.
+            key = grantee
+
+        if method == 'GET':
+            return 200, {key: list(permissions.get(grantee, []))}
+        if method == 'POST':
+            permission = {'right': data['right'], 'target_type': data['target_type'],
+                          'target_id': data['target_id']}
+            permissions.setdefault(grantee, []).append(permission)
+            return 200, permission
+        if method == 'DELETE':
+            permission = {'right': query.get('right', [None])[0],
+                          'target_type': query.get('target_type', [None])[0],
+                          'target_id': query.get('target_id', [None])[0]}
+            permissions[grantee] = [p for p in permissions.get(grantee, [])
+                                    if p != permission]
+            return 204, None
+        return self.error(404, 'Not found')
@@ -0,0 +1,300 @@
+from adam import Auth
+from adam import Batch
+from adam import BatchRunManager
+from adam import Batches
+from adam import Groups
+from adam import Permission
+from adam import Permissions
+from adam import Projects
+from adam import PropagationParams
+from adam import OpmParams
+from adam.batch import LAST_PART
+from adam.polling_scheduler import PollingScheduler
+from adam.rest_proxy import AuthorizingRestProxy
+from adam.rest_proxy import RestProxy
+from adam.rest_proxy import RestRequests
+from adam.stand_in_server import StandInServer
+import requests
+import threading
+import time
+import unittest
+
+class StandInServerTest(unittest.TestCase):
+    """Unit tests for the stand-in server, driven through the client modules.
+
+    """
+
+    def setUp(self):
+        self.server = None
+        self.rest = None
+
+    def tearDown(self):
+        if self.rest is not None:
+            self.rest.close()
+        if self.server is not None:
+            self.server.stop()
+
+    def start(self, **kwargs):
+        self.server = StandInServer(tokens=['my_token'], seed=1, **kwargs).start()
+        self.rest = RestRequests(self.server.get_url())
+        return AuthorizingRestProxy(self.rest, 'my_token')
+
+    def new_batch(self, project, x=130347560.13690618):
+        return Batch(PropagationParams({
+            'start_time': '2017-10-04T00:00:00Z',
+            'end_time': '2017-10-05T00:00:00Z',
+            'project_uuid': project}), OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': [x, -74407287.6018632, -35247598.541470632,
+                             23.935241263310683, 27.146279819258538, 10.346605942591514]}))
+
+    def test_auth(self):
+        self.start()
+        auth = Auth(self.rest)
+        self.assertTrue(auth.authorize('my_token'))
+        self.assertEqual('stand-in@localhost', auth.get_user())
+        self.assertFalse(auth.authorize('other_token'))
+
+        self.server.expire_token('my_token')
+        self.assertFalse(auth.authorize('my_token'))
+        self.server.add_token('my_token')
+        self.assertTrue(auth.authorize('my_token'))
+
+    def test_tokens_without_auth(self):
+        self.server = StandInServer().start()
+        self.rest = RestRequests(self.server.get_url())
+        self.server.expire_token('my_token')
+        self.server.add_token('my_token')
+        code, response = AuthorizingRestProxy(self.rest, 'other_token').get('/project')
+        self.assertEqual(200, code)
+
+    def test_invalid_token_is_rejected(self):
+        self.start()
+        code, response = AuthorizingRestProxy(self.rest, 'other_token').get('/project')
+        self.assertEqual(503, code)
+        self.assertTrue(response['error']['message'].startswith('org.apache.shiro.authc.'))
+
+    def test_projects(self):
+        projects = Projects(self.start())
+        project = projects.new_project('parent', 'name', 'description')
+        self.assertEqual('parent', projects.get_project(project.get_uuid()).get_parent())
+        self.assertEqual([project.get_uuid()], [p.get_uuid() for p in projects.get_projects()])
+        projects.delete_project(project.get_uuid())
+        self.assertEqual([], projects.get_projects())
+
+    def test_groups_and_permissions(self):
+        rest = self.start()
+        groups = Groups(rest)
+        permissions = Permissions(rest)
+
+        group = groups.new_group('name', 'description')
+        groups.add_user_to_group('u1', group.get_uuid())
+        self.assertEqual(['u1'], [m.get_id() for m in groups.get_group_members(group.get_uuid())])
+        groups.remove_user_from_group('u1', group.get_uuid())
+        self.assertEqual([], groups.get_group_members(group.get_uuid()))
+
+        permission = Permission('READ', 'PROJECT', 'p1')
+        permissions.grant_group_permission(group.get_uuid(), permission)
+        self.assertEqual({group.get_uuid(): [permission]},
+                         permissions.get_group_permissions(group.get_uuid()))
+        permissions.revoke_group_permission(group.get_uuid(), permission)
+        self.assertEqual({group.get_uuid(): []},
+                         permissions.get_group_permissions(group.get_uuid()))
+
+        groups.delete_group(group.get_uuid())
+
+    def test_batch_state_transitions(self):
+        batches = Batches(self.start(queue_delay=0.2, run_duration=0.2, ephemeris_points=3))
+        batch = self.new_batch('p1')
+        summary = batches.new_batch(batch.get_propagation_params(), batch.get_opm_params())
+        self.assertEqual('PENDING', summary.get_calc_state())
+        self.assertIsNone(summary.get_execute_time())
+        self.assertIsNone(batches.get_propagation_results(summary).get_end_state_vector())
+
+        time.sleep(0.25)
+        self.assertEqual('RUNNING', batches.get_summary(summary.get_uuid()).get_calc_state())
+
+        time.sleep(0.2)
+        summary = batches.get_summary(summary.get_uuid())
+        self.assertEqual('COMPLETED', summary.get_calc_state())
+        self.assertIsNotNone(summary.get_complete_time())
+
+        # Straight-line motion for two days from the submitted state.
+        end_state = batches.get_propagation_results(summary).get_end_state_vector()
+        self.assertAlmostEqual(130347560.13690618 + 23.935241263310683 * 2 * 86400,
+                               end_state[0], places=3)
+        self.assertAlmostEqual(23.935241263310683, end_state[3])
+
+        batches.delete_batch(summary.get_uuid())
+        self.assertIsNone(batches.get_summary(summary.get_uuid()))
+
+    def test_workers_limit_running_batches(self):
+        batches = Batches(self.start(run_duration=0.3, workers=1))
+        params = [[b.get_propagation_params(), b.get_opm_params()]
+                  for b in [self.new_batch('p1'), self.new_batch('p1')]]
+        batches.new_batches(params)
+        time.sleep(0.1)
+        states = sorted(s.get_calc_state() for s in batches.get_summaries('p1').values())
+        self.assertEqual(['PENDING', 'RUNNING'], states)
+
+    def test_failures(self):
+        batches = Batches(self.start(failure_rate=1))
+        batch = self.new_batch('p1')
+        summary = batches.new_batch(batch.get_propagation_params(), batch.get_opm_params())
+        self.assertEqual('FAILED', summary.get_calc_state())
+        part = batches.get_propagation_results(summary).get_parts()[0]
+        self.assertEqual('FAILED', part.get_calc_state())
+        self.assertIsNotNone(part.get_error())
+
+    def test_error_injection(self):
+        rest = self.start(error_rate=0.5)
+        codes = [rest.get('/project')[0] for i in range(100)]
+        self.assertEqual({200, 503}, set(codes))
+        self.assertLess(20, codes.count(503))
+        self.assertLess(20, codes.count(200))
+
+    def test_latency_injection(self):
+        rest = self.start(latency=0.05, tail_latency=1, tail_latency_rate=0)
+        start = time.time()
+        for i in range(4):
+            rest.get('/project')
+        self.assertLessEqual(0.2, time.time() - start)
+        self.assertGreater(1, time.time() - start)
+
+    def test_malformed_requests(self):
+        rest = self.start()
+        batch = self.server.add_batch()
+        code, response = rest.get('/batch/%s/x' % (batch))
+        self.assertEqual(404, code)
+
+        url = self.server.get_url() + '/batch?token=my_token'
+        for body in [b'{"project": ', b'[1, 2]']:
+            response = requests.post(url, data=body)
+            self.assertEqual(400, response.status_code)
+            self.assertIn('error', response.json())
+        # The server is still answering.
+        self.assertEqual(200, rest.get('/batch/%s' % (batch))[0])
+
+    def test_selective_part_retrieval(self):
+        batches = Batches(self.start(parts_count=8, ephemeris_points=3))
+        batch = self.new_batch('p1')
+        summary = batches.new_batch(batch.get_propagation_params(), batch.get_opm_params())
+        all_results = batches.get_propagation_results(summary)
+        all_parts = all_results.get_parts()
+        self.assertEqual([1, 2, 3, 4, 5, 6, 7, 8], [p.get_part_index() for p in all_parts])
+
+        requests = self.server.get_request_count()
+        results = batches.get_propagation_results(summary, parts=LAST_PART)
+        self.assertEqual(1, self.server.get_request_count() - requests)
+        self.assertEqual([None] * 7, results.get_parts()[:7])
+        self.assertEqual(all_parts[7].get_ephemeris(), results.get_parts()[7].get_ephemeris())
+        self.assertEqual(all_results.get_end_state_vector(),
+                         results.get_end_state_vector())
+
+        parts = batches.get_propagation_results(summary, parts=[0, -1]).get_parts()
+        self.assertEqual([1, 8], [p.get_part_index() for p in parts if p is not None])
+
+        # Each part spans two days, so this window is within the fourth part.
+        parts = batches.get_propagation_results(summary, time_window=[
+            '2017-10-11T00:00:00Z', '2017-10-11T12:00:00Z']).get_parts()
+        self.assertEqual([4], [p.get_part_index() for p in parts if p is not None])
+        # Neighbouring parts share their boundary state.
+        parts = batches.get_propagation_results(summary, time_window=[
+            '2017-10-08T00:00:00Z', '2017-10-11T00:00:00Z'], threads=1).get_parts()
+        self.assertEqual([2, 3, 4], [p.get_part_index() for p in parts if p is not None])
+
+        with self.assertRaises(KeyError):
+            batches.get_propagation_results(summary, parts=[0], time_window=[0, 1])
+
+    def test_batch_run_manager(self):
+        rest = self.start(parts_count=2, ephemeris_points=3, run_duration=0.1)
+        batch_runs = [self.new_batch('p1', x=i) for i in range(1200)]
+        manager = BatchRunManager(Batches(rest), batch_runs, do_timing=False)
+        manager.run()
+
+        self.assertEqual(1200, self.server.get_batch_count())
+        self.assertEqual(1200, len(manager.get_latest_statuses()['COMPLETED']))
+        for i in [0, 700, 1199]:
+            end_state = batch_runs[i].get_results().get_end_state_vector()
+            self.assertAlmostEqual(i + 23.935241263310683 * 4 * 86400, end_state[0], places=3)
+
+    def test_pipelined_batch_run_manager(self):
+        rest = self.start(parts_count=2, ephemeris_points=3, run_duration=0.1)
+        batch_runs = [self.new_batch('p1', x=i) for i in range(1200)]
+        manager = BatchRunManager(Batches(rest), batch_runs, do_timing=False,
+                                  pipelined=True)
+        manager.run()
+
+        self.assertEqual(1200, self.server.get_batch_count())
+        self.assertEqual(1200, len(manager.get_latest_statuses()['COMPLETED']))
+        for i in [0, 700, 1199]:
+            end_state = batch_runs[i].get_results().get_end_state_vector()
+            self.assertAlmostEqual(i + 23.935241263310683 * 4 * 86400, end_state[0], places=3)
+
+    def test_pipelined_batch_run_manager_within_max_connections(self):
+        rest = InFlightRestProxy(self.start(run_duration=0.1))
+        batch_runs = [self.new_batch('p1', x=i) for i in range(300)]
+        manager = BatchRunManager(Batches(rest), batch_runs, do_timing=False,
+                                  pipelined=True, max_submission_threads=20,
+                                  results_threads=20, max_connections=4,
+                                  polling_scheduler=PollingScheduler(min_interval=0.05))
+        manager.run()
+
+        self.assertEqual(300, len(manager.get_latest_statuses()['COMPLETED']))
+        self.assertLessEqual(rest.max_in_flight, 4)
+
+    def test_pipelined_results_are_retrieved_as_batches_finish(self):
+        # With one worker, the batches finish one after another.
+        batches = RecordingBatches(self.start(run_duration=0.3, workers=1))
+        batch_runs = [self.new_batch('p1', x=i) for i in range(3)]
+        manager = BatchRunManager(batches, batch_runs, do_timing=False, pipelined=True,
+                                  polling_scheduler=PollingScheduler(min_interval=0.05))
+        start = time.time()
+        manager.run()
+
+        self.assertEqual(3, len(batches.retrieved))
+        # The first results come in before the last batch finishes.
+        self.assertLess(min(batches.retrieved.values()) - start, 0.6)
+        self.assertLessEqual(0.9, max(batches.retrieved.values()) - start)
+
+class InFlightRestProxy(RestProxy):
+    """Rest proxy that records the most calls it had in flight at once."""
+
+    def __init__(self, rest_proxy):
+        self._rest_proxy = rest_proxy
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.max_in_flight = 0
+
+    def _call(self, method, *args):
+        with self._lock:
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            return method(*args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def get(self, path):
+        return self._call(self._rest_proxy.get, path)
+
+    def post(self, path, data_dict):
+        return self._call(self._rest_proxy.post, path, data_dict)
+
+    def delete(self, path):
+        return self._call(self._rest_proxy.delete, path)
+
+class RecordingBatches(Batches):
+    """Batches that records when the results of each batch were retrieved."""
+
+    def __init__(self, rest):
+        Batches.__init__(self, rest)
+        self.retrieved = {}
+
+    def get_propagation_results(self, state_summary, **kwargs):
+        self.retrieved[state_summary.get_uuid()] = time.time()
+        return Batches.get_propagation_results(self, state_summary, **kwargs)
+
+if __name__ == '__main__':
+    unittest.main()
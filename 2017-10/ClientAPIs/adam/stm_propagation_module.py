@@ -9,12 +9,20 @@ import numdifftools as nd
 import numpy as np
 
 # Adam related imports
-from adam import Batch
 from adam import BatchRunManager
+from adam import BatchSet
+from adam.batch import LAST_PART
 
 class StmPropagationModule(object):
-    def __init__(self, batches_module):
+    def __init__(self, batches_module, result_cache=None):
+        """
+        Args:
+            batches_module (Batches): Object to use to communicate with server.
+            result_cache (ResultCache): if given, propagations already in this cache are
+                not run again.
+        """
         self.batches_module = batches_module
+        self.result_cache = result_cache
     
     def __repr__(self):
         return "StmPropagationModule"
@@ -37,14 +45,15 @@ class StmPropagationModule(object):
         """
 
         # Create batches from state vectors
-        batches = []
-        for state_vector in state_vectors:
-            opm_params = deepcopy(opm_params_templ)
-            opm_params.set_state_vector(state_vector)
-            batches.append(Batch(propagation_params, opm_params))
-
-        # submit batches and wait till they finish running  
-        runner = BatchRunManager(self.batches_module, batches)
+        batches = BatchSet(propagation_params, opm_params_templ, state_vectors)
+
+        # submit batches and wait till they finish running. Only end states are needed,
+        # so only the last part of each batch is retrieved, unless results are cached,
+        # which needs them whole.
+        results_parts = LAST_PART if self.result_cache is None else None
+        runner = BatchRunManager(self.batches_module, batches,
+                                 result_cache=self.result_cache,
+                                 results_parts=results_parts)
         runner.run()
 
         # Get final states
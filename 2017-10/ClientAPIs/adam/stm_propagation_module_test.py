@@ -0,0 +1,71 @@
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam import RestRequests
+from adam import ResultCache
+from adam import StmPropagationModule
+from adam.stand_in_server import StandInServer
+import numpy as np
+import numpy.testing as npt
+import shutil
+import tempfile
+import unittest
+
+class StmPropagationModuleTest(unittest.TestCase):
+    """Unit tests for STM propagation module against a local stand-in server.
+
+    """
+
+    def setUp(self):
+        # The stand-in server propagates in a straight line for two days.
+        self.server = StandInServer(ephemeris_points=3).start()
+        self.rest = RestRequests(self.server.get_url())
+
+    def tearDown(self):
+        self.rest.close()
+        self.server.stop()
+
+    def test_straight_line_stm(self):
+        state_vec = [130347560.13690618, -74407287.6018632, -35247598.541470632,
+                     23.935241263310683, 27.146279819258538, 10.346605942591514]
+        propagation_params = PropagationParams({
+            'start_time': '2017-10-04T00:00:00Z',
+            'end_time': '2017-10-06T00:00:00Z',
+            'project_uuid': 'p1'})
+        opm_params = OpmParams({'epoch': '2017-10-04T00:00:00Z', 'state_vector': state_vec})
+
+        stm_module = StmPropagationModule(Batches(self.rest))
+        end_state, stm = stm_module.run_stm_propagation(propagation_params, opm_params)
+
+        duration = 2 * 86400
+        expected_end_state = [state_vec[i] + duration * state_vec[i + 3] for i in range(3)] + \
+            state_vec[3:]
+        npt.assert_allclose(expected_end_state, end_state)
+        expected_stm = np.block([[np.eye(3), duration * np.eye(3)],
+                                 [np.zeros((3, 3)), np.eye(3)]])
+        npt.assert_allclose(expected_stm, stm, atol=1e-3)
+        self.assertEqual(13, self.server.get_batch_count())
+
+    def test_repeat_runs_use_result_cache(self):
+        propagation_params = PropagationParams({
+            'start_time': '2017-10-04T00:00:00Z',
+            'end_time': '2017-10-06T00:00:00Z',
+            'project_uuid': 'p1'})
+        opm_params = OpmParams({'epoch': '2017-10-04T00:00:00Z',
+                                'state_vector': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]})
+
+        directory = tempfile.mkdtemp()
+        try:
+            stm_module = StmPropagationModule(Batches(self.rest),
+                                              result_cache=ResultCache(directory))
+            first = stm_module.run_stm_propagation(propagation_params, opm_params)
+            second = stm_module.run_stm_propagation(propagation_params, opm_params)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(13, self.server.get_batch_count())
+        npt.assert_array_equal(first[0], second[0])
+        npt.assert_array_equal(first[1], second[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,282 @@
+"""
+    trajectory_archive.py
+
+    Binary archive of the trajectories of a run, so that results can be kept without
+    holding ephemeris text in memory or downloading it again.
+
+    An archive is a single file: an 8 byte header, then the states of every part of
+    every batch as rows of 7 little-endian float64s ([t, rx, ry, rz, vx, vy, vz] [s,
+    km, km/s], as from parse_stk_ephemeris), then an index of where each part's states
+    are and of each batch's metadata, as binary arrays, then a JSON footer describing
+    the index, then the length of the footer and the header again. States are appended
+    as results arrive, and the index is written when the archive is closed. Reopening
+    maps the states and the index into memory instead of reading them.
+"""
+
+from adam.ephemeris import COLUMNS
+from adam.ephemeris import parse_stk_ephemeris
+from adam.ephemeris import parse_stk_scenario_epoch
+from adam.ephemeris import stitch_ephemerides
+
+from datetime import datetime
+import json
+import numpy as np
+import os
+import struct
+import threading
+
+_MAGIC = b'ADAMTRJ\x01'
+_DTYPE = np.dtype('<f8')
+_EPOCH_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+_TRAILER = struct.Struct('<Q8s')
+
+class TrajectoryArchiveWriter(object):
+    """Writes a trajectory archive. Batches can be added in any order, from many
+    threads at once. Nothing can be read back until the writer is closed.
+
+    Can be used as a context manager, which closes it.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): file to write. It is replaced if it exists.
+        """
+        self._path = path
+        self._file = open(path, 'wb')
+        self._file.write(_MAGIC)
+        self._lock = threading.Lock()
+        self._rows = 0
+        # Metadata by batch index.
+        self._batches = {}
+
+    def __repr__(self):
+        return "Trajectory archive writer for %s [%s batches]" % (
+            self._path, len(self._batches))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_path(self):
+        return self._path
+
+    def add(self, index, state_summary, results, key=None):
+        """Adds the results of a batch.
+
+        Args:
+            index (int): position of the batch in the run.
+            state_summary (StateSummary): summary of the batch.
+            results (PropagationResults): results of the batch, or None. Parts that are
+                missing or have no ephemeris are recorded with no states.
+            key (str): key of the propagation, e.g. from result_cache.propagation_key.
+        """
+        arrays = []
+        epochs = []
+        for part in (results.get_parts() if results is not None else []):
+            ephemeris = part.get_ephemeris() if part is not None else None
+            if ephemeris is None:
+                arrays.append(np.empty((0, COLUMNS)))
+                epochs.append(None)
+                continue
+            # Use the states if they have already been parsed, but don't keep them on
+            # the part otherwise.
+            states = part.get_parsed_ephemeris_array()
+            if states is None:
+                states = parse_stk_ephemeris(ephemeris)
+            arrays.append(states)
+            epoch = parse_stk_scenario_epoch(ephemeris)
+            epochs.append(epoch.strftime(_EPOCH_FORMAT) if epoch is not None else None)
+        data = b''.join(np.ascontiguousarray(a, dtype=_DTYPE).tobytes() for a in arrays)
+
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("Archive %s is already closed" % (self._path))
+            starts = []
+            start = self._rows
+            for a in arrays:
+                starts.append(start)
+                start += len(a)
+            self._file.write(data)
+            self._rows = start
+            self._batches[index] = {
+                'uuid': state_summary.get_uuid() if state_summary else None,
+                'calc_state': state_summary.get_calc_state() if state_summary else None,
+                'key': key,
+                'part_starts': starts,
+                'part_counts': [len(a) for a in arrays],
+                'part_epochs': epochs}
+
+    def close(self):
+        """Writes the footer and closes the file."""
+        with self._lock:
+            if self._file is None:
+                return
+            count = max(self._batches) + 1 if self._batches else 0
+            empty = {'uuid': None, 'calc_state': None, 'key': None,
+                     'part_starts': [], 'part_counts': [], 'part_epochs': []}
+            batches = [self._batches.get(i, empty) for i in range(count)]
+
+            # The index is stored column by column as arrays that are mapped in on
+            # reopening, so that it doesn't have to be parsed. Calc states and scenario
+            # epochs, which take few distinct values, are stored as codes into tables.
+            calc_states = sorted(set(b['calc_state'] for b in batches
+                                     if b['calc_state'] is not None))
+            epochs = sorted(set(e for b in batches for e in b['part_epochs']
+                                if e is not None))
+            calc_state_codes = {c: i for i, c in enumerate(calc_states)}
+            epoch_codes = {e: i for i, e in enumerate(epochs)}
+            columns = {
+                'first_parts': np.cumsum([0] + [len(b['part_counts']) for b in batches],
+                                         dtype='<i8'),
+                'part_starts': np.array([s for b in batches for s in b['part_starts']],
+                                        dtype='<i8'),
+                'part_counts': np.array([c for b in batches for c in b['part_counts']],
+                                        dtype='<i8'),
+                'part_epochs': np.array([epoch_codes.get(e, -1)
+                                         for b in batches for e in b['part_epochs']],
+                                        dtype='<i4'),
+                'calc_states': np.array([calc_state_codes.get(b['calc_state'], -1)
+                                         for b in batches], dtype='<i2'),
+                'uuids': _to_fixed_width([b['uuid'] for b in batches]),
+                'keys': _to_fixed_width([b['key'] for b in batches])}
+
+            offset = len(_MAGIC) + self._rows * COLUMNS * _DTYPE.itemsize
+            sections = {}
+            for name, column in columns.items():
+                # Keep every column aligned for its type.
+                padding = -offset % 8
+                self._file.write(b'\0' * padding)
+                offset += padding
+                sections[name] = [offset, column.dtype.str, len(column)]
+                self._file.write(column.tobytes())
+                offset += column.nbytes
+
+            footer = json.dumps({'rows': self._rows,
+                                 'calc_states': calc_states,
+                                 'epochs': epochs,
+                                 'sections': sections}).encode('utf-8')
+            self._file.write(footer)
+            self._file.write(_TRAILER.pack(len(footer), _MAGIC))
+            self._file.close()
+            self._file = None
+
+def _to_fixed_width(strings):
+    # Missing strings are stored empty.
+    encoded = [s.encode('ascii') if s is not None else b'' for s in strings]
+    width = max([len(s) for s in encoded] + [1])
+    return np.array(encoded, dtype='S%s' % (width))
+
+def _map(path, offset, dtype, length):
+    if length == 0:
+        return np.empty(0, dtype=dtype)
+    # Indexing a plain array over the map is much quicker than indexing a memmap.
+    return np.asarray(np.memmap(path, dtype=dtype, mode='r', offset=offset,
+                                shape=(length,)))
+
+class TrajectoryArchive(object):
+    """A trajectory archive opened for reading. States are memory-mapped, so opening an
+    archive doesn't read them, and the arrays returned for parts are views into the
+    file rather than copies.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): archive to open.
+
+        Raises:
+            ValueError if the file is not a complete trajectory archive
+        """
+        self._path = path
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("%s is not a trajectory archive" % (path))
+            f.seek(-_TRAILER.size, os.SEEK_END)
+            footer_length, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+            if magic != _MAGIC:
+                raise ValueError("%s is incomplete: its writer was never closed" % (path))
+            f.seek(-_TRAILER.size - footer_length, os.SEEK_END)
+            footer = json.loads(f.read(footer_length).decode('utf-8'))
+
+        columns = {name: _map(path, *section)
+                   for name, section in footer['sections'].items()}
+        self._first_parts = columns['first_parts']
+        self._part_starts = columns['part_starts']
+        self._part_counts = columns['part_counts']
+        self._part_epoch_codes = columns['part_epochs']
+        self._calc_state_codes = columns['calc_states']
+        self._uuids = columns['uuids']
+        self._keys = columns['keys']
+        self._calc_states = footer['calc_states']
+        self._epochs = [datetime.strptime(e, _EPOCH_FORMAT) for e in footer['epochs']]
+
+        if footer['rows'] > 0:
+            self._all_states = np.memmap(path, dtype=_DTYPE, mode='r', offset=len(_MAGIC),
+                                         shape=(footer['rows'], COLUMNS))
+        else:
+            self._all_states = np.empty((0, COLUMNS), dtype=_DTYPE)
+        self._states = np.asarray(self._all_states)
+
+    def __repr__(self):
+        return "Trajectory archive %s [%s batches]" % (self._path, len(self))
+
+    def __len__(self):
+        return len(self._uuids)
+
+    def get_uuid(self, index):
+        uuid = self._uuids[index]
+        return uuid.decode('ascii') if uuid else None
+
+    def get_calc_state(self, index):
+        code = self._calc_state_codes[index]
+        return self._calc_states[code] if code >= 0 else None
+
+    def get_key(self, index):
+        key = self._keys[index]
+        return key.decode('ascii') if key else None
+
+    def get_parts_count(self, index):
+        return int(self._first_parts[index + 1] - self._first_parts[index])
+
+    def get_all_states(self):
+        """Returns the states of all parts of all batches, in the order they were
+        written, as a memory-mapped array."""
+        return self._all_states
+
+    def get_part_states(self, index, part_index):
+        """Returns the states of one part of a batch as an n x 7 array of
+        [t, rx, ry, rz, vx, vy, vz] [s, km, km/s], with t in seconds since the part's
+        scenario epoch. The array is a read-only view into the archive.
+
+        Args:
+            index (int): position of the batch in the run.
+            part_index (int): index of the part, from 0.
+        """
+        if not 0 <= part_index < self.get_parts_count(index):
+            raise IndexError("Batch %s has no part %s" % (index, part_index))
+        part = self._first_parts[index] + part_index
+        start = self._part_starts[part]
+        return self._states[start:start + self._part_counts[part]]
+
+    def get_scenario_epoch(self, index, part_index):
+        """Returns the scenario epoch (datetime, UTC) of a part of a batch."""
+        code = self._part_epoch_codes[self._first_parts[index] + part_index]
+        return self._epochs[code] if code >= 0 else None
+
+    def get_trajectory(self, index, epoch=None, time_scale='UTC'):
+        """Returns the states of all parts of a batch joined into one trajectory, as by
+        PropagationResults.get_trajectory, or None if any part has no ephemeris."""
+        parts = [(self.get_part_states(index, i), self.get_scenario_epoch(index, i))
+                 for i in range(self.get_parts_count(index))]
+        if len(parts) == 0 or any(epoch is None for states, epoch in parts):
+            return None
+        return stitch_ephemerides(parts, epoch, time_scale)
+
+    def close(self):
+        """Drops this archive's memory map. The file is unmapped once no arrays returned
+        from it are in use either."""
+        self._all_states = None
+        self._states = None
@@ -0,0 +1,134 @@
+from adam.batch import Batch
+from adam.batch import Batches
+from adam.batch import OpmParams
+from adam.batch import PropagationParams
+from adam.batch import PropagationResults
+from adam.batch import StateSummary
+from adam.batch_run_manager import BatchRunManager
+from adam.rest_proxy import RestRequests
+from adam.stand_in_server import StandInServer
+from adam.stand_in_server import make_stk_ephemeris
+from adam.trajectory_archive import TrajectoryArchive
+from adam.trajectory_archive import TrajectoryArchiveWriter
+import numpy as np
+import numpy.testing as npt
+import os
+import shutil
+import tempfile
+import unittest
+
+def get_results(parts_count, x=1.0):
+    return PropagationResults([{
+        'part_index': i + 1, 'calc_state': 'COMPLETED',
+        'stk_ephemeris': make_stk_ephemeris(3, start=2 * 86400 * i,
+            state_vector=[x, 2.0, 3.0, 4.0, 5.0, 6.0])} for i in range(parts_count)])
+
+class TrajectoryArchiveTest(unittest.TestCase):
+    """Unit tests for trajectory archive.
+
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'run.trj')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_and_read(self):
+        first = get_results(2)
+        second = get_results(1, x=5.0)
+        with TrajectoryArchiveWriter(self.path) as writer:
+            # Batches may arrive in any order.
+            writer.add(2, StateSummary({'uuid': 'b2', 'calc_state': 'COMPLETED'}), second,
+                       key='k2')
+            writer.add(0, StateSummary({'uuid': 'b0', 'calc_state': 'COMPLETED'}), first,
+                       key='k0')
+
+        archive = TrajectoryArchive(self.path)
+        self.assertEqual(3, len(archive))
+        self.assertEqual(['b0', None, 'b2'], [archive.get_uuid(i) for i in range(3)])
+        self.assertEqual('COMPLETED', archive.get_calc_state(0))
+        self.assertEqual('k2', archive.get_key(2))
+        self.assertEqual([2, 0, 1], [archive.get_parts_count(i) for i in range(3)])
+
+        states = archive.get_part_states(0, 1)
+        self.assertIsInstance(archive.get_all_states(), np.memmap)
+        self.assertTrue(np.shares_memory(archive.get_all_states(), states))
+        self.assertFalse(states.flags.writeable)
+        npt.assert_array_equal(first.get_parts()[1].get_ephemeris_array(), states)
+        npt.assert_array_equal(first.get_trajectory(), archive.get_trajectory(0))
+        npt.assert_array_equal(second.get_trajectory(epoch='2017-01-01T00:00:00Z'),
+                               archive.get_trajectory(2, epoch='2017-01-01T00:00:00Z'))
+        self.assertEqual(first.get_parts()[0].get_ephemeris_array().shape[0] * 2 +
+                         second.get_parts()[0].get_ephemeris_array().shape[0],
+                         len(archive.get_all_states()))
+        self.assertIsNone(archive.get_trajectory(1))
+        with self.assertRaises(IndexError):
+            archive.get_part_states(2, 1)
+        archive.close()
+
+    def test_missing_parts(self):
+        results = PropagationResults([None, {'part_index': 2, 'calc_state': 'FAILED'}])
+        with TrajectoryArchiveWriter(self.path) as writer:
+            writer.add(0, StateSummary({'uuid': 'b0', 'calc_state': 'FAILED'}), results)
+            writer.add(1, StateSummary({'uuid': 'b1', 'calc_state': 'FAILED'}), None)
+
+        archive = TrajectoryArchive(self.path)
+        self.assertEqual(2, archive.get_parts_count(0))
+        self.assertEqual((0, 7), archive.get_part_states(0, 1).shape)
+        self.assertIsNone(archive.get_trajectory(0))
+        self.assertEqual(0, archive.get_parts_count(1))
+
+    def test_incomplete(self):
+        writer = TrajectoryArchiveWriter(self.path)
+        writer.add(0, StateSummary({'uuid': 'b0', 'calc_state': 'COMPLETED'}),
+                   get_results(1))
+        writer._file.flush()
+        with self.assertRaises(ValueError):
+            TrajectoryArchive(self.path)
+        writer.close()
+        with self.assertRaises(RuntimeError):
+            writer.add(1, None, None)
+        self.assertEqual(1, len(TrajectoryArchive(self.path)))
+
+class TrajectoryArchiveRunTest(unittest.TestCase):
+    """Unit tests for archiving the trajectories of a run against a local stand-in
+    server.
+
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = StandInServer(parts_count=2, ephemeris_points=3).start()
+        self.rest = RestRequests(self.server.get_url())
+
+    def tearDown(self):
+        self.rest.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_run(self):
+        propagation_params = PropagationParams({'start_time': '2017-10-04T00:00:00Z',
+                                                'end_time': '2017-10-08T00:00:00Z',
+                                                'project_uuid': 'p1'})
+        batch_runs = [Batch(propagation_params, OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': [float(i), 2.0, 3.0, 4.0, 5.0, 6.0]})) for i in range(5)]
+
+        path = os.path.join(self.directory, 'run.trj')
+        with TrajectoryArchiveWriter(path) as writer:
+            manager = BatchRunManager(Batches(self.rest), batch_runs, do_timing=False,
+                                      trajectory_archive=writer)
+            manager.run()
+
+        archive = TrajectoryArchive(path)
+        self.assertEqual(5, len(archive))
+        for i, batch in enumerate(batch_runs):
+            self.assertEqual(batch.get_uuid(), archive.get_uuid(i))
+            self.assertEqual(manager.cache_keys[i], archive.get_key(i))
+            npt.assert_array_equal(batch.get_results().get_trajectory(),
+                                   archive.get_trajectory(i))
+
+if __name__ == '__main__':
+    unittest.main()
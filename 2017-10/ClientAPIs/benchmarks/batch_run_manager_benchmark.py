@@ -0,0 +1,65 @@
+"""
+    batch_run_manager_benchmark.py
+
+    Measures BatchRunManager.run() with and without multi-threading against a mock
+    rest proxy with a fixed per-call latency, so the numbers depend only on the client.
+
+    Usage: python batch_run_manager_benchmark.py [num_batches] [latency]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import BatchRunManager
+from adam import Batches
+from adam import OpmParams
+from adam import PollingScheduler
+from adam import PropagationParams
+from adam.rest_proxy import _ConcurrentRestProxyForTest
+
+import datetime
+
+
+def run(num_batches, latency, multi_threaded):
+    rest = _ConcurrentRestProxyForTest(latency=latency)
+    propagation_params = PropagationParams({
+        'start_time': '2017-10-04T00:00:00Z',
+        'end_time': '2027-10-04T00:00:00Z',
+        'project_uuid': 'p1'})
+    batch_runs = [Batch(propagation_params, OpmParams({
+        'epoch': '2017-10-04T00:00:00Z',
+        'state_vector': [i, 2, 3, 4, 5, 6]})) for i in range(num_batches)]
+
+    # Every submission chunk gets the same response, so uuids repeat across chunks.
+    # That doesn't matter here since every summary is the same.
+    summary = {'uuid': 'b', 'calc_state': 'COMPLETED', 'parts_count': 1}
+    for size in set([500, num_batches % 500]):
+        rest.expect_post('/batches', lambda data, size=size: len(data['requests']) == size,
+                         200, {'requests': [summary] * size}, times=None)
+    rest.expect_get('/batch?project_uuid=p1', 200, {'items': [summary]}, times=None)
+    rest.expect_get('/batch/b/1', 200, {'part_index': 1, 'calc_state': 'COMPLETED'},
+                    times=None)
+
+    # Every poll of the mock proxy finds the batches done, so there's no waiting to do.
+    manager = BatchRunManager(Batches(rest), batch_runs, do_timing=False,
+                              multi_threaded=multi_threaded,
+                              polling_scheduler=PollingScheduler(0, 0))
+    start = datetime.datetime.now()
+    manager.run()
+    return (datetime.datetime.now() - start).total_seconds()
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+
+    single = run(num_batches, latency, False)
+    multi = run(num_batches, latency, True)
+    print("%s batches, %.3fs per call: %.2fs single-threaded, %.2fs multi-threaded (x%.2f)" % (
+        num_batches, latency, single, multi, single / multi))
+
+
+if __name__ == '__main__':
+    main()
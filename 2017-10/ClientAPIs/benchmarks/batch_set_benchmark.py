@@ -0,0 +1,61 @@
+"""
+    batch_set_benchmark.py
+
+    Measures the memory needed to describe a large homogeneous run as individual Batch
+    objects (as many_batch_run.ipynb does) and as a BatchSet.
+
+    Usage: python batch_set_benchmark.py [num_batches]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import BatchSet
+from adam import OpmParams
+from adam import PropagationParams
+
+import numpy as np
+import tracemalloc
+
+
+def measure(build):
+    tracemalloc.start()
+    runs = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    propagation_params = PropagationParams({
+        'start_time': '2017-10-04T00:00:00Z',
+        'end_time': '2027-10-04T00:00:00Z',
+        'project_uuid': 'ffffffff-ffff-ffff-ffff-ffffffffffff'})
+    state_vectors = np.tile([130347560.13690618, -74407287.6018632, -35247598.541470632,
+                             23.935241263310683, 27.146279819258538, 10.346605942591514],
+                            (num_batches, 1))
+    state_vectors[:, 0] += np.arange(num_batches)
+    state_vector_lists = state_vectors.tolist()
+
+    def build_batches():
+        return [Batch(propagation_params, OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': state_vector_lists[i]})) for i in range(num_batches)]
+
+    def build_batch_set():
+        return BatchSet(propagation_params, OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': state_vector_lists[0]}), state_vectors)
+
+    batches = measure(build_batches)
+    batch_set = measure(build_batch_set)
+    print("%s batches: %.0f bytes per batch as Batch objects, %.0f as a BatchSet" % (
+        num_batches, batches / num_batches, batch_set / num_batches))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+    compression_benchmark.py
+
+    Measures bytes on the wire and wall-clock time for bulk /batches submissions and
+    multi-part ephemeris downloads against a local stand-in server, with and without
+    gzip compression.
+
+    The stand-in server throttles bodies to a fixed bandwidth, since on loopback
+    compression only costs CPU time.
+
+    Usage: python compression_benchmark.py [batches_per_post] [parts_count]
+        [points_per_part] [bandwidth_bytes_per_sec]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam import RestRequests
+from adam.stand_in_server import StandInServer
+
+import datetime
+
+
+def timed(func):
+    start = datetime.datetime.now()
+    func()
+    return (datetime.datetime.now() - start).total_seconds()
+
+
+def run(compress, batches_per_post, parts_count, points_per_part, bandwidth,
+        repeats=5):
+    server = StandInServer(parts_count=parts_count, ephemeris_points=points_per_part,
+                           compress_responses=compress, bandwidth=bandwidth).start()
+    rest = RestRequests(server.get_url(), compress_requests=compress,
+                        accept_compressed=compress)
+    batches = Batches(rest)
+
+    propagation_params = PropagationParams({
+        'start_time': '2017-10-04T00:00:00Z',
+        'end_time': '2027-10-04T00:00:00Z',
+        'project_uuid': 'ffffffff-ffff-ffff-ffff-ffffffffffff'})
+    pairs = []
+    for i in range(batches_per_post):
+        pairs.append([propagation_params, OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': [130347560.13690618 + i, -74407287.6018632,
+                             -35247598.541470632, 23.935241263310683,
+                             27.146279819258538, 10.346605942591514]})])
+
+    post_time = timed(lambda: [batches.new_batches(pairs) for i in range(repeats)])
+    post_bytes = server.get_bytes_received() / repeats
+
+    summary = batches.get_summary(server.add_batch())
+    sent_before = server.get_bytes_sent()
+    get_time = timed(lambda: [batches.get_propagation_results(summary)
+                              for i in range(repeats)])
+    get_bytes = (server.get_bytes_sent() - sent_before) / repeats
+
+    rest.close()
+    server.stop()
+    return post_bytes, post_time / repeats, get_bytes, get_time / repeats
+
+
+def main():
+    batches_per_post = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    parts_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    points_per_part = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    # 20 Mbit/s.
+    bandwidth = float(sys.argv[4]) if len(sys.argv) > 4 else 2.5e6
+
+    for compress in [False, True]:
+        post_bytes, post_time, get_bytes, get_time = run(
+            compress, batches_per_post, parts_count, points_per_part, bandwidth)
+        print("%-12s POST /batches (%s OPMs): %10d bytes, %.3fs | "
+              "GET %s parts: %10d bytes, %.3fs" % (
+                  "gzip" if compress else "uncompressed", batches_per_post,
+                  post_bytes, post_time, parts_count, get_bytes, get_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+    ephemeris_parsing_benchmark.py
+
+    Compares the time taken to get the end state of a part's ephemeris by parsing every
+    line, as PropagationResults.get_end_state_vector used to, against parsing the whole
+    ephemeris into an array and against reading back only the last state.
+
+    Usage: python ephemeris_parsing_benchmark.py [ephemeris_points]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam.ephemeris import parse_stk_end_state
+from adam.ephemeris import parse_stk_ephemeris
+from adam.stand_in_server import make_stk_ephemeris
+
+import timeit
+
+
+def end_state_line_by_line(stk_ephemeris):
+    state_vectors = []
+    for line in stk_ephemeris.splitlines():
+        split_line = line.split()
+        if len(split_line) >= 7:
+            state_vector = [(float(i) * 1E-3) for i in split_line]
+            state_vectors.append(state_vector[1:7])
+    return state_vectors[-1]
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 3650
+    stk_ephemeris = make_stk_ephemeris(points)
+    repeats = 20
+
+    def time(func):
+        return timeit.timeit(lambda: func(stk_ephemeris), number=repeats) / repeats
+
+    line_by_line = time(end_state_line_by_line)
+    array = time(parse_stk_ephemeris)
+    tail = time(parse_stk_end_state)
+    print("%s points: %.2f ms line by line, %.2f ms as an array (%.1fx), "
+          "%.3f ms reading back the end (%.0fx)" % (
+              points, line_by_line * 1e3, array * 1e3, line_by_line / array,
+              tail * 1e3, line_by_line / tail))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+    hedging_benchmark.py
+
+    Measures part retrieval with and without hedged GETs against a local stand-in
+    server where a small fraction of requests are very slow, using the same thread
+    count as BatchRunManager uses for results.
+
+    Usage: python hedging_benchmark.py [num_requests] [tail_latency] [tail_latency_rate]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import BatchRunManager
+from adam import HedgingRestProxy
+from adam import RestRequests
+from adam.stand_in_server import StandInServer
+
+from multiprocessing.dummy import Pool as ThreadPool
+import datetime
+
+
+def run(rest, batch, num_requests):
+    pool = ThreadPool(BatchRunManager.RESULTS_THREADS)
+    start = datetime.datetime.now()
+    codes = pool.map(lambda i: rest.get('/batch/%s/1' % (batch))[0], range(num_requests))
+    elapsed = (datetime.datetime.now() - start).total_seconds()
+    pool.close()
+    pool.join()
+    assert codes == [200] * num_requests
+    return elapsed
+
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    tail_latency = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    tail_latency_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+
+    server = StandInServer(ephemeris_points=100, latency=0.01, tail_latency=tail_latency,
+                           tail_latency_rate=tail_latency_rate, seed=0).start()
+    batch = server.add_batch()
+    rest = RestRequests(server.get_url())
+    try:
+        plain = run(rest, batch, num_requests)
+        hedging = HedgingRestProxy(rest)
+        hedged = run(hedging, batch, num_requests)
+        hedging.close()
+    finally:
+        rest.close()
+        server.stop()
+
+    stats = hedging.get_stats()
+    print("%s GETs: %.2fs unhedged, %.2fs hedged (x%.2f)" % (
+        num_requests, plain, hedged, plain / hedged))
+    print("%s hedges sent, %s won, %.2fs of waiting saved; p99 %.3fs instead of %.3fs" % (
+        stats['hedges'], stats['hedge_wins'], stats['time_saved'],
+        stats['observed_p99'], stats['unhedged_p99']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+    interpolation_benchmark.py
+
+    Measures the time taken to interpolate the states of many batches at many times:
+    with one EphemerisInterpolator per batch, with one interpolator for all batches at
+    once, and, for a sample of queries, by scanning each ephemeris for the states
+    around every time.
+
+    Usage: python interpolation_benchmark.py [num_batches] [num_times]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam.ephemeris import EphemerisInterpolator
+
+import numpy as np
+import time
+
+
+def interpolate_by_scanning(states, t):
+    # Linear scan for the segment, then cubic Hermite, one query at a time.
+    for i in range(len(states) - 1):
+        if states[i + 1, 0] >= t:
+            break
+    t0, t1 = states[i, 0], states[i + 1, 0]
+    h = t1 - t0
+    s = (t - t0) / h
+    p0, p1 = states[i, 1:4], states[i + 1, 1:4]
+    v0, v1 = states[i, 4:7] * h, states[i + 1, 4:7] * h
+    return ((2 * s ** 3 - 3 * s ** 2 + 1) * p0 + (s ** 3 - 2 * s ** 2 + s) * v0 +
+            (-2 * s ** 3 + 3 * s ** 2) * p1 + (s ** 3 - s ** 2) * v1)
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_times = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    # Ten years of daily states for every batch.
+    times = np.arange(3651) * 86400.0
+    random = np.random.RandomState(0)
+    trajectories = np.empty((num_batches, len(times), 7))
+    trajectories[:, :, 0] = times
+    trajectories[:, :, 1:4] = random.uniform(-1e8, 1e8, (num_batches, 1, 3)) + \
+        np.cos(times / 3e7)[np.newaxis, :, np.newaxis] * 1e8
+    trajectories[:, :, 4:7] = -np.sin(times / 3e7)[np.newaxis, :, np.newaxis] * 1e8 / 3e7
+    query = np.sort(random.uniform(times[0], times[-1], num_times))
+
+    start = time.perf_counter()
+    for trajectory in trajectories:
+        EphemerisInterpolator(trajectory).get_states(query)
+    per_batch = time.perf_counter() - start
+
+    start = time.perf_counter()
+    EphemerisInterpolator(trajectories).get_states(query)
+    together = time.perf_counter() - start
+
+    sample = 2000
+    start = time.perf_counter()
+    for i in range(sample):
+        interpolate_by_scanning(trajectories[i % num_batches], query[i % num_times])
+    scanning = (time.perf_counter() - start) * num_batches * num_times / sample
+
+    print("%s batches x %s times: ~%.1fs scanning, %.2fs per batch (%.0fx), "
+          "%.2fs together (%.0fx)" % (num_batches, num_times, scanning, per_batch,
+                                      scanning / per_batch, together, scanning / together))
+
+
+if __name__ == '__main__':
+    main()
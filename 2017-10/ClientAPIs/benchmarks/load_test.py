@@ -0,0 +1,65 @@
+"""
+    load_test.py
+
+    Runs BatchRunManager end to end against a local stand-in server, to see how
+    submission, polling and results retrieval scale with the number of batches and how
+    they hold up under injected latency and errors.
+
+    Usage: python load_test.py [num_batches] [latency] [error_rate]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import BatchRunManager
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam import RestRequests
+from adam.stand_in_server import StandInServer
+
+import datetime
+
+
+def make_batch_runs(num_batches, project):
+    propagation_params = PropagationParams({
+        'start_time': '2017-10-04T00:00:00Z',
+        'end_time': '2027-10-04T00:00:00Z',
+        'project_uuid': project})
+    return [Batch(propagation_params, OpmParams({
+        'epoch': '2017-10-04T00:00:00Z',
+        'state_vector': [130347560.13690618 + i, -74407287.6018632, -35247598.541470632,
+                         23.935241263310683, 27.146279819258538, 10.346605942591514]}))
+        for i in range(num_batches)]
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    server = StandInServer(parts_count=1, ephemeris_points=2, latency=latency,
+                           error_rate=error_rate, queue_delay=1, run_duration=2,
+                           workers=1000, seed=0).start()
+    rest = RestRequests(server.get_url())
+    batch_runs = make_batch_runs(num_batches, 'ffffffff-ffff-ffff-ffff-ffffffffffff')
+    manager = BatchRunManager(Batches(rest), batch_runs)
+
+    start = datetime.datetime.now()
+    try:
+        manager.run()
+    finally:
+        elapsed = (datetime.datetime.now() - start).total_seconds()
+        rest.close()
+        server.stop()
+
+    statuses = manager.get_latest_statuses()
+    print("%s batches in %.1fs: %s completed, %s failed, %s requests over %s connections" % (
+        num_batches, elapsed, len(statuses['COMPLETED']), len(statuses['FAILED']),
+        server.get_request_count(), server.get_connection_count()))
+
+
+if __name__ == '__main__':
+    main()
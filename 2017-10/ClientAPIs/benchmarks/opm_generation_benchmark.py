@@ -0,0 +1,56 @@
+"""
+    opm_generation_benchmark.py
+
+    Compares the time taken to generate OPMs one OpmParams at a time, as batch
+    submission used to, against generating them from a compiled OpmTemplate, one at a
+    time and all at once.
+
+    Usage: python opm_generation_benchmark.py [number_of_opms]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import OpmParams
+from adam.opm_template import OpmTemplate
+
+import numpy as np
+import time
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    state_vectors = np.random.rand(count, 6) * 1e8
+    opm_params = OpmParams({
+        'epoch': '2017-10-04T00:00:00Z',
+        'state_vector': state_vectors[0].tolist(),
+        'covariance': [1.0] * 21})
+
+    start = time.perf_counter()
+    for i in range(count):
+        OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': state_vectors[i].tolist(),
+            'covariance': [1.0] * 21}).generate_opm()
+    per_object = time.perf_counter() - start
+
+    start = time.perf_counter()
+    template = OpmTemplate(opm_params)
+    for i in range(count):
+        template.generate_opm({'state_vector': state_vectors[i].tolist()})
+    per_template_call = time.perf_counter() - start
+
+    start = time.perf_counter()
+    OpmTemplate(opm_params).generate_opms({'state_vector': state_vectors})
+    bulk = time.perf_counter() - start
+
+    print("%s OPMs: %.3fs per OpmParams, %.3fs per template call (%.1fx), "
+          "%.3fs in bulk (%.1fx)" % (count, per_object, per_template_call,
+                                     per_object / per_template_call, bulk,
+                                     per_object / bulk))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+    part_retrieval_benchmark.py
+
+    Compares the time taken, and the bytes downloaded, to get the results of a batch
+    with many parts from a local stand-in server that imitates network latency: all
+    parts one at a time, as Batches.get_propagation_results used to, all parts several
+    at a time, only the last part, and only the parts covering a day.
+
+    Usage: python part_retrieval_benchmark.py [parts_count] [latency]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam.batch import LAST_PART
+from adam.rest_proxy import AuthorizingRestProxy
+from adam.rest_proxy import RestRequests
+from adam.stand_in_server import StandInServer
+
+import time
+
+
+def main():
+    parts_count = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    server = StandInServer(parts_count=parts_count, ephemeris_points=1441,
+                           latency=latency).start()
+    rest = RestRequests(server.get_url())
+    try:
+        batches = Batches(AuthorizingRestProxy(rest, 'token'))
+        # Each part covers a day, in steps of a minute.
+        batch = Batch(PropagationParams({
+            'start_time': '2017-10-04T00:00:00Z',
+            'end_time': '2017-10-05T00:00:00Z',
+            'step_size': 60,
+            'project_uuid': 'p1'}), OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': [130347560.13690618, -74407287.6018632, -35247598.541470632,
+                             23.935241263310683, 27.146279819258538, 10.346605942591514]}))
+        summary = batches.new_batch(batch.get_propagation_params(),
+                                    batch.get_opm_params())
+
+        def measure(name, **kwargs):
+            sent = server.get_bytes_sent()
+            requests = server.get_request_count()
+            start = time.time()
+            results = batches.get_propagation_results(summary, **kwargs)
+            elapsed = time.time() - start
+            retrieved = len([p for p in results.get_parts() if p is not None])
+            print("%-22s %6.3f s, %3s requests, %9s bytes, %s of %s parts" % (
+                name, elapsed, server.get_request_count() - requests,
+                server.get_bytes_sent() - sent, retrieved, parts_count))
+            return elapsed
+
+        sequential = measure("All, one at a time:", threads=1)
+        concurrent = measure("All, concurrently:")
+        last = measure("Last part only:", parts=LAST_PART)
+        window = measure("One day window:", time_window=[
+            '2017-10-09T06:00:00Z', '2017-10-09T18:00:00Z'])
+        print("Concurrent retrieval is %.1fx faster, the last part alone %.1fx, "
+              "a window %.1fx" % (sequential / concurrent, sequential / last,
+                                  sequential / window))
+    finally:
+        rest.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+    pipelined_run_benchmark.py
+
+    Compares the end-to-end time of BatchRunManager.run() with submission, polling and
+    results retrieval as separate phases against the pipelined mode, which retrieves
+    the results of each batch as soon as it finishes. Batches run against a stand-in
+    server, in its own process, that runs a limited number at once, so that they finish
+    in waves over the run, as they do on the real server.
+
+    Usage: python pipelined_run_benchmark.py [num_batches] [workers] [run_duration]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import BatchRunManager
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam.rest_proxy import AuthorizingRestProxy
+from adam.rest_proxy import RestRequests
+from adam.stand_in_server import StandInServer
+
+import multiprocessing
+import time
+
+
+def serve(urls, workers, run_duration):
+    # Every request takes a few milliseconds, and every part is a year of daily states.
+    server = StandInServer(ephemeris_points=366, latency=0.005, workers=workers,
+                           run_duration=run_duration).start()
+    urls.put(server.get_url())
+    while True:
+        time.sleep(1)
+
+
+def run(num_batches, workers, run_duration, pipelined):
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(urls, workers, run_duration),
+                                     daemon=True)
+    server.start()
+    rest = RestRequests(urls.get())
+    try:
+        batch_runs = [Batch(PropagationParams({
+            'start_time': '2017-10-04T00:00:00Z',
+            'end_time': '2018-10-04T00:00:00Z',
+            'project_uuid': 'p1'}), OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': [i, 2, 3, 4, 5, 6]})) for i in range(num_batches)]
+        manager = BatchRunManager(Batches(AuthorizingRestProxy(rest, 'token')),
+                                  batch_runs, do_timing=False, pipelined=pipelined)
+        start = time.time()
+        manager.run()
+        return time.time() - start
+    finally:
+        rest.close()
+        server.terminate()
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    run_duration = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+
+    phased = run(num_batches, workers, run_duration, False)
+    pipelined = run(num_batches, workers, run_duration, True)
+    print("%s batches, %s at a time for %.1fs each (%.1fs of running): %.2fs in phases, "
+          "%.2fs pipelined (x%.2f)" % (
+              num_batches, workers, run_duration,
+              run_duration * num_batches / workers, phased, pipelined, phased / pipelined))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+    polling_benchmark.py
+
+    Compares waiting for a run's batches by polling in a busy loop, as
+    BatchRunManager used to, against polling as a PollingScheduler schedules it: the
+    number of polls sent, the client CPU time spent, and how long after the last batch
+    finished the run was seen to be complete. Batches run against a stand-in server, in
+    its own process, that runs a limited number at once.
+
+    Usage: python polling_benchmark.py [num_batches] [workers] [run_duration]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import BatchRunManager
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam.polling_scheduler import PollingScheduler
+from adam.rest_proxy import AuthorizingRestProxy
+from adam.rest_proxy import RestRequests
+from adam.stand_in_server import StandInServer
+
+import multiprocessing
+import time
+
+
+def serve(urls, workers, run_duration):
+    server = StandInServer(latency=0.005, workers=workers,
+                           run_duration=run_duration).start()
+    urls.put(server.get_url())
+    while True:
+        time.sleep(1)
+
+
+class CountingBatches(Batches):
+    def __init__(self, rest):
+        Batches.__init__(self, rest)
+        self.polls = 0
+
+    def _get_summaries(self, project):
+        self.polls += 1
+        return Batches._get_summaries(self, project)
+
+
+def run(num_batches, workers, run_duration, polling_scheduler):
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(urls, workers, run_duration),
+                                     daemon=True)
+    server.start()
+    rest = RestRequests(urls.get())
+    try:
+        batch_runs = [Batch(PropagationParams({
+            'start_time': '2017-10-04T00:00:00Z',
+            'end_time': '2017-10-05T00:00:00Z',
+            'project_uuid': 'p1'}), OpmParams({
+            'epoch': '2017-10-04T00:00:00Z',
+            'state_vector': [i, 2, 3, 4, 5, 6]})) for i in range(num_batches)]
+        batches = CountingBatches(AuthorizingRestProxy(rest, 'token'))
+        manager = BatchRunManager(batches, batch_runs, do_timing=False,
+                                  polling_scheduler=polling_scheduler)
+        manager._submit()
+        start = time.time()
+        cpu_start = time.process_time()
+        manager._wait_for_completion()
+        cpu = time.process_time() - cpu_start
+        elapsed = time.time() - start
+        return batches.polls, cpu, elapsed
+    finally:
+        rest.close()
+        server.terminate()
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    run_duration = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+    expected = run_duration * ((num_batches + workers - 1) // workers)
+
+    print("%s batches, %s at a time for %.1fs each (%.1fs of running):" % (
+        num_batches, workers, run_duration, expected))
+    for name, scheduler in [
+            ("Busy loop:", PollingScheduler(min_interval=0, max_interval=0)),
+            ("Scheduled:", PollingScheduler())]:
+        polls, cpu, elapsed = run(num_batches, workers, run_duration, scheduler)
+        print("%-12s %5s polls, %6.2fs of client CPU, done %+.2fs from the expected "
+              "end" % (name, polls, cpu, elapsed - expected))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+    record_memory_benchmark.py
+
+    Measures the client memory held per batch once a BatchRunManager run has finished:
+    the Batch objects, their state summaries and their results, without the
+    parameters they were created from. The run is repeated
+    with copies of the record classes that keep their attributes in a per-instance
+    __dict__, as they used to, to compare against their __slots__ versions. The stand-in
+    server runs in a separate process so that its memory isn't counted.
+
+    Usage: python record_memory_benchmark.py [num_batches]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import BatchRunManager
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam import RestRequests
+import adam.batch
+from adam.stand_in_server import StandInServer
+
+import multiprocessing
+import time
+import tracemalloc
+
+RECORD_CLASSES = ['Batch', 'StateSummary', 'PropagationResults']
+
+PART = {'part_index': 1, 'calc_state': 'COMPLETED', 'stk_ephemeris': 'stk.v.10.0\n'}
+
+
+def serve(urls):
+    server = StandInServer().start()
+    urls.put(server.get_url())
+    while True:
+        time.sleep(1)
+
+
+def without_slots(cls):
+    """Copy of a record class that stores its attributes in a __dict__."""
+    namespace = {}
+    for name, value in cls.__dict__.items():
+        if name == '__slots__' or name in cls.__slots__:
+            continue
+        if isinstance(value, type) and '__slots__' in value.__dict__:
+            value = without_slots(value)
+        namespace[name] = value
+    return type(cls.__name__, (object,), namespace)
+
+
+def measure(rest, batch_class, num_batches, propagation_params):
+    batch_runs = [batch_class(propagation_params, OpmParams({
+        'epoch': '2017-10-04T00:00:00Z',
+        'state_vector': [130347560.13690618 + i, -74407287.6018632, -35247598.541470632,
+                         23.935241263310683, 27.146279819258538, 10.346605942591514]}))
+        for i in range(num_batches)]
+    manager = BatchRunManager(Batches(rest), batch_runs, do_timing=False)
+
+    # Retrieving results takes a request per batch, so that part of the run is left
+    # out and every batch is given the same results instead. The parameters of the
+    # batches are the same either way and aren't counted.
+    tracemalloc.start()
+    manager._submit()
+    manager._wait_for_completion()
+    for batch in batch_runs:
+        batch.set_results(adam.batch.PropagationResults([PART]))
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held / num_batches
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(urls,), daemon=True)
+    server.start()
+    rest = RestRequests(urls.get())
+
+    propagation_params = PropagationParams({
+        'start_time': '2017-10-04T00:00:00Z',
+        'end_time': '2027-10-04T00:00:00Z',
+        'project_uuid': 'ffffffff-ffff-ffff-ffff-ffffffffffff'})
+
+    slotted = {name: getattr(adam.batch, name) for name in RECORD_CLASSES}
+    after = measure(rest, Batch, num_batches, propagation_params)
+    for name in RECORD_CLASSES:
+        setattr(adam.batch, name, without_slots(slotted[name]))
+    before = measure(rest, adam.batch.Batch, num_batches, propagation_params)
+    for name in RECORD_CLASSES:
+        setattr(adam.batch, name, slotted[name])
+
+    rest.close()
+    server.terminate()
+
+    print("%s batches: %.0f bytes per batch with __dict__ records, %.0f with __slots__" % (
+        num_batches, before, after))
+
+
+if __name__ == '__main__':
+    main()
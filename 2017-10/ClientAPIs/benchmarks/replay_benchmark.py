@@ -0,0 +1,92 @@
+"""
+    replay_benchmark.py
+
+    Records a BatchRunManager run to a cassette, or replays a cassette with the network
+    taken out to measure the client-side overhead of Batches and BatchRunManager.
+
+    Usage:
+        python replay_benchmark.py record <cassette> [num_batches]
+            Runs num_batches one-day propagations against the test account.
+        python replay_benchmark.py replay <cassette> [delay_factor]
+            Replays the run. delay_factor 0 (the default) takes the network out
+            entirely, 1 replays at recorded speed.
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import BatchRunManager
+from adam import Batches
+from adam import OpmParams
+from adam import PollingScheduler
+from adam import PropagationParams
+from adam import Service
+from adam.recording_rest_proxy import RecordingRestProxy
+from adam.recording_rest_proxy import ReplayRestProxy
+
+import datetime
+import json
+
+
+def new_batches(project, num_batches):
+    propagation_params = PropagationParams({
+        'start_time': '2017-10-04T00:00:00Z',
+        'end_time': '2017-10-05T00:00:00Z',
+        'project_uuid': project})
+    return [Batch(propagation_params, OpmParams({
+        'epoch': '2017-10-04T00:00:00Z',
+        'state_vector': [130347560.13690618 + i, -74407287.6018632, -35247598.541470632,
+                         23.935241263310683, 27.146279819258538, 10.346605942591514]}))
+        for i in range(num_batches)]
+
+
+def record(cassette, num_batches):
+    service = Service()
+    if not service.setup_with_test_account():
+        print("Unable to set up service")
+        return
+    try:
+        recorder = RecordingRestProxy(service.get_rest(), cassette)
+        batches = new_batches(service.get_working_project().get_uuid(), num_batches)
+        BatchRunManager(Batches(recorder), batches).run()
+        recorder.close()
+    finally:
+        service.teardown()
+
+
+def replay(cassette, delay_factor):
+    # Rebuild the same run from what was submitted.
+    project = None
+    num_batches = 0
+    with open(cassette, 'r') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry['method'] == 'POST' and entry['path'] == '/batches':
+                project = entry['data']['requests'][0]['project']
+                num_batches += len(entry['data']['requests'])
+
+    replay = ReplayRestProxy(cassette, delay_factor)
+    batches = new_batches(project, num_batches)
+    start = datetime.datetime.now()
+    # The recording already paces the polls, so don't wait between them as well.
+    BatchRunManager(Batches(replay), batches, do_timing=False,
+                    polling_scheduler=PollingScheduler(0, 0)).run()
+    elapsed = (datetime.datetime.now() - start).total_seconds()
+    print("Replayed %s batches in %.3fs (%s recorded calls unused)" % (
+        num_batches, elapsed, replay.get_unused_count()))
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ['record', 'replay']:
+        print(__doc__)
+        return
+    if sys.argv[1] == 'record':
+        record(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 100)
+    else:
+        replay(sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)
+
+
+if __name__ == '__main__':
+    main()
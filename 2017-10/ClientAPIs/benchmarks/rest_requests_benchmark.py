@@ -0,0 +1,63 @@
+"""
+    rest_requests_benchmark.py
+
+    Measures requests/sec against a local stand-in server with and without pooled
+    keep-alive connections, using the same thread counts as BatchRunManager.
+
+    Usage: python rest_requests_benchmark.py [num_requests]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import BatchRunManager
+from adam import RestRequests
+from adam.stand_in_server import StandInServer
+
+from multiprocessing.dummy import Pool as ThreadPool
+import datetime
+import requests
+
+
+class UnpooledRestRequests(RestRequests):
+    """Old behavior: every call opens (and closes) its own connection."""
+
+    def get(self, path):
+        req = requests.get(self._base_url + path)
+        return req.status_code, req.json()
+
+
+def run(rest, batch, num_requests, threads):
+    def _get(i):
+        code, response = rest.get('/batch/%s/1' % (batch))
+        assert code == 200
+
+    pool = ThreadPool(threads)
+    start = datetime.datetime.now()
+    pool.map(_get, range(num_requests))
+    elapsed = (datetime.datetime.now() - start).total_seconds()
+    pool.close()
+    pool.join()
+    return num_requests / elapsed
+
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    server = StandInServer().start()
+    batch = server.add_batch()
+    try:
+        for threads in [1, BatchRunManager.RESULTS_THREADS,
+                        BatchRunManager.MAX_SUBMISSION_THREADS]:
+            unpooled = run(UnpooledRestRequests(server.get_url()), batch, num_requests, threads)
+            pooled_rest = RestRequests(server.get_url())
+            pooled = run(pooled_rest, batch, num_requests, threads)
+            pooled_rest.close()
+            print("%2s threads: %8.1f req/s unpooled, %8.1f req/s pooled (x%.2f)" % (
+                threads, unpooled, pooled, pooled / unpooled))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+    status_tracking_benchmark.py
+
+    Measures the client-side time of one poll of a large run's batch states, as
+    BatchRunManager used to do it (a summary for every batch of the project, every
+    batch of the run updated, and the statuses rebuilt) and as it does now (summaries
+    only for the run's batches, and work only for those whose state changed). The
+    server's response is canned, so no time is spent on the network.
+
+    Usage: python status_tracking_benchmark.py [num_batches] [other_batches] [changed]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batch
+from adam import BatchRunManager
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam.batch import StateSummary
+
+import timeit
+
+
+class CannedBatches(Batches):
+    """Batches that answer every listing of the project's batches with the same items,
+    and every submission with PENDING."""
+
+    def __init__(self, items):
+        Batches.__init__(self, None)
+        self.items = items
+        self.submitted = 0
+
+    def _get_summaries(self, project):
+        return self.items
+
+    def new_batches(self, params):
+        start = self.submitted
+        self.submitted += len(params)
+        return [StateSummary({'uuid': 'b%s' % (i), 'calc_state': 'PENDING'})
+                for i in range(start, self.submitted)]
+
+
+def poll_before(manager):
+    """One poll as BatchRunManager._update_state used to do it."""
+    summaries_by_uuid = manager.batches_module.get_summaries(manager.project)
+    for i in manager.submitted:
+        batch = manager.batch_runs[i]
+        batch.set_state_summary(summaries_by_uuid[batch.get_uuid()])
+    complete = True
+    for b in manager.batch_runs:
+        if not b.get_calc_state() in ['COMPLETED', 'FAILED']:
+            complete = False
+            break
+    status = {'PENDING': [], 'RUNNING': [], 'COMPLETED': [], 'FAILED': []}
+    for b in manager.batch_runs:
+        status[b.get_calc_state()].append(b.get_uuid())
+    return complete, status
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    other_batches = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    changed = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    propagation_params = PropagationParams({
+        'start_time': '2017-10-04T00:00:00Z',
+        'end_time': '2017-10-05T00:00:00Z',
+        'project_uuid': 'p1'})
+    opm_params = OpmParams({'epoch': '2017-10-04T00:00:00Z',
+                            'state_vector': [1, 2, 3, 4, 5, 6]})
+    batch_runs = [Batch(propagation_params, opm_params) for i in range(num_batches)]
+
+    # The run's batches are all PENDING except for some that have started RUNNING, and
+    # the project also lists the COMPLETED batches of earlier runs.
+    items = [{'uuid': 'b%s' % (i), 'calc_state': 'RUNNING' if i < changed else 'PENDING'}
+             for i in range(num_batches)] + \
+            [{'uuid': 'old%s' % (i), 'calc_state': 'COMPLETED'}
+             for i in range(other_batches)]
+    manager = BatchRunManager(CannedBatches(items), batch_runs, do_timing=False,
+                              multi_threaded=False)
+    manager._submit()
+
+    repeats = 5
+    before = timeit.timeit(lambda: poll_before(manager), number=repeats) / repeats
+
+    def poll_after():
+        # Put the batches that change back, so that every poll sees them change.
+        manager._set_state_summaries(
+            [(i, StateSummary({'uuid': 'b%s' % (i), 'calc_state': 'PENDING'}))
+             for i in range(changed)])
+        manager._update_state()
+    after = timeit.timeit(poll_after, number=repeats) / repeats
+    print("%s batches, %s from other runs, %s changing state: %.3fs per poll before, "
+          "%.3fs after (x%.1f)" % (num_batches, other_batches, changed, before, after,
+                                   before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+    streaming_submission_benchmark.py
+
+    Measures peak client memory while sending the body of a /batches submission
+    streamed, as Batches.new_batches does, against building the whole body up front as
+    new_batches used to. The body is sent to a path the stand-in server answers with a
+    short 404, so that parsing the response isn't counted, and the server runs in a
+    separate process so that its memory isn't counted either.
+
+    Usage: python streaming_submission_benchmark.py [batches_per_post]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import Batches
+from adam import OpmParams
+from adam import PropagationParams
+from adam import RestRequests
+from adam.rest_proxy import JsonArrayStream
+from adam.stand_in_server import StandInServer
+
+import multiprocessing
+import time
+import tracemalloc
+
+DISCARD_PATH = '/discard'
+
+
+def serve(urls):
+    server = StandInServer().start()
+    urls.put(server.get_url())
+    while True:
+        time.sleep(1)
+
+
+def post_unstreamed(rest, pairs):
+    # Old behavior: every batch's creation data is built before sending.
+    batches = Batches(rest)
+    batch_dicts = [batches._build_batch_creation_data(p[0], p[1]) for p in pairs]
+    rest.post(DISCARD_PATH, {'requests': batch_dicts})
+
+
+def post_streamed(rest, pairs):
+    batches = Batches(rest)
+    rest.post(DISCARD_PATH, {'requests': JsonArrayStream(
+        pairs, lambda p: batches._build_batch_creation_data(p[0], p[1]))})
+
+
+def measure(post, rest, pairs):
+    tracemalloc.start()
+    post(rest, pairs)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    batches_per_post = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(urls,), daemon=True)
+    server.start()
+    rest = RestRequests(urls.get())
+
+    propagation_params = PropagationParams({
+        'start_time': '2017-10-04T00:00:00Z',
+        'end_time': '2027-10-04T00:00:00Z',
+        'project_uuid': 'ffffffff-ffff-ffff-ffff-ffffffffffff'})
+    pairs = [[propagation_params, OpmParams({
+        'epoch': '2017-10-04T00:00:00Z',
+        'state_vector': [130347560.13690618 + i, -74407287.6018632, -35247598.541470632,
+                         23.935241263310683, 27.146279819258538, 10.346605942591514],
+        'covariance': [1.0] * 21})] for i in range(batches_per_post)]
+
+    # Warm up the connection so that neither measurement includes setting it up.
+    post_streamed(rest, pairs[:1])
+    unstreamed = measure(post_unstreamed, rest, pairs)
+    streamed = measure(post_streamed, rest, pairs)
+    rest.close()
+    server.terminate()
+
+    print("%s OPMs per POST: peak %.2f MB built up front, %.2f MB streamed" % (
+        batches_per_post, unstreamed / 1e6, streamed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
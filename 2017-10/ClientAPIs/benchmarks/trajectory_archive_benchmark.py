@@ -0,0 +1,71 @@
+"""
+    trajectory_archive_benchmark.py
+
+    Writes a trajectory archive for a large run, then measures how long reopening it
+    and reading trajectories back takes, against parsing the ephemeris text again.
+
+    Usage: python trajectory_archive_benchmark.py [num_batches] [ephemeris_points]
+"""
+
+# This is janky. Why do we have to do this?
+import sys
+sys.path.append('..')
+
+from adam import TrajectoryArchive
+from adam import TrajectoryArchiveWriter
+from adam.batch import PropagationResults
+from adam.batch import StateSummary
+from adam.stand_in_server import make_stk_ephemeris
+
+import os
+import shutil
+import tempfile
+import time
+
+
+def main():
+    num_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    stk_ephemeris = make_stk_ephemeris(points)
+    summary = StateSummary({'uuid': 'ffffffff-ffff-ffff-ffff-ffffffffffff',
+                            'calc_state': 'COMPLETED'})
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'run.trj')
+    try:
+        start = time.perf_counter()
+        with TrajectoryArchiveWriter(path) as writer:
+            for i in range(num_batches):
+                results = PropagationResults([{'part_index': 1, 'calc_state': 'COMPLETED',
+                                               'stk_ephemeris': stk_ephemeris}])
+                writer.add(i, summary, results, key='%064x' % i)
+        write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        archive = TrajectoryArchive(path)
+        reopen = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(num_batches):
+            archive.get_part_states(i, 0)
+        slicing = time.perf_counter() - start
+
+        sample = min(num_batches, 10000)
+        start = time.perf_counter()
+        for i in range(sample):
+            PropagationResults([{'part_index': 1, 'calc_state': 'COMPLETED',
+                                 'stk_ephemeris': stk_ephemeris}]).get_parts()[0] \
+                .get_ephemeris_array()
+        parsing = (time.perf_counter() - start) * num_batches / sample
+
+        print("%s batches of %s states (%.0f MB): written in %.1fs, reopened in %.0f ms, "
+              "every part sliced in %.2fs; parsing the text again takes ~%.1fs" % (
+                  num_batches, points, os.path.getsize(path) / 1e6, write, reopen * 1e3,
+                  slicing, parsing))
+        archive.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()